@@ -0,0 +1,143 @@
+#!/usr/bin/env python3
+"""
+依赖层级计算的基准测试
+在包含数百个sub_question的合成item上，对比原递归实现与拓扑排序实现的耗时
+
+用法: python benchmarks/bench_dependency_levels.py [--sizes 100 200 400 800] [--output result.json]
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import random
+import signal
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'src_code'))
+
+from process_evaluation import collect_questions_by_level
+
+
+def make_item(num_questions, shape, seed=0):
+    """生成合成item
+
+    chain:  每个问题依赖前一个问题（深依赖）
+    wide:   每个问题依赖前面最多8个问题（宽依赖）
+    random: 每个问题随机依赖前面0~4个问题
+    """
+    rng = random.Random(seed)
+    sub_questions = []
+    for point_id in range(num_questions):
+        if point_id == 0:
+            dep = []
+        elif shape == "chain":
+            dep = [point_id - 1]
+        elif shape == "wide":
+            dep = list(range(max(0, point_id - 8), point_id))
+        else:
+            dep = rng.sample(range(point_id), min(point_id, rng.randint(0, 4)))
+        sub_questions.append({"point_id": point_id, "question": f"q{point_id}", "rule": None, "dep": dep})
+    return {"question": "synthetic", "sub_questions": sub_questions}
+
+
+def legacy_get_dependency_level(questions_dict, sub_q):
+    """原实现：无记忆化递归，每个依赖id都扫描整个item"""
+    if not sub_q["dep"]:
+        return 0
+    max_dep_level = 0
+    for dep_id in sub_q["dep"]:
+        for q in questions_dict[id(sub_q["_item"])]:
+            if q["point_id"] == dep_id:
+                max_dep_level = max(max_dep_level, legacy_get_dependency_level(questions_dict, q))
+    return max_dep_level + 1
+
+
+def legacy_collect(items):
+    questions_dict = {id(item): item["sub_questions"] for item in items}
+    levels = {}
+    for item in items:
+        for sub_q in item["sub_questions"]:
+            sub_q["_item"] = item
+            levels[id(sub_q)] = legacy_get_dependency_level(questions_dict, sub_q)
+    return levels
+
+
+class LegacyTimeout(Exception):
+    pass
+
+
+def _raise_timeout(signum, frame):
+    raise LegacyTimeout()
+
+
+def time_call(func, *args, timeout=None):
+    """计时调用；设置timeout时超时返回(None, None)。原实现在宽依赖图上是指数级的，必须能中断"""
+    if timeout:
+        signal.signal(signal.SIGALRM, _raise_timeout)
+        signal.setitimer(signal.ITIMER_REAL, timeout)
+    start = time.perf_counter()
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            result = func(*args)
+    except LegacyTimeout:
+        return None, None
+    finally:
+        if timeout:
+            signal.setitimer(signal.ITIMER_REAL, 0)
+    return time.perf_counter() - start, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description='依赖层级计算基准测试')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[100, 200, 400, 800], help='每个item的sub_question数量')
+    parser.add_argument('--shapes', nargs='+', default=['chain', 'wide', 'random'], help='依赖图形状')
+    parser.add_argument('--items', type=int, default=10, help='每组测试的item数量')
+    parser.add_argument('--legacy_limit', type=float, default=10.0, help='原实现单组测试的超时秒数，超时后不再测更大的规模')
+    parser.add_argument('--output', help='把结果写入JSON文件')
+    args = parser.parse_args()
+
+    # 原实现在深依赖链上递归深度等于链长
+    sys.setrecursionlimit(max(sys.getrecursionlimit(), max(args.sizes) * 4))
+
+    results = []
+    print(f"{'shape':<8}{'questions':>10}{'topological (s)':>18}{'legacy (s)':>14}{'speedup':>10}")
+    for shape in args.shapes:
+        legacy_enabled = True
+        for size in args.sizes:
+            items = [make_item(size, shape, seed) for seed in range(args.items)]
+            new_time, by_level = time_call(collect_questions_by_level, items)
+
+            legacy_time = None
+            legacy_str = "skipped"
+            if legacy_enabled:
+                legacy_time, legacy_levels = time_call(legacy_collect, items, timeout=args.legacy_limit)
+                if legacy_time is None:
+                    # 超时：更大的规模只会更慢，不再测试
+                    legacy_enabled = False
+                    legacy_str = f">{args.legacy_limit:g}"
+                else:
+                    new_levels = {id(q): level for level, qs in by_level.items() for q in qs}
+                    assert new_levels == legacy_levels, f"level mismatch on {shape}/{size}"
+                    legacy_str = f"{legacy_time:.4f}"
+
+            speedup = f"{legacy_time / new_time:.1f}x" if legacy_time is not None else "-"
+            print(f"{shape:<8}{size:>10}{new_time:>18.4f}{legacy_str:>14}{speedup:>10}")
+            results.append({
+                "shape": shape,
+                "questions_per_item": size,
+                "items": args.items,
+                "topological_seconds": new_time,
+                "legacy_seconds": legacy_time
+            })
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, ensure_ascii=False, indent=4)
+        print(f"💾 Results saved to: {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,298 @@
+#!/usr/bin/env python3
+"""
+端到端吞吐量基准测试
+启动本地模拟模型服务（src_code/mock_model_server.py），用 input_data/*/raw_input 中的数据集跑完整的评估流程，
+统计每秒处理的item数、各阶段耗时（收集响应、提取、规则评估、裁判模型、统计）和峰值内存。
+
+每个数据集在独立的子进程中运行，峰值内存互不影响。
+规则评估在调度线程中执行，其耗时按调用累计；裁判模型阶段为评估阶段总耗时减去规则评估耗时。
+
+用法: python benchmarks/bench_pipeline.py [--datasets chinese english] [--rounds 2] [--latency fixed:0.05]
+                                          [--output result.json] [--baseline old_result.json]
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import multiprocessing
+import os
+import platform
+import queue
+import resource
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+import requests
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+MOCK_SERVER = os.path.join(ROOT_DIR, 'src_code', 'mock_model_server.py')
+STAGES = ("response", "extraction", "rule_eval", "judge", "stats")
+# 等待子进程结果时检查其是否存活的间隔（秒）
+RESULT_POLL_SECONDS = 1
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def start_mock_server(port, args):
+    """启动模拟模型服务，等待其可以响应请求"""
+    command = [
+        sys.executable, MOCK_SERVER, '--port', str(port),
+        '--latency', args.latency,
+        '--per_prompt_latency', str(args.per_prompt_latency),
+        '--error_rate', str(args.error_rate),
+        '--partial_rate', str(args.partial_rate),
+        '--seed', str(args.seed)
+    ]
+    for path in args.replay:
+        command += ['--replay', path]
+    process = subprocess.Popen(command, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    for _ in range(100):
+        try:
+            requests.get(f"http://127.0.0.1:{port}/stats", timeout=1)
+            return process
+        except requests.RequestException:
+            time.sleep(0.1)
+    process.kill()
+    raise Exception("Mock model server did not start")
+
+
+def mock_server_stats(port):
+    return requests.get(f"http://127.0.0.1:{port}/stats", timeout=5).json()
+
+
+def load_dataset(dataset):
+    """通过数据集索引加载 input_data/<dataset>_data/raw_input 下的所有item（带item_id）"""
+    from dataset import DatasetIndex
+
+    data_dir = os.path.join(ROOT_DIR, 'input_data', f'{dataset}_data', 'raw_input')
+    with contextlib.redirect_stdout(io.StringIO()):
+        data = DatasetIndex(data_dir).load()
+    for item in data:
+        item["og_question"] = item["question"]
+    return data
+
+
+def wait_for_result(worker, result_queue):
+    """等待子进程放入结果；子进程没有给出结果就退出时（导入失败、内存不足被终止、模拟服务出错等）返回None"""
+    while True:
+        try:
+            return result_queue.get(timeout=RESULT_POLL_SECONDS)
+        except queue.Empty:
+            if worker.is_alive():
+                continue
+        # 子进程退出前放入的结果可能还没有从管道中读出
+        try:
+            return result_queue.get(timeout=RESULT_POLL_SECONDS)
+        except queue.Empty:
+            return None
+
+
+def run_dataset(dataset, base_url, args, result_queue):
+    """在子进程中跑完一个数据集的所有轮次，把结果放入result_queue"""
+    sys.path.insert(0, ROOT_DIR)
+    from run import process_in_batches, get_language_modules, iferror, fix_json_data
+    from process_corresponding_parts import extract_content
+    from process_evaluation import process_all_items, plan_incremental
+    from multi_round_template_added import multi_round_template_added
+    from final_stats import save_stats
+    from result_writer import ResultWriter
+    from dataset import item_key
+    from LLM_APIs.qwen_api import set_qwen_url
+    from LLM_APIs.qwen_coder_api import set_qwen_coder_url
+    from LLM_APIs.tested_model_api import set_tested_model_url
+    from LLM_APIs.client import close_all_clients
+
+    set_qwen_url(f"{base_url}/qwen")
+    set_qwen_coder_url(f"{base_url}/qwen_coder")
+    set_tested_model_url(f"{base_url}/tested_model")
+
+    rule_based_evaluate = get_language_modules(dataset)
+    rule_seconds = [0.0]
+
+    def timed_rule_based_evaluate(*rule_args):
+        start = time.perf_counter()
+        try:
+            return rule_based_evaluate(*rule_args)
+        finally:
+            rule_seconds[0] += time.perf_counter() - start
+
+    all_data = load_dataset(dataset)
+    positions = {item_key(item): index for index, item in enumerate(all_data)}
+    stage_seconds = {stage: 0.0 for stage in STAGES}
+    rounds = []
+    output = io.StringIO()
+    bench_start = time.perf_counter()
+
+    with tempfile.TemporaryDirectory() as output_dir, \
+            contextlib.redirect_stdout(sys.stdout if args.verbose else output):
+        for round_num in range(1, args.rounds + 1):
+            if round_num == 1:
+                current_data = all_data
+            else:
+                current_data = [item for item in all_data if iferror(item)]
+                if not current_data:
+                    break
+                current_data = fix_json_data(multi_round_template_added(current_data))
+                if args.incremental != 'off':
+                    plan_incremental(current_data, args.incremental)
+
+            round_stages = {}
+            round_start = time.perf_counter()
+            writer = ResultWriter(output_dir, round_num, positions, current_data)
+
+            start = time.perf_counter()
+            process_in_batches(current_data, args.batch_size, args.max_inflight)
+            round_stages["response"] = time.perf_counter() - start
+
+            start = time.perf_counter()
+            extract_content(current_data, args.batch_size)
+            round_stages["extraction"] = time.perf_counter() - start
+
+            rule_seconds[0] = 0.0
+            start = time.perf_counter()
+            process_all_items(
+                current_data, args.batch_size, timed_rule_based_evaluate,
+                scheduler=args.scheduler, max_inflight=args.judge_inflight
+            )
+            writer.write(current_data)
+            evaluation_seconds = time.perf_counter() - start
+            round_stages["rule_eval"] = rule_seconds[0]
+            round_stages["judge"] = evaluation_seconds - rule_seconds[0]
+
+            # 与run.py一致：按item_id合并本轮结果，结束结果文件后根据内存中的结果计算统计
+            start = time.perf_counter()
+            for item in current_data:
+                all_data[positions[item_key(item)]] = item
+            writer.finish()
+            stats = save_stats(all_data, round_num, output_dir, dataset)
+            round_stages["stats"] = time.perf_counter() - start
+
+            for stage, seconds in round_stages.items():
+                stage_seconds[stage] += seconds
+            rounds.append({
+                "round": round_num,
+                "items": len(current_data),
+                "sub_questions": sum(len(item["sub_questions"]) for item in current_data),
+                "seconds": time.perf_counter() - round_start,
+                "stages": round_stages,
+                "meeseeks_score": (stats or {}).get("meeseeks_score")
+            })
+
+    close_all_clients()
+    total_seconds = time.perf_counter() - bench_start
+    processed_items = sum(round_info["items"] for round_info in rounds)
+    result_queue.put({
+        "dataset": dataset,
+        "items": len(all_data),
+        "processed_items": processed_items,
+        "seconds": total_seconds,
+        "items_per_second": processed_items / total_seconds if total_seconds else 0.0,
+        "stages": stage_seconds,
+        # Linux上ru_maxrss的单位为KB
+        "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        "rounds": rounds
+    })
+
+
+def compare_with_baseline(results, baseline_path, tolerance):
+    """与之前的结果对比，items/sec下降或阶段耗时增加超过tolerance时报告回归，返回是否有回归"""
+    with open(baseline_path, "r", encoding="utf-8") as f:
+        baseline = {entry["dataset"]: entry for entry in json.load(f)["results"]}
+    regressed = False
+    for result in results:
+        old = baseline.get(result["dataset"])
+        if old is None:
+            continue
+        if result["items_per_second"] < old["items_per_second"] * (1 - tolerance):
+            regressed = True
+            print(f"⚠️  {result['dataset']}: items/sec {old['items_per_second']:.2f} → {result['items_per_second']:.2f}")
+        for stage in STAGES:
+            before, after = old["stages"].get(stage, 0.0), result["stages"][stage]
+            # 忽略绝对耗时很小的阶段，避免计时抖动造成误报
+            if after > before * (1 + tolerance) and after - before > 0.05:
+                regressed = True
+                print(f"⚠️  {result['dataset']}: {stage} {before:.3f}s → {after:.3f}s")
+    if not regressed:
+        print(f"✅ No regression against {baseline_path} (tolerance {tolerance:.0%})")
+    return regressed
+
+
+def main():
+    parser = argparse.ArgumentParser(description='端到端吞吐量基准测试')
+    parser.add_argument('--datasets', nargs='+', choices=['chinese', 'english'], default=['chinese', 'english'])
+    parser.add_argument('--rounds', type=int, default=2, help='评估轮数')
+    parser.add_argument('--batch_size', type=int, default=100, help='批处理大小')
+    parser.add_argument('--max_inflight', type=int, default=1, help='同时在途的被测模型批次数')
+    parser.add_argument('--scheduler', choices=['dag', 'level'], default='dag', help='评估调度方式')
+    parser.add_argument('--judge_inflight', type=int, default=4, help='dag调度下同时在途的裁判模型批次数')
+    parser.add_argument('--incremental', choices=['off', 'judge', 'all'], default='off',
+                        help='第二轮起沿用上一轮已通过的结果（与run.py的--incremental相同）')
+    parser.add_argument('--latency', default='fixed:0', help='模拟服务每个请求的延迟分布，格式见mock_model_server.py')
+    parser.add_argument('--per_prompt_latency', type=float, default=0.0, help='模拟服务每个prompt额外增加的延迟（秒）')
+    parser.add_argument('--error_rate', type=float, default=0.0, help='模拟服务返回HTTP 503的概率')
+    parser.add_argument('--partial_rate', type=float, default=0.0, help='模拟服务单个completion出错的概率')
+    parser.add_argument('--replay', action='append', default=[], help='模拟服务回放的录制结果，可重复指定')
+    parser.add_argument('--seed', type=int, default=0, help='模拟服务的随机种子')
+    parser.add_argument('--verbose', action='store_true', help='显示评估流程自身的输出')
+    parser.add_argument('--output', help='把结果写入JSON文件')
+    parser.add_argument('--baseline', help='与之前保存的JSON结果对比，发现回归时以状态码1退出')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='判定回归的相对变化阈值')
+    args = parser.parse_args()
+
+    port = free_port()
+    server = start_mock_server(port, args)
+    base_url = f"http://127.0.0.1:{port}"
+    context = multiprocessing.get_context("spawn")
+    results = []
+    try:
+        for dataset in args.datasets:
+            before = mock_server_stats(port)
+            result_queue = context.Queue()
+            worker = context.Process(target=run_dataset, args=(dataset, base_url, args, result_queue))
+            worker.start()
+            result = wait_for_result(worker, result_queue)
+            worker.join()
+            if result is None:
+                print(f"❌ Benchmark worker for {dataset} exited with code {worker.exitcode} without a result")
+                sys.exit(1)
+            after = mock_server_stats(port)
+            result["model_requests"] = {
+                role: after[role]["requests"] - before[role]["requests"] for role in after
+            }
+            results.append(result)
+    finally:
+        server.terminate()
+        server.wait()
+
+    print(f"{'dataset':<10}{'items':>7}{'items/s':>10}" + "".join(f"{stage + ' (s)':>16}" for stage in STAGES)
+          + f"{'peak RSS (MB)':>16}")
+    for result in results:
+        print(f"{result['dataset']:<10}{result['items']:>7}{result['items_per_second']:>10.2f}"
+              + "".join(f"{result['stages'][stage]:>16.3f}" for stage in STAGES)
+              + f"{result['peak_rss_mb']:>16.1f}")
+
+    if args.output:
+        report = {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "config": {key: value for key, value in vars(args).items() if key not in ("output", "baseline", "verbose")},
+            "results": results
+        }
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=4)
+        print(f"💾 Results saved to: {args.output}")
+
+    if args.baseline and compare_with_baseline(results, args.baseline, args.tolerance):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
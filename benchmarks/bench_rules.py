@@ -0,0 +1,267 @@
+#!/usr/bin/env python3
+"""
+规则函数的微基准测试
+从数据集中取出真实的 (rule, corresponding_part) 组合，分别交给中文和英文的 rule_based_evaluate，
+在不同的输入规模下计时，按规则类别汇总，并标记耗时随输入规模超线性增长的规则。
+
+输入来源：
+- 默认只使用 input_data/*/raw_input 中的规则，输入为数据集问题文本切分出的句子
+- --results 指定评估结果（round_N.jsonl 或 round_N.json）时，优先使用其中真实的提取结果，不足规模的部分再用句子补齐
+- SCHEMA 规则按 item 的 json_schema 生成合法的JSON，最外层数组长度为输入规模
+
+用法: python benchmarks/bench_rules.py [--sizes 10 100 1000] [--results evaluation_results/round_1.jsonl]
+                                       [--families yayun word_freq] [--output result.json]
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import math
+import os
+import random
+import re
+import signal
+import sys
+import time
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT_DIR, 'src_code'))
+
+from process_rule_based_evaluate import rule_based_evaluate as rule_based_evaluate_chinese
+from process_rule_based_evaluate_eng import rule_based_evaluate as rule_based_evaluate_english
+from result_writer import load_results
+from dataset import load_dataset, item_key
+from rule_types import rule_type
+
+DISPATCHERS = {
+    "chinese": rule_based_evaluate_chinese,
+    "english": rule_based_evaluate_english
+}
+
+
+def load_items(language):
+    """通过数据集索引加载该语言的全部item（带item_id）"""
+    data_dir = os.path.join(ROOT_DIR, 'input_data', f'{language}_data', 'raw_input')
+    return load_dataset(data_dir)
+
+
+def sentence_pool(items):
+    """把数据集问题切分成句子，作为补齐输入规模用的真实文本"""
+    pool = set()
+    for item in items:
+        for sentence in re.split(r'[。！？；，\n.!?;,]', item["question"]):
+            sentence = sentence.strip()
+            if 2 <= len(sentence) <= 60:
+                pool.add(sentence)
+    return sorted(pool)
+
+
+def collect_pairs(items, results):
+    """收集 (rule, item, 真实提取结果) 组合，评估结果按item_id对应；没有评估结果时提取结果为空列表"""
+    extracted = {}
+    for item in results:
+        for part_name, part in (item.get("extraction_results") or {}).items():
+            if isinstance(part, list):
+                extracted[(item_key(item), part_name)] = [str(element) for element in part]
+
+    pairs = []
+    for item in items:
+        for sub_q in item["sub_questions"]:
+            if not sub_q.get("rule"):
+                continue
+            seed = extracted.get((item_key(item), sub_q.get("corresponding_part")), [])
+            pairs.append((sub_q["rule"], item, seed))
+    return pairs
+
+
+def instance_from_schema(schema, size, rng, pool):
+    """按json_schema生成一个合法的实例：最外层数组长度为size，内层数组固定为2个元素"""
+    if "enum" in schema:
+        return schema["enum"][0]
+    schema_type = schema.get("type")
+    if isinstance(schema_type, list):
+        schema_type = schema_type[0]
+    if schema_type == "object":
+        return {
+            name: instance_from_schema(field_schema, size, rng, pool)
+            for name, field_schema in schema.get("properties", {}).items()
+        }
+    if schema_type == "array":
+        item_schema = schema.get("items", {"type": "string"})
+        return [instance_from_schema(item_schema, 2, rng, pool) for _ in range(size)]
+    if schema_type == "integer":
+        return max(int(schema.get("minimum", 1)), 1)
+    if schema_type == "number":
+        return float(schema.get("minimum", 1))
+    if schema_type == "boolean":
+        return True
+    if schema_type == "null":
+        return None
+    return rng.choice(pool)
+
+
+def build_input(rule, item, seed, size, pool):
+    """构造输入规模为size的model_response"""
+    rng = random.Random(f"{rule}|{size}")
+    if rule.startswith("SCHEMA"):
+        if "json_schema" not in item:
+            return None
+        return json.dumps(instance_from_schema(item["json_schema"], size, rng, pool), ensure_ascii=False)
+    filler = rng.sample(pool, min(len(pool), max(0, size - len(seed))))
+    elements = (seed + filler)[:size]
+    # 数据不足时循环使用，保证输入达到指定规模
+    while elements and len(elements) < size:
+        elements = (elements + elements)[:size]
+    return elements
+
+
+class RuleTimeout(BaseException):
+    """继承BaseException：rule_based_evaluate会捕获所有Exception并返回评估失败"""
+
+
+def _raise_timeout(signum, frame):
+    raise RuleTimeout()
+
+
+def time_rule(evaluate, item, rule, model_response, repeat, limit):
+    """重复repeat次取最短耗时（单次超过0.5秒时不再重复）；单次超过limit秒时返回None"""
+    best = None
+    signal.signal(signal.SIGALRM, _raise_timeout)
+    for _ in range(repeat):
+        signal.setitimer(signal.ITIMER_REAL, limit)
+        start = time.perf_counter()
+        try:
+            evaluate(item, rule, model_response)
+        except RuleTimeout:
+            return None
+        finally:
+            signal.setitimer(signal.ITIMER_REAL, 0)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+        if elapsed > 0.5:
+            break
+    return best
+
+
+def growth_exponent(sizes, seconds):
+    """相邻两个规模之间耗时增长指数的最大值：1为线性，明显大于1为超线性
+
+    只统计较大规模下耗时超过1毫秒的区间，避免计时抖动造成误报；
+    有提前退出的规则在大规模下会变平，因此不能只看最后一个区间
+    """
+    points = [(size, value) for size, value in zip(sizes, seconds) if value]
+    exponents = [
+        math.log(large_time / small_time) / math.log(large_size / small_size)
+        for (small_size, small_time), (large_size, large_time) in zip(points, points[1:])
+        if large_time > 0.001
+    ]
+    return max(exponents) if exponents else None
+
+
+def main():
+    parser = argparse.ArgumentParser(description='规则函数微基准测试')
+    parser.add_argument('--languages', nargs='+', choices=['chinese', 'english'], default=['chinese', 'english'])
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10, 100, 1000], help='输入规模（列表元素数/JSON数组长度）')
+    parser.add_argument('--results', action='append', default=[], help='评估结果文件（round_N.jsonl 或 round_N.json），提供真实的提取结果，可重复指定')
+    parser.add_argument('--families', nargs='+', help='只测试这些规则类别')
+    parser.add_argument('--max_pairs', type=int, default=10, help='每个规则类别最多测试的组合数')
+    parser.add_argument('--repeat', type=int, default=3, help='每个组合重复的次数，取最短耗时')
+    parser.add_argument('--limit', type=float, default=5.0, help='单次调用的超时秒数，超时后该类别不再测更大的规模')
+    parser.add_argument('--threshold', type=float, default=1.3, help='增长指数超过该值时标记为超线性')
+    parser.add_argument('--output', help='把结果写入JSON文件')
+    args = parser.parse_args()
+
+    sizes = sorted(args.sizes)
+    results = []
+    for path in args.results:
+        results.extend(load_results(path))
+
+    # 先加载数据集，索引的输出不会插进结果表格中
+    items_by_language = {language: load_items(language) for language in args.languages}
+
+    report = []
+    print(f"{'dispatcher':<11}{'family':<26}{'pairs':>6}" + "".join(f"{f'n={size} (ms)':>14}" for size in sizes)
+          + f"{'exponent':>10}")
+    for language in args.languages:
+        evaluate = DISPATCHERS[language]
+        items = items_by_language[language]
+        pool = sentence_pool(items)
+
+        families = {}
+        for rule, item, seed in collect_pairs(items, results):
+            family = rule_type(rule)
+            if args.families and family not in args.families:
+                continue
+            families.setdefault(family, []).append((rule, item, seed))
+
+        for family, pairs in sorted(families.items()):
+            pairs = random.Random(family).sample(pairs, min(len(pairs), args.max_pairs))
+            # 每个规模下该类别所有组合的总耗时；任一组合超时则不再测更大的规模
+            totals = []
+            slowest = None
+            timeout_exponent = None
+            previous = {}
+            for size in sizes:
+                total = 0.0
+                for index, (rule, item, seed) in enumerate(pairs):
+                    model_response = build_input(rule, item, seed, size, pool)
+                    if model_response is None:
+                        continue
+                    with contextlib.redirect_stdout(io.StringIO()):
+                        if size == sizes[0]:
+                            # 预热：第一次调用会加载词典等资源，不计入耗时
+                            time_rule(evaluate, item, rule, model_response, 1, args.limit)
+                        elapsed = time_rule(evaluate, item, rule, model_response, args.repeat, args.limit)
+                    if elapsed is None:
+                        # 超时说明耗时至少为limit，据此估计该组合增长指数的下限
+                        if index in previous:
+                            last_size, last_time = previous[index]
+                            timeout_exponent = math.log(args.limit / last_time) / math.log(size / last_size)
+                        slowest = {"rule": rule, "size": size, "seconds": None}
+                        break
+                    previous[index] = (size, elapsed)
+                    total += elapsed
+                    if slowest is None or elapsed > slowest["seconds"]:
+                        slowest = {"rule": rule, "size": size, "seconds": elapsed}
+                if slowest is not None and slowest["seconds"] is None:
+                    break
+                totals.append(total)
+
+            timed_out = len(totals) < len(sizes)
+            exponent = growth_exponent(sizes, totals)
+            if timeout_exponent is not None:
+                exponent = timeout_exponent if exponent is None else max(exponent, timeout_exponent)
+            # 在最小规模就超时的规则无法估计增长指数，同样标记
+            superlinear = (exponent is not None and exponent > args.threshold) or (timed_out and not totals)
+            cells = [f"{total * 1000:>14.2f}" for total in totals] + [f"{'timeout':>14}"] * (len(sizes) - len(totals))
+            exponent_str = f"{'≥' if timeout_exponent is not None else ''}{exponent:.2f}" if exponent is not None else "-"
+            print(f"{language:<11}{family:<26}{len(pairs):>6}" + "".join(cells) + f"{exponent_str:>10}"
+                  + ("  ⚠️ super-linear" if superlinear else ""))
+            report.append({
+                "dispatcher": language,
+                "family": family,
+                "pairs": len(pairs),
+                "sizes": sizes[:len(totals)],
+                "total_seconds": totals,
+                "exponent": exponent,
+                "timed_out": timed_out,
+                "superlinear": superlinear,
+                "slowest": slowest
+            })
+
+    flagged = [entry for entry in report if entry["superlinear"]]
+    if flagged:
+        print(f"⚠️  {len(flagged)} rule families grow super-linearly (exponent > {args.threshold}): "
+              + ", ".join(f"{entry['dispatcher']}/{entry['family']}" for entry in flagged))
+    else:
+        print(f"✅ No rule family grows super-linearly (exponent > {args.threshold})")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=4)
+        print(f"💾 Results saved to: {args.output}")
+
+
+if __name__ == "__main__":
+    main()
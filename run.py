@@ -77,20 +77,37 @@ if __name__ == "__main__":
 import json
 import time
 import argparse
+import asyncio
 import requests
 import sys
 import os
+from concurrent.futures import ThreadPoolExecutor
 
 # 添加src_code目录到Python路径
 sys.path.insert(0, os.path.join(os.path.dirname(__file__), 'src_code'))
 
 from process_corresponding_parts import extract_content
-from process_evaluation import process_all_items
+from process_evaluation import process_all_items, plan_incremental
 from multi_round_template_added import multi_round_template_added
 from LLM_APIs.qwen_api import set_qwen_url
 from LLM_APIs.qwen_coder_api import set_qwen_coder_url
 from LLM_APIs.tested_model_api import set_tested_model_url, call_tested_model
-from final_stats import calculate_and_save_stats
+from LLM_APIs.client import set_pool_config, close_all_clients, get_client
+from LLM_APIs.endpoints import parse_urls
+from LLM_APIs.batching import set_batching_config
+from LLM_APIs.retry import set_retry_config, salvaged_texts
+from LLM_APIs.rate_limit import parse_rate_limit, set_rate_limit
+from LLM_APIs.async_client import set_async_concurrency
+from LLM_APIs.response_cache import enable_response_cache, get_response_cache
+from async_pipeline import run_round_async
+from streaming_pipeline import run_round_pipelined
+from checkpoint import CheckpointStore
+from extraction_sandbox import enable_extraction_sandbox, shutdown_extraction_sandbox
+from final_stats import save_stats
+from result_writer import ResultWriter
+from dataset import load_dataset, item_key
+from tracing import span, index_items, enable_tracing, shutdown_tracing
+from metrics import enable_metrics, shutdown_metrics
 
 
 def get_language_modules(language):
@@ -155,9 +172,10 @@ def test_all_apis(qwen_url, qwen_coder_url, tested_model_url):
     print("=" * 50)
 
     results = {}
-    results['qwen'] = test_single_api(qwen_url, "Qwen API")
-    results['qwen_coder'] = test_single_api(qwen_coder_url, "Qwen Coder API")
-    results['tested_model'] = test_single_api(tested_model_url, "Tested Model API")
+    # 每个角色可以有多个副本，逐个测试
+    results['qwen'] = all([test_single_api(url, "Qwen API") for url in parse_urls(qwen_url)])
+    results['qwen_coder'] = all([test_single_api(url, "Qwen Coder API") for url in parse_urls(qwen_coder_url)])
+    results['tested_model'] = all([test_single_api(url, "Tested Model API") for url in parse_urls(tested_model_url)])
 
     print("=" * 50)
 
@@ -181,28 +199,55 @@ def test_all_apis(qwen_url, qwen_coder_url, tested_model_url):
         return user_input in ['y', 'yes']
 
 
-def process_in_batches(data, batch_size=100):
-    """批量处理数据，调用被测模型获取响应"""
-    total_items = len(data)
-    for batch_start in range(0, total_items, batch_size):
-        batch_end = min(batch_start + batch_size, total_items)
-        current_batch = data[batch_start:batch_end]
+def process_batch(data, batch_start, batch_end, total_items, on_batch_done=None):
+    """处理单个批次：调用被测模型并把响应写回对应的item；完成后用成功的items回调on_batch_done"""
+    current_batch = data[batch_start:batch_end]
 
-        # Print processing progress
-        print(f"📊 Processing items {batch_start}-{batch_end-1} out of {total_items} total items...")
+    # Print processing progress
+    print(f"📊 Processing items {batch_start}-{batch_end-1} out of {total_items} total items...")
 
-        try:
-            # Batch get questions and call model
-            batch_questions = [item["question"] for item in current_batch]
-            batch_responses = call_tested_model(batch_questions)  # 使用被测模型
+    try:
+        # Batch get questions and call model
+        batch_questions = [item["question"] for item in current_batch]
+        batch_responses = call_tested_model(batch_questions)  # 使用被测模型
+    except Exception as e:
+        print(f"❌ Error occurred while processing batch {batch_start}-{batch_end-1}: {str(e)}")
+        # 客户端已按重试策略重试过：保留成功的响应，失败的item写入空响应，保证后续阶段都有model_response
+        batch_responses = salvaged_texts(e, len(current_batch))
 
-            # Assign responses back to data items
-            for item, response in zip(current_batch, batch_responses):
-                item["model_response"] = response
+    # Assign responses back to data items
+    for item, response in zip(current_batch, batch_responses):
+        item["model_response"] = response if response is not None else ""
 
-        except Exception as e:
-            print(f"❌ Error occurred while processing batch {batch_start}-{batch_end-1}: {str(e)}")
-            # Add retry logic or error handling here
+    if on_batch_done is not None:
+        # 只持久化成功的响应，断点续跑时失败的item会重新请求
+        on_batch_done([item for item, response in zip(current_batch, batch_responses) if response is not None])
+
+
+def process_in_batches(data, batch_size=100, max_inflight=1, on_batch_done=None):
+    """批量处理数据，调用被测模型获取响应
+
+    max_inflight > 1 时同时保持多个批次在途，每个批次只写回自己的item，
+    因此结果与顺序模式一致
+    """
+    total_items = len(data)
+    batch_ranges = [
+        (batch_start, min(batch_start + batch_size, total_items))
+        for batch_start in range(0, total_items, batch_size)
+    ]
+
+    if max_inflight <= 1:
+        for batch_start, batch_end in batch_ranges:
+            process_batch(data, batch_start, batch_end, total_items, on_batch_done)
+        return
+
+    with ThreadPoolExecutor(max_workers=max_inflight) as executor:
+        futures = [
+            executor.submit(process_batch, data, batch_start, batch_end, total_items, on_batch_done)
+            for batch_start, batch_end in batch_ranges
+        ]
+        for future in futures:
+            future.result()
 
 
 def iferror(item):
@@ -213,26 +258,201 @@ def iferror(item):
     return False
 
 
+def run_stage(items, stage_func, checkpoint, round_num, stage, chunk_size, on_chunk_done=None, skip=()):
+    """执行一个评估阶段
+
+    启用检查点时先恢复已持久化的item（skip中的item除外），其余item按chunk_size分块执行，每块完成后立即持久化；
+    stage为None时该阶段不写检查点（评估阶段的结果由on_chunk_done流式写入round_N.jsonl），只分块执行；
+    on_chunk_done不为空时每块（未启用检查点时为全部item）完成后用这些item回调
+    """
+    if checkpoint is None:
+        items = stage_func(items)
+        if on_chunk_done is not None:
+            on_chunk_done(items)
+        return items
+
+    pending = items if stage is None else checkpoint.restore(items, round_num, stage, skip)
+    for chunk_start in range(0, len(pending), chunk_size):
+        chunk = pending[chunk_start:chunk_start + chunk_size]
+        stage_func(chunk)
+        if stage is not None:
+            checkpoint.record(chunk, round_num, stage)
+        if on_chunk_done is not None:
+            on_chunk_done(chunk)
+    return items
+
+
+def run_round(current_data, args, rule_based_evaluate_func, round_num, checkpoint=None, on_items_done=None):
+    """顺序执行一轮评估：收集响应 → 提取 → 评估，返回(结果, 评估耗时)
+
+    on_items_done不为空时，每批item评估完成后立即用这批item回调（例如流式写入结果）
+    """
+    # 处理model_response收集；重新获取响应的item也要重新提取
+    print("📝 Getting model responses for evaluation...")
+    pending = current_data
+    on_batch_done = None
+    if checkpoint is not None:
+        pending = checkpoint.restore(current_data, round_num, "response")
+        on_batch_done = lambda batch: checkpoint.record(batch, round_num, "response")
+    with span("response", "stage", round=round_num, items=len(pending)):
+        process_in_batches(pending, args.batch_size, args.max_inflight, on_batch_done)
+
+    # 开始评估
+    og_start_time = time.time()
+    print(f"🔄 Round {round_num} Processing Started")
+
+    # 步骤1：提取对应部分
+    start_time = time.time()
+    print("🔍 Step 1: Extracting corresponding parts from all responses...")
+    with span("extraction", "stage", round=round_num, items=len(current_data)):
+        current_data = run_stage(
+            current_data,
+            lambda items: extract_content(items, args.batch_size),
+            checkpoint, round_num, "extraction", args.checkpoint_chunk, skip=pending
+        )
+    print("✅ Corresponding parts extraction completed successfully")
+    end_time = time.time()
+    print(f"⏱️  Time taken: {end_time - start_time:.2f} seconds")
+    print()
+
+    # 步骤2：处理和评估
+    start_time = time.time()
+    print("🔍 Step 2: Processing and evaluating all items...")
+    with span("evaluation", "stage", round=round_num, items=len(current_data)):
+        current_data = run_stage(
+            current_data,
+            lambda items: process_all_items(
+                items, args.batch_size, rule_based_evaluate_func,
+                scheduler=args.scheduler, max_inflight=args.judge_inflight
+            ),
+            checkpoint, round_num, None, args.checkpoint_chunk, on_items_done
+        )
+    print("✅ Item processing and evaluation completed successfully")
+    end_time = time.time()
+    print(f"⏱️  Time taken: {end_time - start_time:.2f} seconds")
+    print()
+
+    return current_data, end_time - og_start_time
+
+
+def save_round_results(writer, all_data, args):
+    """结束本轮的增量结果文件并写出索引，再把内存中的完整结果all_data写成round_N.json（指定--no_json_output时不写）"""
+    manifest = writer.finish()
+    print(f"💾 Results saved to: {writer.path} ({manifest['changed']}/{manifest['items']} items changed, "
+          f"{manifest['streamed']} streamed during the round)")
+    if not args.no_json_output:
+        output_file = os.path.join(args.output_dir, f"round_{writer.round_num}.json")
+        with open(output_file, "w", encoding="utf-8") as f:
+            json.dump(all_data, f, ensure_ascii=False, indent=4, default=str)
+        print(f"💾 Complete results saved to: {output_file}")
+
+
 def main():
     """主函数"""
     parser = argparse.ArgumentParser(description='OG_meeseeks评估系统')
-    parser.add_argument('--qwen_url', required=True, help='Qwen API的URL')
-    parser.add_argument('--qwen_coder_url', required=True, help='Qwen Coder API的URL')
-    parser.add_argument('--tested_model_url', required=True, help='被测模型API的URL')
+    parser.add_argument('--qwen_url', required=True, help='Qwen API的URL，多个副本用逗号分隔')
+    parser.add_argument('--qwen_coder_url', required=True, help='Qwen Coder API的URL，多个副本用逗号分隔')
+    parser.add_argument('--tested_model_url', required=True, help='被测模型API的URL，多个副本用逗号分隔')
     parser.add_argument('--batch_size', type=int, default=100, help='批处理大小')
     parser.add_argument('--rounds', type=int, default=2, help='评估轮数')
     parser.add_argument('--output_dir', default='evaluation_results', help='输出目录')
+    parser.add_argument('--pool_size', type=int, default=16, help='每个模型endpoint的HTTP连接池大小')
+    parser.add_argument('--connect_retries', type=int, default=3, help='建立连接失败时的重试次数')
+    parser.add_argument('--no_keep_alive', action='store_true', help='禁用HTTP keep-alive，每次请求新建连接')
+    parser.add_argument('--max_inflight', type=int, default=1, help='同时在途的被测模型批次数（1为顺序模式）')
+    parser.add_argument('--async_mode', action='store_true', help='使用asyncio流水线，每个prompt单独并发发送')
+    parser.add_argument('--concurrency', type=int, default=128, help='异步模式下每个endpoint的最大并发请求数')
+    parser.add_argument('--max_attempts', type=int, default=4, help='每批请求最多发送的次数（含第一次）')
+    parser.add_argument('--retry_backoff', type=float, default=1.0, help='第一次重试前的等待时间（秒），之后按指数增长')
+    parser.add_argument('--retry_backoff_max', type=float, default=30.0, help='重试等待时间上限（秒）')
+    parser.add_argument('--retry_statuses', default='408,429,500,502,503,504', help='可重试的HTTP状态码，逗号分隔')
+    parser.add_argument('--rate_limit', action='append', default=[], metavar='ROLE:RPS[:TPS]',
+                        help='模型角色(qwen/qwen_coder/tested_model)的限速：每秒请求数和每秒prompt token数，可重复指定')
+    parser.add_argument('--adaptive_batching', action='store_true',
+                        help='按实测延迟和吞吐量为每个模型角色自动调整单次请求的批大小（不超过batch_size）')
+    parser.add_argument('--target_latency', type=float, default=60.0, help='自适应批大小下单次请求的目标延迟（秒）')
+    parser.add_argument('--max_batch_tokens', type=int, default=32768, help='自适应批大小下单次请求的估计token数上限')
+    parser.add_argument('--cache_dir', help='裁判模型和提取模型的磁盘响应缓存目录，不设置则不缓存')
+    parser.add_argument('--cache_max_mb', type=float, default=1024, help='响应缓存的最大大小（MB）')
+    parser.add_argument('--pipelined', action='store_true', help='流水线模式：响应、提取、评估三个阶段重叠执行')
+    parser.add_argument('--queue_size', type=int, default=None, help='流水线模式下阶段之间队列的容量（默认 2 * batch_size）')
+    parser.add_argument('--scheduler', choices=['dag', 'level'], default='dag',
+                        help='评估调度方式：dag 按每个问题自身依赖调度，level 按依赖层级逐层处理')
+    parser.add_argument('--judge_inflight', type=int, default=4, help='dag调度下同时在途的裁判模型批次数')
+    parser.add_argument('--sandbox_extraction', action='store_true', help='在受限的子进程池中执行模型生成的提取代码')
+    parser.add_argument('--sandbox_workers', type=int, default=4, help='提取代码沙箱的子进程数')
+    parser.add_argument('--sandbox_timeout', type=float, default=10, help='单个提取任务的超时时间（秒）')
+    parser.add_argument('--sandbox_cpu_seconds', type=int, default=5, help='单个提取任务的CPU时间上限（秒）')
+    parser.add_argument('--sandbox_memory_mb', type=int, default=1024, help='每个沙箱子进程的内存上限（MB）')
+    parser.add_argument('--resume', metavar='OUTPUT_DIR', help='从OUTPUT_DIR中的检查点继续之前中断的评估')
+    parser.add_argument('--no_checkpoint', action='store_true', help='不写入检查点')
+    parser.add_argument('--checkpoint_chunk', type=int, default=200, help='启用检查点时每多少个item持久化一次')
+    parser.add_argument('--incremental', choices=['off', 'judge', 'all'], default='off',
+                        help='第二轮起沿用上一轮已通过的sub_question结果，只重新提取和评估未通过的问题及依赖它们的问题：'
+                             'all沿用所有通过的结果，judge只沿用裁判模型的判定（规则评估在新回复上重新执行）')
+    parser.add_argument('--no_json_output', action='store_true', help='只写各轮的增量结果round_N.jsonl，不再写出合并后的完整round_N.json')
+    parser.add_argument('--trace', action='store_true', help='把各阶段的计时span写入output_dir/trace.jsonl')
+    parser.add_argument('--chrome_trace', action='store_true', help='同时导出Chrome trace格式的output_dir/trace.chrome.json（隐含--trace）')
+    parser.add_argument('--metrics_port', type=int, help='在本地该端口的/metrics上暴露Prometheus格式的运行指标')
+    parser.add_argument('--metrics_file', help='定期把Prometheus格式的运行指标写入该文件（textfile collector）')
+    parser.add_argument('--metrics_interval', type=float, default=15, help='指标文件的重写间隔（秒）')
 
     # 创建互斥组：language 和 data_path 只能选择一个
     data_group = parser.add_mutually_exclusive_group(required=True)
     data_group.add_argument('--language', choices=['chinese', 'english'],
                            help='选择语言数据集：chinese 或 english')
     data_group.add_argument('--data_path', help='自定义数据文件路径')
+    parser.add_argument('--files', nargs='+', help='只评估这些数据文件（文件名、通配符或方括号中的编号，例如 6.1）')
+    parser.add_argument('--category', nargs='+', help='只评估这些category的item（例如 SCHEMA general_single）')
+    parser.add_argument('--rule_prefix', '--rule-prefix', nargs='+', help='只评估含有这些前缀的规则的item（例如 word_freq non_）')
 
 
 
     args = parser.parse_args()
 
+    # 断点续跑时输出目录即检查点所在目录
+    if args.resume:
+        args.output_dir = args.resume
+
+    # 配置连接池，需在设置API URLs之前完成
+    # 连接池至少要容纳所有在途批次
+    set_pool_config(
+        pool_size=max(args.pool_size, args.max_inflight, args.judge_inflight),
+        keep_alive=not args.no_keep_alive,
+        max_retries=args.connect_retries
+    )
+
+    set_async_concurrency(args.concurrency)
+    for spec in args.rate_limit:
+        try:
+            role, requests_per_second, tokens_per_second = parse_rate_limit(spec)
+        except ValueError as e:
+            parser.error(f"--rate_limit {spec}: {e}")
+        if role not in ("qwen", "qwen_coder", "tested_model"):
+            parser.error(f"Unknown role in --rate_limit: {role}")
+        set_rate_limit(role, requests_per_second, tokens_per_second)
+    set_retry_config(
+        max_attempts=args.max_attempts,
+        backoff_base=args.retry_backoff,
+        backoff_max=args.retry_backoff_max,
+        retryable_statuses=tuple(int(status) for status in args.retry_statuses.split(",") if status.strip())
+    )
+    set_batching_config(
+        enabled=args.adaptive_batching,
+        max_size=args.batch_size,
+        target_latency=args.target_latency,
+        max_batch_tokens=args.max_batch_tokens
+    )
+    if args.cache_dir:
+        enable_response_cache(args.cache_dir, args.cache_max_mb)
+    if args.sandbox_extraction:
+        enable_extraction_sandbox(
+            workers=args.sandbox_workers,
+            timeout=args.sandbox_timeout,
+            cpu_seconds=args.sandbox_cpu_seconds,
+            memory_mb=args.sandbox_memory_mb
+        )
+
     # 设置API URLs
     set_qwen_url(args.qwen_url)
     set_qwen_coder_url(args.qwen_coder_url)
@@ -248,6 +468,20 @@ def main():
     # 创建输出目录
     os.makedirs(args.output_dir, exist_ok=True)
 
+    if args.trace or args.chrome_trace:
+        enable_tracing(
+            os.path.join(args.output_dir, "trace.jsonl"),
+            os.path.join(args.output_dir, "trace.chrome.json") if args.chrome_trace else None
+        )
+
+    if args.metrics_port is not None or args.metrics_file:
+        enable_metrics(port=args.metrics_port, textfile=args.metrics_file, interval=args.metrics_interval)
+
+    # 检查点：响应和提取阶段的结果追加写入output_dir/checkpoint.jsonl（评估结果从round_N.jsonl恢复）
+    checkpoint = None
+    if not args.no_checkpoint:
+        checkpoint = CheckpointStore(args.output_dir, resume=bool(args.resume))
+
     # 处理数据路径
     if args.language:
         # 根据语言参数确定数据目录
@@ -257,36 +491,17 @@ def main():
             data_dir = os.path.join(os.path.dirname(__file__), 'input_data', 'english_data', 'raw_input')
 
         print(f"📂 Loading {args.language} data from directory: {data_dir}")
-
-        # 获取目录中所有JSON文件
-        json_files = [f for f in os.listdir(data_dir) if f.endswith('.json')]
-        if not json_files:
-            print(f"❌ No JSON files found in {data_dir}")
-            return
-
-        print(f"📄 Found {len(json_files)} JSON files:")
-        for file in json_files:
-            print(f"   - {file}")
-
-        # 合并所有JSON文件的数据
-        current_data = []
-        for json_file in json_files:
-            file_path = os.path.join(data_dir, json_file)
-            try:
-                with open(file_path, "r", encoding="utf-8") as f:
-                    file_data = json.load(f)
-                    if isinstance(file_data, list):
-                        current_data.extend(file_data)
-                    else:
-                        current_data.append(file_data)
-                print(f"✅ Loaded {json_file}")
-            except Exception as e:
-                print(f"❌ Error loading {json_file}: {e}")
+        data_source = data_dir
     else:
         # 使用自定义数据路径
         print(f"📂 Loading data from: {args.data_path}")
-        with open(args.data_path, "r", encoding="utf-8") as f:
-            current_data = json.load(f)
+        data_source = args.data_path
+
+    # 通过索引只读取选中的item
+    current_data = load_dataset(data_source, args.files, args.category, args.rule_prefix)
+    if not current_data:
+        print(f"❌ No items found in {data_source}")
+        return
 
     # 保存原始问题
     for item in current_data:
@@ -299,12 +514,43 @@ def main():
     print(f"   - Tested Model URL: {args.tested_model_url}")
     print(f"   - Batch Size: {args.batch_size}")
     print(f"   - Rounds: {args.rounds}")
+    print(f"   - Pool Size: {args.pool_size} (keep-alive: {'off' if args.no_keep_alive else 'on'})")
+    print(f"   - Max In-flight Batches: {args.max_inflight}")
+    print(f"   - Scheduler: {args.scheduler} (judge in-flight batches: {args.judge_inflight})")
+    if args.async_mode:
+        print(f"   - Async Mode: on (concurrency per endpoint: {args.concurrency})")
+    elif args.pipelined:
+        print(f"   - Pipelined Mode: on (queue size: {args.queue_size or args.batch_size * 2})")
     if args.language:
         print(f"   - Language: {args.language}")
         print(f"   - Data Directory: {data_dir}")
     else:
         print(f"   - Data Path: {args.data_path}")
+    if args.files or args.category or args.rule_prefix:
+        print(f"   - Filters: files={args.files or 'all'}, category={args.category or 'all'}, "
+              f"rule prefix={args.rule_prefix or 'all'}")
     print(f"   - Output Directory: {args.output_dir}")
+    for spec in args.rate_limit:
+        print(f"   - Rate Limit: {spec}")
+    if args.adaptive_batching:
+        print(f"   - Adaptive Batching: on (target latency {args.target_latency}s, "
+              f"max {args.max_batch_tokens} tokens per request)")
+    if args.sandbox_extraction:
+        print(f"   - Extraction Sandbox: {args.sandbox_workers} workers "
+              f"(timeout {args.sandbox_timeout}s, CPU {args.sandbox_cpu_seconds}s, memory {args.sandbox_memory_mb} MB)")
+    if args.cache_dir:
+        print(f"   - Response Cache: {args.cache_dir} (max {args.cache_max_mb} MB)")
+    print(f"   - Checkpoint: {'off' if args.no_checkpoint else ('resume' if args.resume else 'on')}")
+    if args.incremental != 'off':
+        print(f"   - Incremental Re-evaluation: {args.incremental}")
+    print(f"   - Results: round_N.jsonl + round_N.manifest.json{'' if args.no_json_output else ' + round_N.json'}")
+    if args.trace or args.chrome_trace:
+        print(f"   - Tracing: {os.path.join(args.output_dir, 'trace.jsonl')}"
+              f"{' (+ Chrome trace)' if args.chrome_trace else ''}")
+    if args.metrics_port is not None:
+        print(f"   - Metrics: http://127.0.0.1:{args.metrics_port}/metrics")
+    if args.metrics_file:
+        print(f"   - Metrics File: {args.metrics_file} (every {args.metrics_interval}s)")
     print("=" * 80)
 
     # 根据语言参数获取相应的评估函数
@@ -313,6 +559,8 @@ def main():
 
     # 多轮评估
     all_data = current_data.copy()  # 保存所有数据的副本
+    # item_id → 在all_data中的位置，加载后只建立一次
+    positions = {item_key(item): index for index, item in enumerate(all_data)}
 
     for round_num in range(args.rounds):
         print(f"🚀 Starting Round {round_num + 1} Evaluation")
@@ -325,16 +573,17 @@ def main():
             if not items_to_reevaluate:
                 print("✅ No items to re-evaluate in this round. All evaluations passed!")
                 # 仍然保存完整结果
-                output_file = os.path.join(args.output_dir, f"round_{round_num + 1}.json")
-                with open(output_file, "w", encoding="utf-8") as f:
-                    json.dump(all_data, f, ensure_ascii=False, indent=4)
-                print(f"💾 Complete results saved to: {output_file}")
+                save_round_results(ResultWriter(args.output_dir, round_num + 1, positions, []), all_data, args)
                 break
 
             # 对需要重新评估的项目应用多轮模板
             items_to_reevaluate = multi_round_template_added(items_to_reevaluate)
             items_to_reevaluate = fix_json_data(items_to_reevaluate)
             print(f"📊 Re-evaluating {len(items_to_reevaluate)} items with errors from previous round")
+            if args.incremental != 'off':
+                kept, reevaluated = plan_incremental(items_to_reevaluate, args.incremental)
+                print(f"♻️  Incremental mode ({args.incremental}): keeping {kept} passing sub-questions, "
+                      f"re-evaluating {reevaluated}")
 
             # 设置当前处理的数据为需要重新评估的项目
             current_data = items_to_reevaluate
@@ -345,33 +594,36 @@ def main():
             print("✅ No items to process in this round!")
             break
 
-        # 处理model_response收集
-        print("📝 Getting model responses for evaluation...")
-        process_in_batches(current_data, args.batch_size)
-
-        # 开始评估
-        og_start_time = time.time()
-        print(f"🔄 Round {round_num + 1} Processing Started")
-
-        # 步骤1：提取对应部分
-        start_time = time.time()
-        print("🔍 Step 1: Extracting corresponding parts from all responses...")
-        current_data = extract_content(current_data, args.batch_size)
-        print("✅ Corresponding parts extraction completed successfully")
-        end_time = time.time()
-        print(f"⏱️  Time taken: {end_time - start_time:.2f} seconds")
-        print()
+        # 本轮评估的item完成后立即追加写入本轮的增量结果文件；
+        # 断点续跑时结果文件中已有的item直接恢复，不再重新评估
+        round_items = current_data
+        index_items(round_items)
+        writer = ResultWriter(args.output_dir, round_num + 1, positions, round_items, resume=bool(args.resume))
+        if args.resume:
+            current_data = writer.restore()
+
+        total_time = 0.0
+        with span("round", "round", round=round_num + 1, items=len(current_data)):
+            if not current_data:
+                print("♻️  All items of this round were restored from the previous run")
+            elif args.async_mode:
+                _, total_time = asyncio.run(
+                    run_round_async(current_data, rule_based_evaluate_func, round_num + 1, writer.write, checkpoint)
+                )
+            elif args.pipelined:
+                _, total_time = run_round_pipelined(
+                    current_data, args.batch_size, rule_based_evaluate_func, round_num + 1, args.queue_size,
+                    scheduler=args.scheduler, judge_inflight=args.judge_inflight, on_items_done=writer.write,
+                    checkpoint=checkpoint
+                )
+            else:
+                _, total_time = run_round(
+                    current_data, args, rule_based_evaluate_func, round_num + 1, checkpoint, writer.write
+                )
 
-        # 步骤2：处理和评估
-        start_time = time.time()
-        print("🔍 Step 2: Processing and evaluating all items...")
-        current_data = process_all_items(current_data, args.batch_size, rule_based_evaluate_func)
-        print("✅ Item processing and evaluation completed successfully")
-        end_time = time.time()
-        print(f"⏱️  Time taken: {end_time - start_time:.2f} seconds")
-        print()
+        # 各模式都原地修改item，本轮结果即round_items
+        current_data = round_items
 
-        total_time = end_time - og_start_time
         print("=" * 60)
         print(f"🎉 Round {round_num + 1} Completed Successfully!")
         print(f"⏱️  Total round time: {total_time:.2f} seconds")
@@ -381,37 +633,60 @@ def main():
         if round_num == 0:
             # 第一轮：更新all_data为当前评估结果
             all_data = current_data.copy()
-            output_file = os.path.join(args.output_dir, f"round_{round_num + 1}.json")
-            with open(output_file, "w", encoding="utf-8") as f:
-                json.dump(all_data, f, ensure_ascii=False, indent=4)
-            print(f"💾 Results saved to: {output_file}")
         else:
-            # 后续轮次：合并结果，用重新评估的结果更新对应项目
-            # 使用原始问题作为唯一标识符来匹配项目
-            reevaluated_items = {item.get('og_question', item.get('question', '')): item for item in current_data}
-
-            # 更新all_data中对应的项目
-            for i, item in enumerate(all_data):
-                item_key = item.get('og_question', item.get('question', ''))
-                if item_key in reevaluated_items:
-                    all_data[i] = reevaluated_items[item_key]
-
-            output_file = os.path.join(args.output_dir, f"round_{round_num + 1}.json")
-            with open(output_file, "w", encoding="utf-8") as f:
-                json.dump(all_data, f, ensure_ascii=False, indent=4)
-            print(f"💾 Complete results (including previous rounds) saved to: {output_file}")
-
-        # 计算并保存统计结果
+            # 后续轮次：合并结果，按item_id把重新评估的结果放回对应位置，只处理本轮的item
+            for item in current_data:
+                all_data[positions[item_key(item)]] = item
+
+        save_round_results(writer, all_data, args)
+
+        # 根据内存中的结果计算并保存统计结果
         try:
             # 确定语言参数
             language = args.language if args.language else 'chinese'
-            calculate_and_save_stats(output_file, round_num + 1, args.output_dir, language)
+            with span("stats", "stats", round=round_num + 1):
+                save_stats(all_data, round_num + 1, args.output_dir, language)
         except Exception as e:
             print(f"⚠️  Warning: Failed to calculate statistics for round {round_num + 1}: {e}")
 
         print()
 
 
+    # 输出每个模型角色的客户端统计：去重的prompt数、自适应批大小、限速吞吐量，多副本时还有每个副本承担的请求数
+    for role in ("qwen", "qwen_coder", "tested_model"):
+        client = get_client(role)
+        if client is not None and client.deduplicated:
+            print(f"🧹 {role}: {client.deduplicated} duplicate prompts were not re-sent")
+        if client is not None and client.batcher is not None:
+            print(f"📦 {role} adaptive batch size: {client.batcher.size}")
+        if client is not None and client.rate_limiter is not None:
+            throughput = client.rate_limiter.throughput()
+            print(f"🚦 {role} throughput (last minute): {throughput['requests_per_second']:.2f} req/s, "
+                  f"{throughput['tokens_per_second']:.0f} tokens/s, {throughput['throttled']} throttled, "
+                  f"rate at {throughput['rate_scale']:.0%} of the limit")
+        if client is not None and len(client.endpoints) > 1:
+            for endpoint_stats in client.endpoints.stats():
+                latency = endpoint_stats["latency"]
+                print(f"🔀 {role} {endpoint_stats['url']}: {endpoint_stats['requests']} requests, "
+                      f"latency {f'{latency:.2f}s' if latency is not None else 'n/a'}, "
+                      f"{'healthy' if endpoint_stats['healthy'] else 'unhealthy'}")
+
+    close_all_clients()
+    shutdown_extraction_sandbox()
+    response_cache = get_response_cache()
+    if response_cache is not None:
+        cache_stats = response_cache.stats()
+        print(f"🗄️  Response cache: {cache_stats['hits']} hits, {cache_stats['misses']} misses "
+              f"(hit rate {cache_stats['hit_rate']:.1%}, {cache_stats['evictions']} evicted)")
+    if checkpoint is not None:
+        checkpoint.close()
+    shutdown_metrics()
+    tracer = shutdown_tracing()
+    if tracer is not None:
+        print(f"🔬 Trace: {tracer.spans} spans written to {tracer.path}"
+              f"{f' and {tracer.chrome_path}' if tracer.chrome_path else ''}")
+        for name, (count, total) in sorted(tracer.totals.items(), key=lambda entry: -entry[1][1]):
+            print(f"   - {name}: {count} spans, {total:.2f}s in total")
     print("🎊 All rounds completed successfully!")
 
 
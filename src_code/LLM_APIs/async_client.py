@@ -0,0 +1,267 @@
+import asyncio
+import json
+import time
+
+try:
+    import aiohttp
+    AIOHTTP_AVAILABLE = True
+except ImportError:
+    aiohttp = None
+    AIOHTTP_AVAILABLE = False
+
+from LLM_APIs.client import (
+    DEFAULT_DECODING_PARAMS, EndpointUnavailable, get_client, get_pool_config, parse_completions, prompt_tokens
+)
+from LLM_APIs.retry import RetryableError, PartialBatchError, create_retry_policy
+from tracing import span, next_batch_id
+
+# 每个endpoint默认允许的并发请求数
+DEFAULT_CONCURRENCY = 128
+
+# 按模型角色存储异步客户端，URL与同步客户端保持一致
+_async_clients = {}
+_concurrency = DEFAULT_CONCURRENCY
+
+
+class AsyncModelClient:
+    """基于aiohttp的异步模型客户端，用信号量限制每个endpoint的并发请求数
+
+    与同步客户端共用同一个EndpointPool和限速器，两者的负载、健康状态和速率统一统计
+    """
+
+    def __init__(self, role, endpoints, concurrency=DEFAULT_CONCURRENCY, keep_alive=True, timeout=1800,
+                 rate_limiter=None, sync_client=None):
+        if not AIOHTTP_AVAILABLE:
+            raise ImportError("aiohttp is required for async mode. Please run: pip install aiohttp")
+        self.role = role
+        self.endpoints = endpoints
+        self.url = ",".join(endpoint.url for endpoint in endpoints.endpoints)
+        self.concurrency = concurrency
+        self.keep_alive = keep_alive
+        self.timeout = timeout
+        self.retry_policy = create_retry_policy()
+        self.rate_limiter = rate_limiter
+        # 去重的prompt数计入同步客户端，与同步模式统一输出
+        self.sync_client = sync_client
+        # 正在发送的prompt → 等待其结果的Future，相同的prompt只发送一次
+        self._inflight = {}
+        # Session和信号量都必须在事件循环内创建，延迟到第一次请求
+        self._session = None
+        self._semaphore = None
+
+    def _ensure_session(self):
+        if self._session is None:
+            connector = aiohttp.TCPConnector(
+                limit=self.concurrency * len(self.endpoints),
+                limit_per_host=self.concurrency,
+                force_close=not self.keep_alive
+            )
+            self._session = aiohttp.ClientSession(
+                connector=connector,
+                headers={"Content-Type": "application/json"},
+                timeout=aiohttp.ClientTimeout(total=self.timeout)
+            )
+            self._semaphore = asyncio.Semaphore(self.concurrency * len(self.endpoints))
+
+    async def generate(self, prompt):
+        """异步发送一批prompt，返回completions文本列表；重试策略与同步客户端相同
+
+        与正在发送的请求中相同的prompt（解码为贪心解码，结果相同）不再发送，直接等待那次请求的结果
+        """
+        self._ensure_session()
+        if isinstance(prompt, str):
+            return await self._generate_unique(prompt)
+
+        prompts = list(prompt)
+        loop = asyncio.get_running_loop()
+        futures = []
+        owned = {}
+        for text in prompts:
+            future = self._inflight.get(text)
+            if future is None:
+                future = self._inflight[text] = owned[text] = loop.create_future()
+            elif self.sync_client is not None:
+                with self.sync_client._stats_lock:
+                    self.sync_client.deduplicated += 1
+            futures.append(future)
+
+        try:
+            if owned:
+                try:
+                    texts, error = await self._generate_unique(list(owned)), None
+                except PartialBatchError as e:
+                    texts, error = e.texts, e.error
+                except Exception as e:
+                    texts, error = [None] * len(owned), e
+                for future, text in zip(owned.values(), texts):
+                    future.set_result((text, error if text is None else None))
+        finally:
+            for text, future in owned.items():
+                del self._inflight[text]
+                if not future.done():
+                    # 本次请求被取消，等待同一prompt的其他调用按失败处理
+                    future.set_result((None, RetryableError("Request for a shared prompt was cancelled")))
+
+        results = [await future for future in futures]
+        texts = [text for text, _ in results]
+        errors = [error for _, error in results if error is not None]
+        if not errors:
+            return texts
+        if all(text is None for text in texts):
+            raise errors[-1]
+        raise PartialBatchError(texts, errors[-1])
+
+    async def _generate_unique(self, prompt):
+        """发送一批prompt（字符串或列表），按重试策略重试"""
+        single = isinstance(prompt, str)
+        prompts = [prompt] if single else list(prompt)
+        batch_id = next_batch_id()
+        with span("model_batch", "model", role=self.role, batch_id=batch_id, prompts=len(prompts)) as trace:
+            return await self._generate_with_retry(prompts, single, batch_id, trace)
+
+    async def _generate_with_retry(self, prompts, single, batch_id, trace):
+        texts = [None] * len(prompts)
+        pending = list(range(len(prompts)))
+
+        attempt = 0
+        while True:
+            attempt += 1
+            trace["attempts"] = attempt
+            batch = prompts[0] if single else [prompts[index] for index in pending]
+            try:
+                async with self._semaphore:
+                    batch_texts = await self._send(batch, len(pending), batch_id)
+            except Exception as e:
+                error = e
+            else:
+                for index, text in zip(pending, batch_texts):
+                    texts[index] = text
+                pending = [index for index in pending if texts[index] is None]
+                if not pending:
+                    return texts
+                error = RetryableError(f"Server returned {len(batch_texts) - len(pending)} of {len(batch_texts)} completions")
+
+            if not self.retry_policy.is_retryable(error) or attempt >= self.retry_policy.max_attempts:
+                trace["failed"] = len(pending)
+                if len(pending) == len(prompts):
+                    raise error
+                raise PartialBatchError(texts, error)
+
+            # 等待期间不占用并发名额
+            await asyncio.sleep(self.retry_policy.delay(attempt))
+
+    async def _send(self, prompt, count, batch_id=None):
+        """发送一个请求（配置了限速时先等待配额），副本故障时切换到其他副本"""
+        payload = {"prompt": prompt}
+        payload.update(DEFAULT_DECODING_PARAMS)
+        tokens = prompt_tokens(prompt)
+
+        tried = []
+        while True:
+            if self.rate_limiter is not None:
+                wait = self.rate_limiter.reserve(tokens)
+                if wait > 0:
+                    await asyncio.sleep(wait)
+            endpoint = self.endpoints.acquire(exclude=tried)
+            tried.append(endpoint)
+            start_time = time.time()
+            try:
+                with span("model_request", "http", role=self.role, batch_id=batch_id,
+                          endpoint=endpoint.url, prompts=count):
+                    texts = await self._post(endpoint.url, payload, count)
+            except EndpointUnavailable as e:
+                self.endpoints.release(endpoint, success=False)
+                if len(tried) >= len(self.endpoints):
+                    raise
+                print(f"⚠️  {self.role} endpoint {endpoint.url} failed, failing over: {e}")
+                continue
+            except Exception as e:
+                self.endpoints.release(endpoint)
+                if self.rate_limiter is not None and getattr(e, "status", None) == 429:
+                    self.rate_limiter.on_throttled()
+                raise
+            self.endpoints.release(endpoint, latency=time.time() - start_time)
+            if self.rate_limiter is not None:
+                self.rate_limiter.on_success(tokens)
+            return texts
+
+    async def _post(self, url, payload, count):
+        """向单个副本发送请求，返回与prompt一一对应的文本列表（缺失或出错的completion为None）"""
+        try:
+            async with self._session.post(url, json=payload) as response:
+                text = await response.text()
+
+            # 检查HTTP状态码
+            if response.status != 200:
+                message = f"API call failed: HTTP {response.status}: {text}"
+                if response.status >= 500:
+                    raise EndpointUnavailable(message, response.status)
+                raise RetryableError(message, response.status)
+
+            # 检查响应是否为空
+            if not text.strip():
+                raise Exception("Empty response from API")
+
+            # 尝试解析JSON；与同步客户端一致，响应体损坏按可重试的响应错误处理
+            try:
+                response_json = json.loads(text)
+            except ValueError as e:
+                raise RetryableError(f"JSON parsing error: {e}. Response text: {text}")
+
+            # 检查响应格式
+            if 'completions' not in response_json:
+                raise Exception(f"Invalid response format. Expected 'completions' key. Got: {response_json}")
+
+            return parse_completions(response_json['completions'], count)
+
+        except RetryableError:
+            raise
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            raise EndpointUnavailable(f"Network error: {e}")
+        except ValueError as e:
+            raise Exception(f"JSON parsing error: {e}. Response text: {text}")
+        except Exception as e:
+            raise Exception(f"API call failed: {e}")
+
+    async def close(self):
+        """关闭aiohttp Session"""
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+            self._semaphore = None
+
+
+def set_async_concurrency(concurrency):
+    """设置每个endpoint的异步并发上限，对之后创建的异步客户端生效"""
+    global _concurrency
+    _concurrency = concurrency
+
+
+def get_async_client(role):
+    """获取模型角色对应的异步客户端，URL沿用同步客户端的配置；未配置时返回None"""
+    sync_client = get_client(role)
+    if sync_client is None:
+        return None
+    client = _async_clients.get(role)
+    # URL被重新设置后重建异步客户端
+    if client is None or client.endpoints is not sync_client.endpoints:
+        pool_config = get_pool_config()
+        client = AsyncModelClient(
+            role,
+            sync_client.endpoints,
+            concurrency=_concurrency,
+            keep_alive=pool_config["keep_alive"],
+            timeout=pool_config["timeout"],
+            rate_limiter=sync_client.rate_limiter,
+            sync_client=sync_client
+        )
+        _async_clients[role] = client
+    return client
+
+
+async def close_async_clients():
+    """关闭所有异步客户端；每次asyncio.run结束前调用"""
+    clients = list(_async_clients.values())
+    _async_clients.clear()
+    for client in clients:
+        await client.close()
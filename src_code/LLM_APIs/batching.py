@@ -0,0 +1,95 @@
+import threading
+
+# 自适应批大小默认配置，可通过 set_batching_config() 修改
+_batching_config = {
+    "enabled": False,           # 是否启用自适应批大小
+    "initial_size": 8,          # 每个角色的初始批大小
+    "min_size": 1,
+    "max_size": 256,
+    "target_latency": 60.0,     # 单次请求的目标延迟（秒），超过则缩小批次
+    "max_batch_tokens": 32768   # 单次请求中所有prompt的估计token数上限
+}
+
+
+def estimate_tokens(text):
+    """粗略估计prompt的token数：非ASCII字符（主要是中文）按每字1个token，ASCII按每4个字符1个token"""
+    non_ascii = sum(1 for char in text if ord(char) > 127)
+    return non_ascii + (len(text) - non_ascii) // 4 + 1
+
+
+class AdaptiveBatcher:
+    """按实测延迟和吞吐量调整单个模型角色的批大小
+
+    - 请求延迟超过target_latency或请求失败：批大小乘性减小
+    - 延迟达标且吞吐量（prompt/秒）没有下降：批大小加1
+    - 延迟达标但吞吐量下降：批大小减1，退回到吞吐量更高的大小
+    每个批次还受max_batch_tokens限制，长prompt（例如包含完整模型响应的提取prompt）会被拆得更细
+    """
+
+    def __init__(self, role, initial_size=8, min_size=1, max_size=256, target_latency=60.0,
+                 max_batch_tokens=32768):
+        self.role = role
+        self.min_size = min_size
+        self.max_size = max_size
+        self.target_latency = target_latency
+        self.max_batch_tokens = max_batch_tokens
+        self.size = max(min_size, min(initial_size, max_size))
+        self._throughput = None
+        self._lock = threading.Lock()
+
+    def split(self, prompts):
+        """按当前批大小和token上限把prompt列表拆成若干批"""
+        with self._lock:
+            size = self.size
+        batches = []
+        batch = []
+        batch_tokens = 0
+        for prompt in prompts:
+            tokens = estimate_tokens(prompt)
+            if batch and (len(batch) >= size or batch_tokens + tokens > self.max_batch_tokens):
+                batches.append(batch)
+                batch = []
+                batch_tokens = 0
+            batch.append(prompt)
+            batch_tokens += tokens
+        if batch:
+            batches.append(batch)
+        return batches
+
+    def record(self, batch_len, latency):
+        """记录一次成功请求的批大小和延迟，调整之后的批大小"""
+        with self._lock:
+            if latency > self.target_latency:
+                self.size = max(self.min_size, int(self.size * 0.5))
+                return
+            # 只有用满当前批大小的请求才能反映该大小的吞吐量
+            if batch_len < self.size:
+                return
+            throughput = batch_len / max(latency, 1e-6)
+            if self._throughput is None or throughput >= self._throughput * 0.95:
+                self.size = min(self.max_size, self.size + 1)
+            else:
+                self.size = max(self.min_size, self.size - 1)
+            self._throughput = throughput if self._throughput is None else 0.5 * (self._throughput + throughput)
+
+    def record_failure(self):
+        """请求失败（超时、5xx、连接中断）时减半批大小"""
+        with self._lock:
+            self.size = max(self.min_size, self.size // 2)
+
+
+def set_batching_config(**kwargs):
+    """修改自适应批大小配置，对之后创建的客户端生效"""
+    for key, value in kwargs.items():
+        if key not in _batching_config:
+            raise ValueError(f"Unknown batching config: {key}")
+        if value is not None:
+            _batching_config[key] = value
+
+
+def create_batcher(role):
+    """按当前配置为模型角色创建AdaptiveBatcher，未启用时返回None"""
+    config = dict(_batching_config)
+    if not config.pop("enabled"):
+        return None
+    return AdaptiveBatcher(role, **config)
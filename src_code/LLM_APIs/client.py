@@ -0,0 +1,321 @@
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from LLM_APIs.endpoints import EndpointPool
+from LLM_APIs.batching import create_batcher, estimate_tokens
+from LLM_APIs.rate_limit import create_rate_limiter
+from LLM_APIs.retry import RetryableError, PartialBatchError, create_retry_policy
+from tracing import span, next_batch_id
+
+# 所有模型接口共用的解码参数（贪心解码）
+DEFAULT_DECODING_PARAMS = {
+    "max_new_tokens": 8096,
+    "temperature": 0.00,
+    "top_k": 1
+}
+
+# 连接池默认配置，可通过 set_pool_config() 修改
+_pool_config = {
+    "pool_size": 16,        # 每个endpoint的最大连接数
+    "keep_alive": True,     # 是否复用TCP连接
+    "max_retries": 3,       # 建立连接失败时的重试次数
+    "backoff_factor": 0.5,  # 连接重试的退避系数
+    "timeout": 1800         # 单次请求超时（秒）
+}
+
+# 按模型角色（qwen / qwen_coder / tested_model）存储客户端
+_clients = {}
+_clients_lock = threading.Lock()
+
+
+class EndpointUnavailable(RetryableError):
+    """副本不可用（网络错误或5xx），可以切换到其他副本"""
+
+
+class ModelClient:
+    """模型角色的HTTP客户端，内部持有带连接池的requests.Session
+
+    url可以是逗号分隔的多个副本，每个请求发往负载最低的健康副本，失败时切换到其他副本
+    """
+
+    def __init__(self, role, url, pool_size=16, keep_alive=True, max_retries=3,
+                 backoff_factor=0.5, timeout=1800):
+        self.role = role
+        self.endpoints = EndpointPool(url)
+        self.url = ",".join(endpoint.url for endpoint in self.endpoints.endpoints)
+        self.pool_size = pool_size
+        self.keep_alive = keep_alive
+        self.max_retries = max_retries
+        self.backoff_factor = backoff_factor
+        self.timeout = timeout
+        self.batcher = create_batcher(role)
+        self.retry_policy = create_retry_policy()
+        self.rate_limiter = create_rate_limiter(role)
+        self.deduplicated = 0
+        self._stats_lock = threading.Lock()
+        self.session = self._build_session()
+
+    def _build_session(self):
+        """创建带连接池和连接重试的Session"""
+        session = requests.Session()
+        # 只对建立连接阶段的失败重试：此时请求尚未发出，重发POST是安全的
+        retry = Retry(
+            total=self.max_retries,
+            connect=self.max_retries,
+            read=0,
+            status=0,
+            other=0,
+            backoff_factor=self.backoff_factor,
+            allowed_methods=None
+        )
+        adapter = HTTPAdapter(
+            pool_connections=len(self.endpoints),
+            pool_maxsize=self.pool_size,
+            max_retries=retry,
+            pool_block=False
+        )
+        session.mount("http://", adapter)
+        session.mount("https://", adapter)
+        session.headers.update({"Content-Type": "application/json"})
+        if not self.keep_alive:
+            session.headers.update({"Connection": "close"})
+        return session
+
+    def generate(self, prompt):
+        """发送一批prompt，返回completions文本列表
+
+        批次内相同的prompt只发送一次（解码为贪心解码，结果相同），结果再分发回每个位置
+        """
+        if isinstance(prompt, str):
+            return self._generate_split(prompt)
+
+        prompts = list(prompt)
+        positions = {}
+        for text in prompts:
+            positions.setdefault(text, len(positions))
+        if len(positions) == len(prompts):
+            return self._generate_split(prompts)
+
+        with self._stats_lock:
+            self.deduplicated += len(prompts) - len(positions)
+        try:
+            unique_texts = self._generate_split(list(positions))
+        except PartialBatchError as e:
+            raise PartialBatchError([e.texts[positions[text]] for text in prompts], e.error)
+        return [unique_texts[positions[text]] for text in prompts]
+
+    def _generate_split(self, prompt):
+        """发送一批不重复的prompt
+
+        启用自适应批大小时，按该角色当前的批大小和token上限拆成多个请求依次发送。
+        重试用尽后仍有部分prompt失败时抛出PartialBatchError，其中保留了成功的结果。
+        """
+        if self.batcher is None or isinstance(prompt, str):
+            return self._generate_batch(prompt)
+
+        texts = []
+        last_error = None
+        for batch in self.batcher.split(prompt):
+            try:
+                batch_texts = self._generate_batch(batch)
+            except Exception as e:
+                batch_texts = e.texts if isinstance(e, PartialBatchError) else [None] * len(batch)
+                last_error = e.error if isinstance(e, PartialBatchError) else e
+            texts.extend(batch_texts)
+
+        if last_error is not None:
+            if all(text is None for text in texts):
+                raise last_error
+            raise PartialBatchError(texts, last_error)
+        return texts
+
+    def _generate_batch(self, prompt):
+        """发送一个批次，按重试策略退避重试；服务端只返回部分结果时只重发失败的prompt"""
+        single = isinstance(prompt, str)
+        prompts = [prompt] if single else list(prompt)
+        batch_id = next_batch_id()
+        with span("model_batch", "model", role=self.role, batch_id=batch_id, prompts=len(prompts)) as trace:
+            return self._generate_with_retry(prompts, single, batch_id, trace)
+
+    def _generate_with_retry(self, prompts, single, batch_id, trace):
+        """发送一批prompt直到全部成功或重试用尽
+
+        启用自适应批大小时只用第一次就完整成功的请求的HTTP往返时间调整批大小，
+        重试的退避等待、限速等待和副本切换的耗时都不计入
+        """
+        texts = [None] * len(prompts)
+        pending = list(range(len(prompts)))
+
+        attempt = 0
+        while True:
+            attempt += 1
+            trace["attempts"] = attempt
+            batch = prompts[0] if single else [prompts[index] for index in pending]
+            try:
+                batch_texts, latency = self._send(batch, len(pending), batch_id)
+            except Exception as e:
+                error = e
+            else:
+                for index, text in zip(pending, batch_texts):
+                    texts[index] = text
+                pending = [index for index in pending if texts[index] is None]
+                if not pending:
+                    if self.batcher is not None and attempt == 1 and latency is not None:
+                        self.batcher.record(len(prompts), latency)
+                    return texts
+                error = RetryableError(f"Server returned {len(batch_texts) - len(pending)} of {len(batch_texts)} completions")
+
+            retryable = self.retry_policy.is_retryable(error)
+            if retryable and self.batcher is not None:
+                self.batcher.record_failure()
+            if not retryable or attempt >= self.retry_policy.max_attempts:
+                trace["failed"] = len(pending)
+                if len(pending) == len(prompts):
+                    raise error
+                raise PartialBatchError(texts, error)
+
+            delay = self.retry_policy.delay(attempt)
+            print(f"🔁 {self.role}: retrying {len(pending)} prompts in {delay:.1f}s "
+                  f"(attempt {attempt + 1}/{self.retry_policy.max_attempts}): {error}")
+            time.sleep(delay)
+
+    def _send(self, prompt, count, batch_id=None):
+        """发送一个请求（配置了限速时先等待配额），副本故障时切换到其他副本
+
+        返回(文本列表, HTTP往返时间)；切换过副本时往返时间为None
+        """
+        payload = {"prompt": prompt}
+        payload.update(DEFAULT_DECODING_PARAMS)
+        tokens = prompt_tokens(prompt)
+
+        tried = []
+        while True:
+            if self.rate_limiter is not None:
+                self.rate_limiter.acquire(tokens)
+            endpoint = self.endpoints.acquire(exclude=tried)
+            tried.append(endpoint)
+            start_time = time.time()
+            try:
+                with span("model_request", "http", role=self.role, batch_id=batch_id,
+                          endpoint=endpoint.url, prompts=count):
+                    texts = self._post(endpoint.url, payload, count)
+            except EndpointUnavailable as e:
+                self.endpoints.release(endpoint, success=False)
+                if len(tried) >= len(self.endpoints):
+                    raise
+                print(f"⚠️  {self.role} endpoint {endpoint.url} failed, failing over: {e}")
+                continue
+            except Exception as e:
+                self.endpoints.release(endpoint)
+                if self.rate_limiter is not None and getattr(e, "status", None) == 429:
+                    self.rate_limiter.on_throttled()
+                raise
+            latency = time.time() - start_time
+            self.endpoints.release(endpoint, latency=latency)
+            if self.rate_limiter is not None:
+                self.rate_limiter.on_success(tokens)
+            return texts, (latency if len(tried) == 1 else None)
+
+    def _post(self, url, payload, count):
+        """向单个副本发送请求，返回与prompt一一对应的文本列表（缺失或出错的completion为None）"""
+        try:
+            response = self.session.post(url, json=payload, timeout=self.timeout)
+
+            # 检查HTTP状态码
+            if response.status_code != 200:
+                message = f"API call failed: HTTP {response.status_code}: {response.text}"
+                if response.status_code >= 500:
+                    raise EndpointUnavailable(message, response.status_code)
+                raise RetryableError(message, response.status_code)
+
+            # 检查响应是否为空
+            if not response.text.strip():
+                raise Exception("Empty response from API")
+
+            # 尝试解析JSON；响应体损坏不代表副本不可用（requests的JSONDecodeError同时是RequestException），
+            # 按可重试的响应错误处理，不切换副本
+            try:
+                response_json = response.json()
+            except ValueError as e:
+                raise RetryableError(f"JSON parsing error: {e}. Response text: {response.text}")
+
+            # 检查响应格式
+            if 'completions' not in response_json:
+                raise Exception(f"Invalid response format. Expected 'completions' key. Got: {response_json}")
+
+            return parse_completions(response_json['completions'], count)
+
+        except RetryableError:
+            raise
+        except requests.exceptions.RequestException as e:
+            raise EndpointUnavailable(f"Network error: {e}")
+        except ValueError as e:
+            raise Exception(f"JSON parsing error: {e}. Response text: {response.text}")
+        except Exception as e:
+            raise Exception(f"API call failed: {e}")
+
+    def close(self):
+        """关闭Session，释放连接池"""
+        self.session.close()
+
+
+def prompt_tokens(prompt):
+    """估计一个请求中所有prompt的token数"""
+    if isinstance(prompt, str):
+        return estimate_tokens(prompt)
+    return sum(estimate_tokens(p) for p in prompt)
+
+
+def parse_completions(completions, count):
+    """把completions解析成count个文本；缺失、带error或没有text的completion记为None"""
+    texts = []
+    for item in completions[:count]:
+        if isinstance(item, dict) and item.get('text') is not None and not item.get('error'):
+            texts.append(item['text'])
+        else:
+            texts.append(None)
+    texts.extend([None] * (count - len(texts)))
+    return texts
+
+
+def set_pool_config(**kwargs):
+    """修改连接池配置，对之后创建的客户端生效"""
+    for key, value in kwargs.items():
+        if key not in _pool_config:
+            raise ValueError(f"Unknown pool config: {key}")
+        if value is not None:
+            _pool_config[key] = value
+
+
+def get_pool_config():
+    """返回当前连接池配置的副本"""
+    return dict(_pool_config)
+
+
+def configure_client(role, url):
+    """为模型角色创建（或替换）客户端，url可以是单个URL、逗号分隔的多个URL或URL列表"""
+    client = ModelClient(role, url, **_pool_config)
+    with _clients_lock:
+        old_client = _clients.get(role)
+        _clients[role] = client
+    if old_client is not None:
+        old_client.close()
+    return client
+
+
+def get_client(role):
+    """获取模型角色对应的客户端，未配置时返回None"""
+    return _clients.get(role)
+
+
+def close_all_clients():
+    """关闭所有客户端"""
+    with _clients_lock:
+        clients = list(_clients.values())
+        _clients.clear()
+    for client in clients:
+        client.close()
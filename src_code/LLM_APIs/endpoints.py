@@ -0,0 +1,110 @@
+import threading
+import time
+
+# 最近延迟的指数滑动平均系数
+LATENCY_EWMA_ALPHA = 0.3
+# endpoint请求失败后暂停分配的时间（秒），连续失败时翻倍，最长 cooldown * 2**4
+DEFAULT_COOLDOWN = 10
+
+
+def parse_urls(url):
+    """把URL参数解析成endpoint列表，支持逗号分隔的字符串或列表"""
+    if isinstance(url, str):
+        urls = [part.strip() for part in url.split(",")]
+    else:
+        urls = [part.strip() for part in url]
+    urls = [part for part in urls if part]
+    if not urls:
+        raise ValueError("At least one endpoint URL is required")
+    return urls
+
+
+class Endpoint:
+    """单个副本的负载与健康状态"""
+
+    def __init__(self, url):
+        self.url = url
+        self.inflight = 0
+        self.latency = None      # 最近请求延迟的滑动平均（秒）
+        self.failures = 0        # 连续失败次数
+        self.down_until = 0.0    # 在此时间之前不再优先分配
+        self.requests = 0
+
+    def is_healthy(self, now):
+        return now >= self.down_until
+
+
+class EndpointPool:
+    """同一模型角色的多个副本，按在途请求数和最近延迟选择负载最低的副本
+
+    预计排队时间相同时（例如还没有延迟数据）依次比较在途请求数和轮询顺序，
+    顺序调用时每个副本也都会被轮到并测出延迟
+    """
+
+    def __init__(self, urls, cooldown=DEFAULT_COOLDOWN):
+        self.endpoints = [Endpoint(url) for url in parse_urls(urls)]
+        self.cooldown = cooldown
+        self._next = 0           # 轮询起点：上一次选中副本的下一个
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.endpoints)
+
+    def _score(self, endpoint, default_latency):
+        # 预计排队时间：(在途请求数 + 本次) × 单次延迟；还没有延迟数据时按平均延迟估计
+        latency = endpoint.latency if endpoint.latency is not None else default_latency
+        return (endpoint.inflight + 1) * latency
+
+    def _rotation(self, endpoint):
+        # 从上一次选中的副本之后开始轮询
+        return (self.endpoints.index(endpoint) - self._next) % len(self.endpoints)
+
+    def acquire(self, exclude=()):
+        """选择负载最低的健康副本并计入在途请求；没有可选副本时返回None"""
+        with self._lock:
+            now = time.time()
+            candidates = [endpoint for endpoint in self.endpoints if endpoint not in exclude]
+            if not candidates:
+                return None
+            healthy = [endpoint for endpoint in candidates if endpoint.is_healthy(now)]
+            if healthy:
+                known = [endpoint.latency for endpoint in healthy if endpoint.latency is not None]
+                default_latency = sum(known) / len(known) if known else 1.0
+                endpoint = min(healthy, key=lambda endpoint: (
+                    self._score(endpoint, default_latency), endpoint.inflight, self._rotation(endpoint)
+                ))
+            else:
+                # 所有副本都不健康时，尝试最早恢复的那个
+                endpoint = min(candidates, key=lambda endpoint: endpoint.down_until)
+            self._next = self.endpoints.index(endpoint) + 1
+            endpoint.inflight += 1
+            endpoint.requests += 1
+            return endpoint
+
+    def release(self, endpoint, latency=None, success=True):
+        """请求结束：更新在途请求数、延迟和健康状态"""
+        with self._lock:
+            endpoint.inflight -= 1
+            if success:
+                endpoint.failures = 0
+                endpoint.down_until = 0.0
+                if latency is not None:
+                    if endpoint.latency is None:
+                        endpoint.latency = latency
+                    else:
+                        endpoint.latency = LATENCY_EWMA_ALPHA * latency + (1 - LATENCY_EWMA_ALPHA) * endpoint.latency
+            else:
+                endpoint.failures += 1
+                endpoint.down_until = time.time() + self.cooldown * 2 ** min(endpoint.failures - 1, 4)
+
+    def stats(self):
+        """返回每个副本的请求数、在途请求数、延迟和健康状态"""
+        with self._lock:
+            now = time.time()
+            return [{
+                "url": endpoint.url,
+                "requests": endpoint.requests,
+                "inflight": endpoint.inflight,
+                "latency": endpoint.latency,
+                "healthy": endpoint.is_healthy(now)
+            } for endpoint in self.endpoints]
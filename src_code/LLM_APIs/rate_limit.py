@@ -0,0 +1,142 @@
+import threading
+import time
+from collections import deque
+
+# 每个模型角色的限速配置：role → (每秒请求数, 每秒prompt token数)，None表示该维度不限速
+_rate_limits = {}
+
+# 统计吞吐量的滑动窗口（秒）
+THROUGHPUT_WINDOW = 60
+# 令牌桶容量对应的秒数：允许的突发量为0.25秒的配额
+BURST_SECONDS = 0.25
+# 收到429后速率减半，之后每个成功请求恢复的比例
+THROTTLE_FACTOR = 0.5
+RECOVERY_STEP = 0.02
+MIN_RATE_SCALE = 0.05
+# 同一批并发请求会几乎同时收到429，这段时间（秒）内只降速一次
+THROTTLE_COOLDOWN = 1.0
+
+
+class _Bucket:
+    """令牌桶：容量为BURST_SECONDS秒的配额，允许欠账（大请求先发出，之后的请求多等一会）"""
+
+    def __init__(self, rate):
+        self.rate = rate
+        self.capacity = max(1.0, rate * BURST_SECONDS)
+        self.level = self.capacity
+        self.updated = time.time()
+
+    def reserve(self, cost, scale, now):
+        """扣除cost，返回需要等待的秒数"""
+        rate = self.rate * scale
+        self.level = min(self.capacity, self.level + (now - self.updated) * rate)
+        self.updated = now
+        self.level -= cost
+        return max(0.0, -self.level / rate)
+
+    def drain(self):
+        """清空桶内剩余配额，之后的请求按速率重新积累"""
+        self.level = min(self.level, 0.0)
+
+
+class RateLimiter:
+    """模型角色的客户端限速器（每秒请求数 + 每秒prompt token数）
+
+    收到429时把速率减半，之后随着成功请求逐步恢复到配置的速率，使实际吞吐量贴近但不超过服务端允许的上限
+    """
+
+    def __init__(self, role, requests_per_second=None, tokens_per_second=None):
+        self.role = role
+        self.requests_per_second = requests_per_second
+        self.tokens_per_second = tokens_per_second
+        self._request_bucket = _Bucket(requests_per_second) if requests_per_second else None
+        self._token_bucket = _Bucket(tokens_per_second) if tokens_per_second else None
+        self.rate_scale = 1.0
+        self.throttled = 0
+        self._last_throttle = 0.0
+        self._history = deque()
+        self._lock = threading.Lock()
+
+    def reserve(self, tokens):
+        """为一个包含tokens个prompt token的请求预留配额，返回发送前需要等待的秒数"""
+        with self._lock:
+            now = time.time()
+            wait = 0.0
+            if self._request_bucket is not None:
+                wait = max(wait, self._request_bucket.reserve(1, self.rate_scale, now))
+            if self._token_bucket is not None:
+                wait = max(wait, self._token_bucket.reserve(tokens, self.rate_scale, now))
+            return wait
+
+    def acquire(self, tokens):
+        """阻塞直到可以发送请求"""
+        wait = self.reserve(tokens)
+        if wait > 0:
+            time.sleep(wait)
+
+    def on_success(self, tokens):
+        """请求成功：记录吞吐量，并逐步恢复速率"""
+        with self._lock:
+            now = time.time()
+            self._history.append((now, tokens))
+            while self._history and self._history[0][0] < now - THROUGHPUT_WINDOW:
+                self._history.popleft()
+            self.rate_scale = min(1.0, self.rate_scale + RECOVERY_STEP)
+
+    def on_throttled(self):
+        """收到429：降低速率并清空突发配额"""
+        with self._lock:
+            self.throttled += 1
+            now = time.time()
+            if now - self._last_throttle < THROTTLE_COOLDOWN:
+                return
+            self._last_throttle = now
+            self.rate_scale = max(MIN_RATE_SCALE, self.rate_scale * THROTTLE_FACTOR)
+            for bucket in (self._request_bucket, self._token_bucket):
+                if bucket is not None:
+                    bucket.drain()
+        print(f"🐢 {self.role} throttled by server (HTTP 429), rate reduced to {self.rate_scale:.0%} of the limit")
+
+    def throughput(self):
+        """返回最近THROUGHPUT_WINDOW秒内的实际吞吐量和当前速率比例"""
+        with self._lock:
+            now = time.time()
+            while self._history and self._history[0][0] < now - THROUGHPUT_WINDOW:
+                self._history.popleft()
+            if self._history:
+                elapsed = max(now - self._history[0][0], 1.0)
+            else:
+                elapsed = 1.0
+            return {
+                "requests_per_second": len(self._history) / elapsed,
+                "tokens_per_second": sum(tokens for _, tokens in self._history) / elapsed,
+                "rate_scale": self.rate_scale,
+                "throttled": self.throttled
+            }
+
+
+def parse_rate_limit(spec):
+    """解析 ROLE:RPS[:TPS] 格式的限速参数，RPS或TPS留空或为0表示该维度不限速"""
+    parts = spec.split(":")
+    if len(parts) not in (2, 3) or not parts[0]:
+        raise ValueError(f"Invalid rate limit '{spec}', expected ROLE:RPS[:TPS]")
+    role = parts[0]
+    requests_per_second = float(parts[1]) if parts[1] else None
+    tokens_per_second = float(parts[2]) if len(parts) == 3 and parts[2] else None
+    return role, requests_per_second or None, tokens_per_second or None
+
+
+def set_rate_limit(role, requests_per_second=None, tokens_per_second=None):
+    """设置模型角色的限速，对之后创建的客户端生效"""
+    if requests_per_second or tokens_per_second:
+        _rate_limits[role] = (requests_per_second, tokens_per_second)
+    else:
+        _rate_limits.pop(role, None)
+
+
+def create_rate_limiter(role):
+    """按当前配置为模型角色创建RateLimiter，未配置限速时返回None"""
+    if role not in _rate_limits:
+        return None
+    requests_per_second, tokens_per_second = _rate_limits[role]
+    return RateLimiter(role, requests_per_second, tokens_per_second)
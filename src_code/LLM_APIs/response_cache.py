@@ -0,0 +1,189 @@
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+
+from LLM_APIs.client import DEFAULT_DECODING_PARAMS
+from LLM_APIs.retry import PartialBatchError
+
+# 当前启用的缓存（None表示不使用缓存），通过 enable_response_cache() 设置
+_cache = None
+
+
+class ResponseCache:
+    """内容寻址的磁盘响应缓存
+
+    键为 (模型角色, prompt, 解码参数) 的sha256，每条缓存一个文件，按前两位十六进制分目录。
+    用角色而不是副本URL作键，增减或调整副本不会让缓存失效。
+    解码为贪心解码（temperature 0, top_k 1），相同请求的结果可以直接复用。
+    启动时扫描一次缓存目录，在内存中按最近访问顺序维护 路径 → 大小 的索引；
+    总大小超过max_bytes时从索引中最久未访问的条目开始淘汰，直到降到max_bytes的90%。
+    """
+
+    def __init__(self, directory, max_bytes):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+        self._index = OrderedDict(
+            (path, size) for path, _, size in sorted(self._entries(), key=lambda entry: entry[1])
+        )
+        self._total_bytes = sum(self._index.values())
+
+    def _entries(self):
+        """遍历缓存文件，返回 (路径, 最近访问时间, 大小)"""
+        for shard in os.listdir(self.directory):
+            shard_dir = os.path.join(self.directory, shard)
+            if not os.path.isdir(shard_dir):
+                continue
+            for name in os.listdir(shard_dir):
+                if not name.endswith(".json"):
+                    continue
+                path = os.path.join(shard_dir, name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                yield path, stat.st_mtime, stat.st_size
+
+    @staticmethod
+    def make_key(model, prompt):
+        """计算缓存键"""
+        raw = json.dumps([model, prompt, DEFAULT_DECODING_PARAMS], ensure_ascii=False, sort_keys=True)
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.directory, key[:2], key + ".json")
+
+    def get(self, model, prompt):
+        """查询缓存，未命中返回None"""
+        path = self._path(self.make_key(model, prompt))
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                text = json.load(f)["text"]
+            # 更新访问时间，下次启动时按它恢复访问顺序
+            os.utime(path, None)
+        except (OSError, ValueError, KeyError):
+            with self._lock:
+                self.misses += 1
+            return None
+        with self._lock:
+            self.hits += 1
+            if path in self._index:
+                self._index.move_to_end(path)
+        return text
+
+    def put(self, model, prompt, text):
+        """写入一条缓存（先写临时文件再替换，避免并发读到半个文件）"""
+        path = self._path(self.make_key(model, prompt))
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        content = json.dumps({"prompt": prompt, "text": text}, ensure_ascii=False).encode("utf-8")
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(content)
+        os.replace(tmp_path, path)
+
+        with self._lock:
+            self._total_bytes += len(content) - self._index.pop(path, 0)
+            self._index[path] = len(content)
+            if self._total_bytes > self.max_bytes:
+                self._evict()
+
+    def _evict(self):
+        """按内存索引从最久未访问的条目开始删除缓存文件，调用方需持有锁"""
+        target = self.max_bytes * 0.9
+        while self._index and self._total_bytes > target:
+            path, size = self._index.popitem(last=False)
+            self._total_bytes -= size
+            try:
+                os.remove(path)
+            except OSError:
+                # 文件已被其他进程删除，只需从索引中去掉
+                continue
+            self.evictions += 1
+
+    def stats(self):
+        """返回命中/未命中计数和缓存大小"""
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / total if total else 0.0,
+                "evictions": self.evictions,
+                "size_bytes": self._total_bytes
+            }
+
+
+def enable_response_cache(directory, max_mb=1024):
+    """启用磁盘响应缓存"""
+    global _cache
+    _cache = ResponseCache(directory, int(max_mb * 1024 * 1024))
+    return _cache
+
+
+def get_response_cache():
+    """返回当前启用的缓存，未启用时返回None"""
+    return _cache
+
+
+def _split_cached(model, prompt):
+    """把一批prompt分成已缓存和未缓存两部分，返回 (prompt列表, 结果列表, 未命中下标)"""
+    prompts = [prompt] if isinstance(prompt, str) else list(prompt)
+    results = [_cache.get(model, p) for p in prompts]
+    missing = [index for index, text in enumerate(results) if text is None]
+    return prompts, results, missing
+
+
+def _fill_missing(model, prompts, results, missing, texts):
+    """把模型返回的结果写回结果列表并存入缓存"""
+    if len(texts) != len(missing):
+        raise Exception(f"Expected {len(missing)} completions, got {len(texts)}")
+    for index, text in zip(missing, texts):
+        results[index] = text
+        _cache.put(model, prompts[index], text)
+    return results
+
+
+def _fill_partial(model, prompts, results, missing, error):
+    """部分prompt失败时，缓存成功的结果，并按完整的prompt列表重新抛出PartialBatchError"""
+    for index, text in zip(missing, error.texts):
+        if text is not None:
+            results[index] = text
+            _cache.put(model, prompts[index], text)
+    raise PartialBatchError(results, error.error)
+
+
+def cached_generate(model, prompt, generate_func):
+    """带缓存的generate：只把未命中的prompt交给generate_func，结果顺序与输入一致
+
+    model为缓存键中的模型标识（模型角色名），不随副本列表变化
+    """
+    if _cache is None:
+        return generate_func(prompt)
+    prompts, results, missing = _split_cached(model, prompt)
+    if not missing:
+        return results
+    try:
+        texts = generate_func([prompts[index] for index in missing])
+    except PartialBatchError as e:
+        _fill_partial(model, prompts, results, missing, e)
+    return _fill_missing(model, prompts, results, missing, texts)
+
+
+async def async_cached_generate(model, prompt, generate_func):
+    """cached_generate的异步版本"""
+    if _cache is None:
+        return await generate_func(prompt)
+    prompts, results, missing = _split_cached(model, prompt)
+    if not missing:
+        return results
+    try:
+        texts = await generate_func([prompts[index] for index in missing])
+    except PartialBatchError as e:
+        _fill_partial(model, prompts, results, missing, e)
+    return _fill_missing(model, prompts, results, missing, texts)
@@ -0,0 +1,77 @@
+import random
+
+# 重试策略默认配置，可通过 set_retry_config() 修改
+_retry_config = {
+    "max_attempts": 4,                                      # 每批prompt最多发送的次数（含第一次）
+    "backoff_base": 1.0,                                    # 第一次重试前的等待时间（秒）
+    "backoff_max": 30.0,                                    # 单次等待时间上限（秒）
+    "jitter": True,                                         # 是否在等待时间上加随机抖动
+    "retryable_statuses": (408, 429, 500, 502, 503, 504)    # 可重试的HTTP状态码
+}
+
+
+class RetryableError(Exception):
+    """可以重试的请求错误：网络错误（status为None）或可重试的HTTP状态码"""
+
+    def __init__(self, message, status=None):
+        super().__init__(message)
+        self.status = status
+
+
+class PartialBatchError(Exception):
+    """重试用尽后只有部分prompt得到结果
+
+    texts与发送的prompt一一对应，失败的位置为None；error为最后一次失败的原因
+    """
+
+    def __init__(self, texts, error):
+        failed = sum(1 for text in texts if text is None)
+        super().__init__(f"{failed} of {len(texts)} prompts failed: {error}")
+        self.texts = texts
+        self.error = error
+
+
+def salvaged_texts(error, count):
+    """从批量调用的异常中取回已经成功的结果，失败的位置为None"""
+    if isinstance(error, PartialBatchError):
+        return list(error.texts)
+    return [None] * count
+
+
+class RetryPolicy:
+    """指数退避 + 抖动的重试策略"""
+
+    def __init__(self, max_attempts=4, backoff_base=1.0, backoff_max=30.0, jitter=True,
+                 retryable_statuses=(408, 429, 500, 502, 503, 504)):
+        self.max_attempts = max(1, max_attempts)
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.jitter = jitter
+        self.retryable_statuses = set(retryable_statuses)
+
+    def is_retryable(self, error):
+        """网络错误和可重试状态码的HTTP错误可以重试"""
+        if not isinstance(error, RetryableError):
+            return False
+        return error.status is None or error.status in self.retryable_statuses
+
+    def delay(self, attempt):
+        """第attempt次失败后的等待时间；启用抖动时在[0, 退避时间]内均匀取值（full jitter）"""
+        backoff = min(self.backoff_max, self.backoff_base * 2 ** (attempt - 1))
+        if self.jitter:
+            return random.uniform(0, backoff)
+        return backoff
+
+
+def set_retry_config(**kwargs):
+    """修改重试策略配置，对之后创建的客户端生效"""
+    for key, value in kwargs.items():
+        if key not in _retry_config:
+            raise ValueError(f"Unknown retry config: {key}")
+        if value is not None:
+            _retry_config[key] = value
+
+
+def create_retry_policy():
+    """按当前配置创建RetryPolicy"""
+    return RetryPolicy(**_retry_config)
@@ -0,0 +1,203 @@
+"""
+异步评估流水线
+每个prompt单独发送，由异步客户端的信号量控制每个endpoint的并发数，
+单个慢请求只会阻塞它自己，不会拖住整个批次
+"""
+
+import asyncio
+import time
+
+from LLM_APIs.tested_model_api import async_call_tested_model
+from LLM_APIs.qwen_coder_api import async_call_coder_model
+from LLM_APIs.qwen_api import async_call_model
+from LLM_APIs.async_client import close_async_clients
+from tracing import span, item_index
+from process_corresponding_parts import (
+    build_extraction_tasks, split_tasks_by_type, process_local_tasks,
+    apply_coding_results, apply_normal_result
+)
+from process_evaluation import (
+    build_evaluation_prompt, apply_evaluation_result, get_mixed_evaluation,
+    check_dependencies, compute_dependency_levels, report_dependency_problems,
+    mark_cyclic_failed, finalize_items
+)
+
+
+async def async_process_in_batches(data, on_item_done=None):
+    """并发获取被测模型的响应，每个item一个请求；on_item_done不为空时每个成功的响应返回后立即用该item回调"""
+    total_items = len(data)
+    print(f"📊 Sending {total_items} prompts concurrently...")
+
+    async def collect(index, item):
+        try:
+            responses = await async_call_tested_model([item["question"]])
+            item["model_response"] = responses[0]
+            if on_item_done is not None:
+                on_item_done(item)
+        except Exception as e:
+            print(f"❌ Error occurred while processing item {index}: {str(e)}")
+            # 失败的item写入空响应，保证后续阶段都有model_response
+            item["model_response"] = ""
+
+    await asyncio.gather(*(collect(index, item) for index, item in enumerate(data)))
+
+
+async def async_extract_content(data, on_item_done=None):
+    """extract_content的异步版本，所有需要调用模型的提取任务并发执行
+
+    每个item的模型调用全部返回后立即执行它的提取代码（启用沙箱时在子进程池中并行）；
+    on_item_done不为空时每个item提取完成后随即用该item回调
+    """
+    all_tasks = build_extraction_tasks(data)
+    print(f"Total tasks to process: {len(all_tasks)}")
+
+    coding_tasks, normal_tasks, json_tasks, list_tasks = split_tasks_by_type(all_tasks)
+    process_local_tasks(json_tasks, list_tasks, data)
+
+    # 每个item还未返回的模型调用数，以及已返回的提取代码
+    remaining = [0] * len(data)
+    for task in coding_tasks + normal_tasks:
+        remaining[task['data_index']] += 1
+    finished_coding = [[] for _ in data]
+
+    def task_done(data_index):
+        remaining[data_index] -= 1
+        if remaining[data_index] == 0:
+            finished = finished_coding[data_index]
+            apply_coding_results([task for task, _ in finished], data, [result for _, result in finished])
+            if on_item_done is not None:
+                on_item_done(data[data_index])
+
+    async def call_task(task):
+        try:
+            result = (await async_call_coder_model([task['prompt']]))[0]
+        except Exception as e:
+            print(f"    Extraction call failed for task {task['key']}: {e}")
+            data[task['data_index']]["extraction_results"][task['key']] = "INVALID"
+        else:
+            if task['is_coding']:
+                finished_coding[task['data_index']].append((task, result))
+            else:
+                apply_normal_result(task, data, result)
+        task_done(task['data_index'])
+
+    if on_item_done is not None:
+        for data_index, item in enumerate(data):
+            if remaining[data_index] == 0:
+                on_item_done(item)
+
+    print(f"Processing {len(coding_tasks)} coding tasks and {len(normal_tasks)} normal tasks concurrently...")
+    await asyncio.gather(*(call_task(task) for task in coding_tasks + normal_tasks))
+    return data
+
+
+async def async_model_evaluation(sub_q):
+    """异步调用裁判模型评估单个sub_question"""
+    try:
+        with span("judge_batch", "judge", questions=1, items=[item_index(sub_q["_item"])]):
+            raw_res = (await async_call_model([build_evaluation_prompt(sub_q)]))[0]
+    except Exception as e:
+        sub_q["eval_result"] = 0
+        sub_q["eval_explanation"] = str(e)
+        sub_q["eval_method"] = "pure model evaluation"
+        return
+    apply_evaluation_result(sub_q, raw_res)
+
+
+async def async_evaluate_item(index, item, rule_based_evaluate_func):
+    """按依赖层级评估单个item，层级只在item内部生效"""
+    levels, missing, cyclic = compute_dependency_levels(item)
+    report_dependency_problems(index, missing, cyclic)
+    questions_by_level = {}
+    for sub_q in item["sub_questions"]:
+        level = levels.get(id(sub_q))
+        if level is None:
+            mark_cyclic_failed(sub_q)
+            continue
+        questions_by_level.setdefault(level, []).append(sub_q)
+
+    for level in sorted(questions_by_level.keys()):
+        valid_batch = []
+        for sub_q in questions_by_level[level]:
+            if sub_q.get("_reuse"):
+                # 增量模式下沿用上一轮的结果
+                continue
+            if level == 0 or check_dependencies(sub_q, item):
+                valid_batch.append(sub_q)
+            else:
+                sub_q["eval_result"] = 0
+                sub_q["eval_explanation"] = "Dependencies failed"
+                sub_q["eval_method"] = "dependency check"
+
+        rule_batch = [sub_q for sub_q in valid_batch if sub_q.get("rule") is not None]
+        non_rule_batch = [sub_q for sub_q in valid_batch if sub_q.get("rule") is None]
+        if rule_batch:
+            get_mixed_evaluation(rule_batch, rule_based_evaluate_func)
+        if non_rule_batch:
+            await asyncio.gather(*(async_model_evaluation(sub_q) for sub_q in non_rule_batch))
+
+
+async def async_process_all_items(items, rule_based_evaluate_func=None, on_items_done=None):
+    """process_all_items的异步版本，每个item独立推进自己的依赖层级
+
+    每个item评估完成后立即整理结果；on_items_done不为空时随即用该item回调
+    """
+    print(f"Starting to process {len(items)} items...")
+
+    async def evaluate(index, item):
+        await async_evaluate_item(index, item, rule_based_evaluate_func)
+        finalize_items([item])
+        if on_items_done is not None:
+            on_items_done([item])
+
+    await asyncio.gather(*(evaluate(index, item) for index, item in enumerate(items)))
+    print("\nProcessing completed!")
+    return items
+
+
+async def run_round_async(current_data, rule_based_evaluate_func, round_num, on_items_done=None, checkpoint=None):
+    """异步执行一轮评估：收集响应 → 提取 → 评估，返回(结果, 评估耗时)
+
+    传入checkpoint时每个item的响应和提取结果完成后立即持久化，已持久化的item直接恢复
+    """
+    def record(stage):
+        return lambda item: checkpoint.record([item], round_num, stage)
+
+    try:
+        print("📝 Getting model responses for evaluation...")
+        pending = current_data
+        if checkpoint is not None:
+            pending = checkpoint.restore(current_data, round_num, "response")
+        with span("response", "stage", round=round_num, items=len(pending)):
+            await async_process_in_batches(pending, record("response") if checkpoint is not None else None)
+
+        og_start_time = time.time()
+        print(f"🔄 Round {round_num} Processing Started (async)")
+
+        # 步骤1：提取对应部分
+        start_time = time.time()
+        print("🔍 Step 1: Extracting corresponding parts from all responses...")
+        # 重新获取响应的item也要重新提取
+        extraction_pending = current_data
+        if checkpoint is not None:
+            extraction_pending = checkpoint.restore(current_data, round_num, "extraction", skip=pending)
+        with span("extraction", "stage", round=round_num, items=len(extraction_pending)):
+            await async_extract_content(extraction_pending, record("extraction") if checkpoint is not None else None)
+        print("✅ Corresponding parts extraction completed successfully")
+        end_time = time.time()
+        print(f"⏱️  Time taken: {end_time - start_time:.2f} seconds")
+        print()
+
+        # 步骤2：处理和评估
+        start_time = time.time()
+        print("🔍 Step 2: Processing and evaluating all items...")
+        with span("evaluation", "stage", round=round_num, items=len(current_data)):
+            current_data = await async_process_all_items(current_data, rule_based_evaluate_func, on_items_done)
+        print("✅ Item processing and evaluation completed successfully")
+        end_time = time.time()
+        print(f"⏱️  Time taken: {end_time - start_time:.2f} seconds")
+        print()
+    finally:
+        await close_async_clients()
+
+    return current_data, end_time - og_start_time
@@ -0,0 +1,91 @@
+"""
+多轮评估的断点续跑
+每个item在每一轮的响应和提取阶段完成后，立即把该阶段的结果追加写入output_dir/checkpoint.jsonl。
+评估阶段的结果本来就逐个流式写入round_N.jsonl，断点续跑时直接从那里恢复（见result_writer），不再重复写一份。
+使用 --resume 重新运行时，已持久化的结果直接恢复，对应的prompt不会再次发送。
+"""
+
+import copy
+import json
+import os
+import threading
+
+from dataset import item_key
+
+CHECKPOINT_FILE = "checkpoint.jsonl"
+
+# 每个阶段需要持久化（以及恢复）的item字段
+STAGE_FIELDS = {
+    "response": ["model_response"],
+    "extraction": ["extraction_results", "extraction_code"]
+}
+
+
+class CheckpointStore:
+    """追加写入的JSONL检查点，按(轮次, 阶段, item)索引"""
+
+    def __init__(self, output_dir, resume=False):
+        self.path = os.path.join(output_dir, CHECKPOINT_FILE)
+        self._records = {}
+        self._lock = threading.Lock()
+
+        if resume:
+            self._load()
+            print(f"♻️  Loaded {len(self._records)} checkpoint records from {self.path}")
+        elif os.path.exists(self.path):
+            print(f"⚠️  Existing checkpoint {self.path} will be overwritten (use --resume to continue it)")
+            open(self.path, "w", encoding="utf-8").close()
+
+        self._file = open(self.path, "a", encoding="utf-8")
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    # 进程中断时最后一行可能没写完整
+                    continue
+                self._records[(record["round"], record["stage"], record["key"])] = record["data"]
+
+    def record(self, items, round_num, stage):
+        """持久化一批item在某个阶段的结果（只追加到文件，恢复时才读取）"""
+        fields = STAGE_FIELDS[stage]
+        lines = []
+        for item in items:
+            data = {field: item[field] for field in fields if field in item}
+            key = item_key(item)
+            lines.append(json.dumps(
+                {"round": round_num, "stage": stage, "key": key, "data": data},
+                ensure_ascii=False,
+                default=str
+            ))
+        with self._lock:
+            for line in lines:
+                self._file.write(line + "\n")
+            self._file.flush()
+
+    def restore(self, items, round_num, stage, skip=()):
+        """把已持久化的阶段结果写回item，返回仍需处理的item列表
+
+        skip中的item（例如需要重新获取响应的item）不恢复，上一次基于旧响应的结果作废
+        """
+        skip = {id(item) for item in skip}
+        pending = []
+        restored = 0
+        for item in items:
+            data = None if id(item) in skip else self._records.get((round_num, stage, item_key(item)))
+            if data is None:
+                pending.append(item)
+            else:
+                item.update(copy.deepcopy(data))
+                restored += 1
+        if restored:
+            print(f"♻️  Restored {restored}/{len(items)} items from checkpoint (round {round_num}, stage: {stage})")
+        return pending
+
+    def close(self):
+        with self._lock:
+            self._file.close()
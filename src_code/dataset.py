@@ -0,0 +1,211 @@
+"""
+带索引的数据集加载
+第一次加载某个数据文件时顺序扫描一遍，为每个item记录一条索引：
+所在文件、在文件中的下标、字节偏移和长度、内容哈希、category、规则类型、sub_question数量。
+索引缓存在仓库根目录下的 .cache/dataset_index/ 中（每个数据目录一个 .idx 文件，按目录绝对路径的哈希命名），
+不会写入数据目录；文件大小或修改时间变化时才重新扫描该文件。
+按 --files / --category / --rule_prefix 筛选时只看索引，只有选中的item才会被读取和解析。
+
+加载的每个item带有稳定的 item_id（文件名#下标@内容哈希），多轮合并、检查点和结果文件都用它标识item，
+重复的问题不会互相覆盖，也不需要再对问题全文做哈希。
+"""
+
+import fnmatch
+import hashlib
+import json
+import os
+import re
+
+from rule_types import rule_type
+
+# 索引缓存目录，放在数据目录之外，避免其他按 *.json 扫描数据目录的代码读到它
+INDEX_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), ".cache", "dataset_index")
+# 旧版本写在数据目录中的索引文件，扫描数据文件时跳过
+LEGACY_INDEX_FILE = ".dataset_index.json"
+# 索引格式变化时递增，旧的索引缓存会被重建
+INDEX_VERSION = 2
+
+_decoder = json.JSONDecoder()
+
+
+def _index_file(path):
+    """扫描一个数据文件，返回其中每个item的索引（文件可以是item数组，也可以是单个item）"""
+    with open(path, "r", encoding="utf-8") as f:
+        text = f.read()
+
+    entries = []
+    position = 0
+    byte_offset = 0
+
+    def skip(position, separators):
+        while position < len(text) and (text[position].isspace() or text[position] in separators):
+            position += 1
+        return position
+
+    def add_entry(item, start, end):
+        nonlocal byte_offset, position
+        byte_offset += len(text[position:start].encode("utf-8"))
+        raw = text[start:end].encode("utf-8")
+        length = len(raw)
+        sub_questions = item.get("sub_questions") or []
+        entries.append({
+            "index": len(entries),
+            "offset": byte_offset,
+            "length": length,
+            "hash": hashlib.sha1(raw).hexdigest()[:16],
+            "category": item.get("category"),
+            "rules": sorted({rule_type(sub_q.get("rule")) for sub_q in sub_questions if sub_q.get("rule")}),
+            "sub_questions": len(sub_questions)
+        })
+        byte_offset += length
+        position = end
+
+    start = skip(0, "")
+    if text.startswith("[", start):
+        start = skip(start + 1, "")
+        while start < len(text) and text[start] != "]":
+            item, end = _decoder.raw_decode(text, start)
+            add_entry(item, start, end)
+            start = skip(end, ",")
+    else:
+        item, end = _decoder.raw_decode(text, start)
+        add_entry(item, start, end)
+    return entries
+
+
+def entry_id(entry):
+    """索引条目对应item的稳定标识：文件名#下标@内容哈希"""
+    return f"{entry['file']}#{entry['index']}@{entry['hash']}"
+
+
+def item_key(item):
+    """item在各轮之间不变的标识：加载时分配的item_id；不是通过索引加载的item退回到原始问题的哈希"""
+    item_id = item.get("item_id")
+    if item_id is not None:
+        return item_id
+    og_question = item.get("og_question", item.get("question", ""))
+    return hashlib.sha1(og_question.encode("utf-8")).hexdigest()
+
+
+def _file_matches(name, patterns):
+    """文件名匹配：完整文件名、通配符，或方括号中的编号（例如 6.1 匹配 DATA[6.1]英语版.json）"""
+    match = re.search(r'\[([^\]]+)\]', name)
+    file_id = match.group(1) if match else None
+    return any(
+        name == pattern or file_id == pattern or fnmatch.fnmatchcase(name, pattern)
+        for pattern in patterns
+    )
+
+
+class DatasetIndex:
+    """一个数据目录（或单个数据文件）的item索引"""
+
+    def __init__(self, path, index_dir=None):
+        if os.path.isdir(path):
+            self.directory = path
+            names = [name for name in os.listdir(path) if name.endswith('.json') and name != LEGACY_INDEX_FILE]
+        else:
+            self.directory = os.path.dirname(path) or "."
+            names = [os.path.basename(path)]
+        self.index_dir = index_dir or INDEX_DIR
+        self.files = names
+        self.entries = []
+        self._build(names)
+
+    def _cache_path(self):
+        directory = os.path.realpath(self.directory)
+        name = hashlib.sha1(directory.encode("utf-8")).hexdigest()[:16]
+        return os.path.join(self.index_dir, f"{name}.idx")
+
+    def _build(self, names):
+        cache = {}
+        if os.path.exists(self._cache_path()):
+            try:
+                with open(self._cache_path(), "r", encoding="utf-8") as f:
+                    cache = json.load(f)
+            except (OSError, ValueError):
+                cache = {}
+        directory = os.path.realpath(self.directory)
+        if cache.get("version") != INDEX_VERSION or cache.get("directory") != directory:
+            cache = {"version": INDEX_VERSION, "directory": directory, "files": {}}
+
+        scanned = 0
+        for name in names:
+            stat = os.stat(os.path.join(self.directory, name))
+            cached = cache["files"].get(name)
+            if cached is None or cached["size"] != stat.st_size or cached["mtime_ns"] != stat.st_mtime_ns:
+                try:
+                    file_entries = _index_file(os.path.join(self.directory, name))
+                except (OSError, ValueError) as e:
+                    print(f"❌ Error indexing {name}: {e}")
+                    continue
+                cached = {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns, "items": file_entries}
+                cache["files"][name] = cached
+                scanned += 1
+            for entry in cached["items"]:
+                self.entries.append(dict(entry, file=name))
+
+        if scanned:
+            try:
+                os.makedirs(self.index_dir, exist_ok=True)
+                tmp_path = f"{self._cache_path()}.{os.getpid()}.tmp"
+                with open(tmp_path, "w", encoding="utf-8") as f:
+                    json.dump(cache, f, ensure_ascii=False)
+                os.replace(tmp_path, self._cache_path())
+            except OSError as e:
+                # 缓存目录不可写时每次重新扫描
+                print(f"⚠️  Failed to write dataset index {self._cache_path()}: {e}")
+        print(f"🗂️  Dataset index: {len(self.entries)} items in {len(names)} files "
+              f"({scanned} files scanned, {len(names) - scanned} from cache)")
+
+    def select(self, files=None, categories=None, rule_prefixes=None):
+        """按文件、category和规则前缀筛选索引条目（各条件同时满足）
+
+        规则前缀与规则类型比较，例如 word_freq 选出含 word_freq3:[...] 规则的item，non_ 选出所有 non_* 规则
+        """
+        selected = []
+        for entry in self.entries:
+            if files and not _file_matches(entry["file"], files):
+                continue
+            if categories and entry["category"] not in categories:
+                continue
+            if rule_prefixes and not any(
+                rule.startswith(prefix) for rule in entry["rules"] for prefix in rule_prefixes
+            ):
+                continue
+            selected.append(entry)
+        return selected
+
+    def iter_items(self, entries):
+        """按索引条目依次读取item并写入item_id，每个文件只打开一次，只解析选中的item"""
+        handle = None
+        current_file = None
+        try:
+            for entry in entries:
+                if entry["file"] != current_file:
+                    if handle is not None:
+                        handle.close()
+                    current_file = entry["file"]
+                    handle = open(os.path.join(self.directory, current_file), "rb")
+                handle.seek(entry["offset"])
+                item = json.loads(handle.read(entry["length"]).decode("utf-8"))
+                item["item_id"] = entry_id(entry)
+                yield item
+        finally:
+            if handle is not None:
+                handle.close()
+
+    def load(self, entries=None):
+        return list(self.iter_items(self.entries if entries is None else entries))
+
+
+def load_dataset(path, files=None, categories=None, rule_prefixes=None):
+    """加载数据目录（或单个数据文件）中满足筛选条件的item"""
+    index = DatasetIndex(path)
+    entries = index.select(files, categories, rule_prefixes)
+    if files:
+        matched = sorted({entry["file"] for entry in entries})
+        print(f"📄 Selected {len(matched)} of {len(index.files)} files" + (f": {', '.join(matched)}" if matched else ""))
+    if len(entries) != len(index.entries):
+        print(f"🔎 Selected {len(entries)} of {len(index.entries)} items")
+    return index.load(entries)
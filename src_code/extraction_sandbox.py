@@ -0,0 +1,231 @@
+"""
+提取代码沙箱
+模型生成的提取代码在独立的子进程池中执行：每个任务有CPU时间和内存上限，并有墙钟超时。
+超时或崩溃的任务记为"INVALID"，对应的子进程被终止并重新创建，不会卡住整个评估。
+"""
+
+import multiprocessing
+import signal
+import threading
+import time
+from multiprocessing.connection import wait
+
+try:
+    import resource
+except ImportError:
+    # Windows下没有resource模块，只保留超时控制
+    resource = None
+
+# 当前启用的沙箱（None表示在主进程内直接执行），通过 enable_extraction_sandbox() 设置
+_sandbox = None
+
+
+class CPUTimeExceeded(Exception):
+    """任务用完了CPU时间配额"""
+
+
+def _on_cpu_limit(signum, frame):
+    raise CPUTimeExceeded("CPU time limit exceeded")
+
+
+def _set_cpu_limit(cpu_seconds):
+    """把RLIMIT_CPU软限制设为当前已用CPU时间 + cpu_seconds（RLIMIT_CPU按进程累计）"""
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    soft = int(usage.ru_utime + usage.ru_stime) + 1 + cpu_seconds
+    _, hard = resource.getrlimit(resource.RLIMIT_CPU)
+    if hard != resource.RLIM_INFINITY:
+        soft = min(soft, hard)
+    resource.setrlimit(resource.RLIMIT_CPU, (soft, hard))
+
+
+def _worker_main(conn, cpu_seconds, memory_mb):
+    """子进程入口：循环接收 (代码, model_response)，返回 (提取结果, 耗时信息)"""
+    # 延迟导入，避免与process_corresponding_parts循环导入
+    from process_corresponding_parts import extract_by_coding
+
+    if resource is not None:
+        if memory_mb:
+            memory_bytes = int(memory_mb * 1024 * 1024)
+            resource.setrlimit(resource.RLIMIT_AS, (memory_bytes, memory_bytes))
+        if cpu_seconds:
+            signal.signal(signal.SIGXCPU, _on_cpu_limit)
+
+    while True:
+        try:
+            job = conn.recv()
+        except EOFError:
+            break
+        if job is None:
+            break
+        code_in_str, model_response = job
+        if resource is not None and cpu_seconds:
+            _set_cpu_limit(cpu_seconds)
+        timing = {}
+        result = extract_by_coding(code_in_str, model_response, timing)
+        try:
+            conn.send((result, timing))
+        except Exception as e:
+            # 提取结果无法序列化
+            print(f"提取失败: {e}")
+            conn.send(("INVALID", timing))
+
+
+class _Worker:
+    """沙箱中的一个子进程，同一时间只执行一个任务"""
+
+    def __init__(self, context, cpu_seconds, memory_mb):
+        self.conn, child_conn = context.Pipe()
+        self.process = context.Process(
+            target=_worker_main,
+            args=(child_conn, cpu_seconds, memory_mb),
+            daemon=True
+        )
+        self.process.start()
+        child_conn.close()
+        self.job_index = None
+        self.started = None
+
+    def submit(self, job_index, job):
+        """把任务发给子进程；子进程已经退出（管道已断开）时返回False"""
+        try:
+            self.conn.send(job)
+        except (OSError, ValueError):
+            return False
+        self.job_index = job_index
+        self.started = time.time()
+        return True
+
+    def finish(self):
+        self.job_index = None
+        self.started = None
+
+    def kill(self):
+        self.process.kill()
+        self.process.join()
+        self.conn.close()
+
+    def stop(self):
+        try:
+            self.conn.send(None)
+        except (OSError, ValueError):
+            pass
+        self.process.join(timeout=1)
+        if self.process.is_alive():
+            self.process.kill()
+            self.process.join()
+        self.conn.close()
+
+
+class ExtractionSandbox:
+    """执行提取代码的子进程池"""
+
+    def __init__(self, workers=4, timeout=10, cpu_seconds=5, memory_mb=1024):
+        self.workers = workers
+        self.timeout = timeout
+        self.cpu_seconds = cpu_seconds
+        self.memory_mb = memory_mb
+        # spawn启动的子进程不继承主进程的线程和连接池，内存上限也只约束子进程自身
+        self._context = multiprocessing.get_context("spawn")
+        self._pool = []
+        self._lock = threading.Lock()
+        self.timeouts = 0
+        self.crashes = 0
+
+    def _new_worker(self):
+        return _Worker(self._context, self.cpu_seconds, self.memory_mb)
+
+    def run(self, jobs):
+        """并行执行一批 (代码, model_response)，按输入顺序返回 [(提取结果, 耗时信息)]"""
+        results = [None] * len(jobs)
+        if not jobs:
+            return results
+
+        with self._lock:
+            while len(self._pool) < min(self.workers, len(jobs)):
+                self._pool.append(self._new_worker())
+
+            next_job = 0
+            busy = {}
+            while next_job < len(jobs) or busy:
+                # 给空闲的子进程分配任务
+                for worker_index, worker in enumerate(self._pool):
+                    if next_job >= len(jobs):
+                        break
+                    if worker.job_index is not None:
+                        continue
+                    if not worker.submit(next_job, jobs[next_job]):
+                        # 子进程在两个任务之间退出了（例如被系统终止），换一个新的子进程重新提交
+                        self.crashes += 1
+                        print(f"    Extraction worker exited between jobs (exit code {worker.process.exitcode}), restarting it")
+                        worker.kill()
+                        worker = self._pool[worker_index] = self._new_worker()
+                        if not worker.submit(next_job, jobs[next_job]):
+                            print("    Extraction worker could not be restarted, marked INVALID")
+                            results[next_job] = ("INVALID", {"error": "crashed"})
+                            next_job += 1
+                            continue
+                    busy[worker.conn] = worker_index
+                    next_job += 1
+
+                if not busy:
+                    continue
+
+                # 等到有任务完成，或最早开始的任务超时
+                now = time.time()
+                earliest = min(self._pool[worker_index].started for worker_index in busy.values())
+                ready = wait(list(busy.keys()), timeout=max(0.0, earliest + self.timeout - now))
+
+                for conn in ready:
+                    worker_index = busy.pop(conn)
+                    worker = self._pool[worker_index]
+                    try:
+                        results[worker.job_index] = conn.recv()
+                        worker.finish()
+                    except (EOFError, OSError):
+                        # 子进程崩溃（例如超出内存上限被系统终止）
+                        self.crashes += 1
+                        print(f"    Extraction worker crashed (exit code {worker.process.exitcode}), marked INVALID")
+                        results[worker.job_index] = ("INVALID", {"error": "crashed"})
+                        worker.kill()
+                        self._pool[worker_index] = self._new_worker()
+
+                now = time.time()
+                for conn, worker_index in list(busy.items()):
+                    worker = self._pool[worker_index]
+                    if now - worker.started < self.timeout:
+                        continue
+                    self.timeouts += 1
+                    print(f"    Extraction code timed out after {self.timeout}s, marked INVALID")
+                    results[worker.job_index] = ("INVALID", {"error": "timeout"})
+                    del busy[conn]
+                    worker.kill()
+                    self._pool[worker_index] = self._new_worker()
+
+        return results
+
+    def shutdown(self):
+        """关闭所有子进程"""
+        with self._lock:
+            for worker in self._pool:
+                worker.stop()
+            self._pool = []
+
+
+def enable_extraction_sandbox(workers=4, timeout=10, cpu_seconds=5, memory_mb=1024):
+    """启用提取代码沙箱"""
+    global _sandbox
+    _sandbox = ExtractionSandbox(workers, timeout, cpu_seconds, memory_mb)
+    return _sandbox
+
+
+def get_extraction_sandbox():
+    """返回当前启用的沙箱，未启用时返回None"""
+    return _sandbox
+
+
+def shutdown_extraction_sandbox():
+    """关闭并停用沙箱"""
+    global _sandbox
+    if _sandbox is not None:
+        _sandbox.shutdown()
+        _sandbox = None
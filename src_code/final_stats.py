@@ -7,6 +7,8 @@
 import json
 import os
 
+from result_writer import load_results
+
 
 # 中英文映射字典
 CHINESE_TO_ENGLISH_MAPPING = {
@@ -250,23 +252,33 @@ def get_capability_result(result_info):
 
 def calculate_and_save_stats(round_file_path, round_num, output_dir, language='chinese'):
     """
-    计算并保存统计结果
+    读取round结果文件，计算并保存统计结果
 
     Args:
-        round_file_path: round结果文件路径
+        round_file_path: round结果文件路径（round_N.jsonl 或 round_N.json）
         round_num: 轮次编号
         output_dir: 输出目录
         language: 语言类型，'chinese' 或 'english'
     """
-    print(f"📊 Calculating statistics for round {round_num}...")
+    return save_stats(load_results(round_file_path), round_num, output_dir, language)
+
 
-    # 读取数据
-    with open(round_file_path, "r", encoding="utf-8") as f:
-        data = json.load(f)
+def save_stats(data, round_num, output_dir, language='chinese'):
+    """
+    根据内存中的评估结果计算并保存统计结果，不需要重新读取结果文件
+
+    Args:
+        data: 完整数据集的评估结果
+        round_num: 轮次编号
+        output_dir: 输出目录
+        language: 语言类型，'chinese' 或 'english'
+    """
+    print(f"📊 Calculating statistics for round {round_num}...")
 
     # 计算 meeseeks_score 和 utility_scores
-    meeseeks_scores = [calculate_final_score(item["sub_questions"])[0] for item in data]
-    utility_scores = [calculate_final_score(item["sub_questions"])[1] for item in data]
+    scores = [calculate_final_score(item["sub_questions"]) for item in data]
+    meeseeks_scores = [score[0] for score in scores]
+    utility_scores = [score[1] for score in scores]
 
     meeseeks_score = sum(meeseeks_scores) / len(meeseeks_scores) if meeseeks_scores else 0
     utility_score = sum(utility_scores) / len(utility_scores) if utility_scores else 0
@@ -0,0 +1,272 @@
+"""
+Prometheus格式的运行指标
+通过tracing的span监听器统计每个模型角色的请求数、延迟、错误和重试，各阶段完成的任务数，
+按规则类型统计的规则评估耗时，以及响应缓存和提取代码缓存的命中情况。
+指标可以通过本地HTTP服务的 /metrics 暴露，也可以定期写入文本文件（node_exporter textfile collector）。
+"""
+
+import os
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+from rule_types import rule_type
+from tracing import add_span_listener, remove_span_listener
+
+# 模型请求延迟的分桶（秒）
+REQUEST_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600)
+# 规则评估耗时的分桶（秒）
+RULE_BUCKETS = (0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5)
+
+# 当前启用的指标（None表示未启用），通过 enable_metrics() 设置
+_metrics = None
+
+
+def _format_labels(labelnames, values, extra=None):
+    pairs = list(zip(labelnames, values)) + list(extra or [])
+    if not pairs:
+        return ""
+    escaped = (str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, value in pairs)
+    return "{" + ",".join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + "}"
+
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    """只增不减的计数器"""
+
+    def __init__(self, name, help_text, labelnames=()):
+        self.name = name
+        self.help_text = help_text
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(str(labels[name]) for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}")
+        return lines
+
+
+class Histogram:
+    """分桶直方图，桶为累计计数"""
+
+    def __init__(self, name, help_text, labelnames=(), buckets=REQUEST_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets) + (float("inf"),)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(str(labels[name]) for name in self.labelnames)
+        with self._lock:
+            counts, total = self._values.get(key, ([0] * len(self.buckets), 0.0))
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[index] += 1
+            self._values[key] = (counts, total + value)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for key, (counts, total) in sorted(self._values.items()):
+                for bound, count in zip(self.buckets, counts):
+                    labels = _format_labels(self.labelnames, key, [("le", _format_value(bound))])
+                    lines.append(f"{self.name}_bucket{labels} {count}")
+                labels = _format_labels(self.labelnames, key)
+                lines.append(f"{self.name}_sum{labels} {_format_value(total)}")
+                lines.append(f"{self.name}_count{labels} {counts[-1]}")
+        return lines
+
+
+class EvaluationMetrics:
+    """评估流程的全部指标，作为span监听器更新"""
+
+    def __init__(self):
+        self.requests = Counter(
+            "meeseeks_model_requests_total", "HTTP requests sent to model endpoints", ("role", "status"))
+        self.request_seconds = Histogram(
+            "meeseeks_model_request_seconds", "Latency of HTTP requests to model endpoints", ("role",))
+        self.errors = Counter(
+            "meeseeks_model_errors_total", "Failed HTTP requests to model endpoints", ("role", "status"))
+        self.prompts = Counter(
+            "meeseeks_model_prompts_total", "Prompts sent to each model role", ("role",))
+        self.retries = Counter(
+            "meeseeks_model_retries_total", "Retried model requests", ("role",))
+        self.failed_prompts = Counter(
+            "meeseeks_model_failed_prompts_total", "Prompts still without a completion after all retries", ("role",))
+        self.tasks = Counter(
+            "meeseeks_stage_tasks_total", "Tasks completed per pipeline stage", ("stage",))
+        self.stage_seconds = Counter(
+            "meeseeks_stage_seconds_total", "Wall time spent in each pipeline stage", ("stage",))
+        self.rule_seconds = Histogram(
+            "meeseeks_rule_eval_seconds", "Latency of rule evaluations per rule type", ("rule",), RULE_BUCKETS)
+
+    def on_span(self, name, category, duration, args):
+        if name == "model_request":
+            status = args.get("status", "error") if "error" in args else 200
+            self.requests.inc(role=args["role"], status=status)
+            self.request_seconds.observe(duration, role=args["role"])
+            if "error" in args:
+                self.errors.inc(role=args["role"], status=status)
+        elif name == "model_batch":
+            failed = args.get("failed", 0)
+            if "error" in args and not failed:
+                failed = args["prompts"]
+            self.prompts.inc(args["prompts"], role=args["role"])
+            self.retries.inc(args.get("attempts", 1) - 1, role=args["role"])
+            if failed:
+                self.failed_prompts.inc(failed, role=args["role"])
+            if args["role"] == "tested_model":
+                self.tasks.inc(args["prompts"] - failed, stage="response")
+        elif name == "rule_eval":
+            self.rule_seconds.observe(duration, rule=rule_type(args.get("rule")))
+            self.tasks.inc(stage="rule_eval")
+        elif name == "extraction_task":
+            self.tasks.inc(stage="extraction")
+        elif name == "extraction_sandbox":
+            self.tasks.inc(args["tasks"], stage="extraction")
+        elif name == "judge_batch":
+            self.tasks.inc(args["questions"], stage="judge")
+        elif name == "stats":
+            self.tasks.inc(stage="stats")
+        if category == "stage":
+            self.stage_seconds.inc(duration, stage=name)
+
+    def render(self):
+        lines = []
+        for metric in (self.requests, self.request_seconds, self.errors, self.prompts, self.retries,
+                       self.failed_prompts, self.tasks, self.stage_seconds, self.rule_seconds):
+            lines.extend(metric.render())
+        lines.extend(_cache_lines())
+        return "\n".join(lines) + "\n"
+
+
+def _cache_lines():
+    """响应缓存和提取代码缓存的命中情况，在导出时从各自的统计中读取"""
+    from LLM_APIs.response_cache import get_response_cache
+    from process_corresponding_parts import get_code_cache_stats
+
+    caches = {}
+    response_cache = get_response_cache()
+    if response_cache is not None:
+        stats = response_cache.stats()
+        caches["response"] = (stats["hits"], stats["misses"])
+    code_stats = get_code_cache_stats()
+    caches["extraction_code"] = (code_stats["hits"], code_stats["misses"])
+
+    lines = []
+    for metric, index, help_text in (
+        ("meeseeks_cache_hits_total", 0, "Cache hits"),
+        ("meeseeks_cache_misses_total", 1, "Cache misses"),
+    ):
+        lines += [f"# HELP {metric} {help_text}", f"# TYPE {metric} counter"]
+        for cache, values in caches.items():
+            lines.append(f'{metric}{{cache="{cache}"}} {values[index]}')
+    lines += ["# HELP meeseeks_cache_hit_ratio Cache hit ratio", "# TYPE meeseeks_cache_hit_ratio gauge"]
+    for cache, (hits, misses) in caches.items():
+        ratio = hits / (hits + misses) if hits + misses else 0.0
+        lines.append(f'meeseeks_cache_hit_ratio{{cache="{cache}"}} {_format_value(ratio)}')
+    return lines
+
+
+class MetricsExporter:
+    """导出指标：本地HTTP服务（/metrics）和/或定期重写的文本文件"""
+
+    def __init__(self, metrics, port=None, textfile=None, interval=15.0, host="127.0.0.1"):
+        self.metrics = metrics
+        self.textfile = textfile
+        self.interval = interval
+        self._stop = threading.Event()
+        self._server = None
+        self._writer = None
+
+        if port is not None:
+            self._server = ThreadingHTTPServer((host, port), self._make_handler())
+            self._server.daemon_threads = True
+            threading.Thread(target=self._server.serve_forever, name="metrics-server", daemon=True).start()
+        if textfile:
+            self._writer = threading.Thread(target=self._write_periodically, name="metrics-writer", daemon=True)
+            self._writer.start()
+
+    def _make_handler(self):
+        metrics = self.metrics
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, format, *args):
+                pass
+
+            def do_GET(self):
+                if self.path.split("?")[0] != "/metrics":
+                    self.send_error(404)
+                    return
+                content = metrics.render().encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+                self.send_header("Content-Length", str(len(content)))
+                self.end_headers()
+                self.wfile.write(content)
+
+        return Handler
+
+    def write_textfile(self):
+        """先写临时文件再替换，采集方不会读到半个文件"""
+        tmp_path = f"{self.textfile}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(self.metrics.render())
+        os.replace(tmp_path, self.textfile)
+
+    def _write_periodically(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.write_textfile()
+            except Exception as e:
+                print(f"⚠️  Failed to write metrics file {self.textfile}: {e}")
+
+    def close(self):
+        """停止导出；文本文件在停止前再写一次最终结果"""
+        self._stop.set()
+        if self._writer is not None:
+            self._writer.join()
+            self.write_textfile()
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+
+
+def enable_metrics(port=None, textfile=None, interval=15.0):
+    """启用指标统计并开始导出"""
+    global _metrics
+    metrics = EvaluationMetrics()
+    exporter = MetricsExporter(metrics, port=port, textfile=textfile, interval=interval)
+    add_span_listener(metrics.on_span)
+    _metrics = (metrics, exporter)
+    return metrics
+
+
+def get_metrics():
+    """返回当前启用的指标，未启用时返回None"""
+    return _metrics[0] if _metrics is not None else None
+
+
+def shutdown_metrics():
+    """停止统计和导出"""
+    global _metrics
+    if _metrics is None:
+        return
+    metrics, exporter = _metrics
+    _metrics = None
+    remove_span_listener(metrics.on_span)
+    exporter.close()
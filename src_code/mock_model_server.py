@@ -0,0 +1,285 @@
+#!/usr/bin/env python3
+"""
+本地模拟模型服务
+实现与真实模型服务相同的协议：POST {"prompt": [...]} → {"completions": [{"text": ...}]}，
+可以在没有GPU的机器上跑通并压测整个评估流程。
+
+- 路径 /qwen、/qwen_coder、/tested_model 分别模拟裁判模型、提取模型和被测模型，其他路径按prompt内容自动判断角色
+- 延迟：可配置的延迟分布（固定/均匀/正态/对数正态/指数）+ 每个prompt的额外延迟，以及并发槽位数
+- 错误：整个请求返回503/429的概率，单个completion出错的概率
+- 内容：优先回放录制的结果（响应缓存目录、{"prompt", "text"} JSONL、round_N.jsonl/json），否则生成固定格式的模拟输出
+- GET /stats 返回各角色的请求计数
+
+示例：
+python src_code/mock_model_server.py --port 8000 --latency lognormal:-1.5:0.5 --error_rate 0.01 --replay cache_dir
+python run.py --qwen_url http://127.0.0.1:8000/qwen --qwen_coder_url http://127.0.0.1:8000/qwen_coder \
+    --tested_model_url http://127.0.0.1:8000/tested_model --language english
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import random
+import threading
+import time
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+ROLES = ("qwen", "qwen_coder", "tested_model")
+
+# 模拟提取模型生成的代码：按行切分model_response
+MOCK_EXTRACTION_CODE = """```python
+import re
+def extract_info_list(model_response):
+    return [line.strip() for line in model_response.split('\\n') if line.strip()]
+```"""
+
+MOCK_WORDS = [
+    "travel", "photography", "culture", "food", "scenery", "adventure", "history", "museum",
+    "风景", "美食", "文化", "旅行", "摄影", "历史", "体验", "推荐"
+]
+
+
+def parse_latency(spec):
+    """解析延迟分布：fixed:S、uniform:LOW:HIGH、normal:MEAN:STD、lognormal:MU:SIGMA、exp:MEAN，返回采样函数"""
+    name, _, params = spec.partition(":")
+    values = [float(value) for value in params.split(":")] if params else []
+    samplers = {
+        "fixed": (1, lambda rng, s: s),
+        "uniform": (2, lambda rng, low, high: rng.uniform(low, high)),
+        "normal": (2, lambda rng, mean, std: max(0.0, rng.gauss(mean, std))),
+        "lognormal": (2, lambda rng, mu, sigma: rng.lognormvariate(mu, sigma)),
+        "exp": (1, lambda rng, mean: rng.expovariate(1.0 / mean) if mean > 0 else 0.0)
+    }
+    if name not in samplers or len(values) != samplers[name][0]:
+        raise ValueError(f"Invalid latency spec '{spec}'")
+    sampler = samplers[name][1]
+    return lambda rng: sampler(rng, *values)
+
+
+def detect_role(prompt):
+    """按prompt内容判断请求来自哪个角色"""
+    if "extract_info_list" in prompt:
+        return "qwen_coder"
+    if "【次问题】" in prompt:
+        return "qwen"
+    if "【抓取对象】" in prompt:
+        return "qwen_coder"
+    return "tested_model"
+
+
+def prompt_seed(prompt):
+    return int(hashlib.sha256(prompt.encode("utf-8")).hexdigest()[:16], 16)
+
+
+def mock_completion(role, prompt, judge_pass_rate, tested_lines):
+    """生成与真实输出格式一致的模拟结果，同一个prompt的结果固定"""
+    rng = random.Random(prompt_seed(prompt))
+    if role == "qwen":
+        if rng.random() < judge_pass_rate:
+            return "分析：✅ 模型回复满足要求\n判断：是"
+        return "分析：❌ 模型回复不满足要求\n判断：否"
+    if role == "qwen_coder":
+        if "extract_info_list" in prompt:
+            return MOCK_EXTRACTION_CODE
+        # 普通提取：返回【模型回复】中的各行
+        sections = prompt.split("【模型回复】")
+        response = sections[-1].split("【", 1)[0] if len(sections) > 1 else ""
+        lines = [line.strip() for line in response.split("\n") if line.strip()]
+        return json.dumps(lines[:20] or ["ALL"], ensure_ascii=False)
+    return "\n".join(
+        f"{index + 1}. " + " ".join(rng.choice(MOCK_WORDS) for _ in range(rng.randint(3, 8)))
+        for index in range(tested_lines)
+    )
+
+
+def load_replay(paths):
+    """加载录制的结果：响应缓存目录、{"prompt", "text"} JSONL、round_N.jsonl 或 round_N.json，返回 prompt → text"""
+    recorded = {}
+
+    def add_item(item):
+        if item.get("model_response") is not None:
+            recorded[item["question"]] = item["model_response"]
+
+    def add_record(record):
+        if not isinstance(record, dict):
+            return
+        if isinstance(record.get("prompt"), str) and record.get("text") is not None:
+            recorded[record["prompt"]] = record["text"]
+        elif isinstance(record.get("item"), dict):
+            # round_N.jsonl：{"index", "item"}
+            add_item(record["item"])
+
+    for path in paths:
+        if os.path.isdir(path):
+            for root, _, files in os.walk(path):
+                for name in files:
+                    if not name.endswith(".json"):
+                        continue
+                    try:
+                        with open(os.path.join(root, name), "r", encoding="utf-8") as f:
+                            add_record(json.load(f))
+                    except (OSError, ValueError):
+                        continue
+        elif path.endswith(".jsonl"):
+            with open(path, "r", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        add_record(json.loads(line))
+                    except ValueError:
+                        continue
+        else:
+            # round_N.json：被测模型对每个问题的回复
+            with open(path, "r", encoding="utf-8") as f:
+                for item in json.load(f):
+                    add_item(item)
+    return recorded
+
+
+class MockModelServer:
+    """模拟服务的状态与配置"""
+
+    def __init__(self, args):
+        self.args = args
+        self.default_latency = parse_latency(args.latency)
+        self.role_latency = {}
+        for spec in args.role_latency:
+            role, _, latency = spec.partition("=")
+            if role not in ROLES:
+                raise ValueError(f"Unknown role in --role_latency: {role}")
+            self.role_latency[role] = parse_latency(latency)
+        self.recorded = load_replay(args.replay)
+        self.rng = random.Random(args.seed)
+        self.rng_lock = threading.Lock()
+        self.slots = threading.BoundedSemaphore(args.slots) if args.slots > 0 else None
+        self.stats = {role: {"requests": 0, "prompts": 0, "replayed": 0, "errors": 0} for role in ROLES}
+        self.stats_lock = threading.Lock()
+
+    def random(self):
+        with self.rng_lock:
+            return self.rng.random()
+
+    def sample_latency(self, role, prompt_count):
+        sampler = self.role_latency.get(role, self.default_latency)
+        with self.rng_lock:
+            latency = sampler(self.rng)
+        return latency + self.args.per_prompt_latency * prompt_count
+
+    def count(self, role, key, value=1):
+        with self.stats_lock:
+            self.stats[role][key] += value
+
+    def handle(self, role, prompts):
+        """返回 (HTTP状态码, 响应体)"""
+        role = role or detect_role(prompts[0] if prompts else "")
+        self.count(role, "requests")
+        self.count(role, "prompts", len(prompts))
+
+        # 模拟推理耗时：占用一个并发槽位
+        if self.slots is not None:
+            self.slots.acquire()
+        try:
+            time.sleep(self.sample_latency(role, len(prompts)))
+        finally:
+            if self.slots is not None:
+                self.slots.release()
+
+        if self.random() < self.args.error_rate:
+            self.count(role, "errors")
+            return 503, {"error": "mock server error"}
+        if self.random() < self.args.throttle_rate:
+            self.count(role, "errors")
+            return 429, {"error": "mock rate limit"}
+
+        completions = []
+        for prompt in prompts:
+            if self.random() < self.args.partial_rate:
+                completions.append({"error": "mock completion error"})
+                continue
+            if prompt in self.recorded:
+                self.count(role, "replayed")
+                completions.append({"text": self.recorded[prompt]})
+            elif self.args.replay_only:
+                completions.append({"error": "prompt not recorded"})
+            else:
+                completions.append({"text": mock_completion(
+                    role, prompt, self.args.judge_pass_rate, self.args.tested_lines
+                )})
+        return 200, {"completions": completions}
+
+
+def make_handler(server):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, format, *args):
+            pass
+
+        def send_json(self, status, body):
+            content = json.dumps(body, ensure_ascii=False).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(content)))
+            self.end_headers()
+            self.wfile.write(content)
+
+        def do_GET(self):
+            if self.path.rstrip("/") == "/stats":
+                with server.stats_lock:
+                    self.send_json(200, server.stats)
+            else:
+                self.send_json(404, {"error": "not found"})
+
+        def do_POST(self):
+            try:
+                length = int(self.headers.get("Content-Length", 0))
+                body = json.loads(self.rfile.read(length))
+                prompt = body["prompt"]
+            except (ValueError, KeyError) as e:
+                self.send_json(400, {"error": f"invalid request: {e}"})
+                return
+            prompts = [prompt] if isinstance(prompt, str) else list(prompt)
+            role = self.path.strip("/").split("/")[-1]
+            status, response = server.handle(role if role in ROLES else None, prompts)
+            self.send_json(status, response)
+
+    return Handler
+
+
+def main():
+    parser = argparse.ArgumentParser(description='本地模拟模型服务')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--latency', default='fixed:0', help='每个请求的延迟分布，例如 fixed:0.1 / uniform:0.05:0.2 / lognormal:-1.5:0.5')
+    parser.add_argument('--role_latency', action='append', default=[], metavar='ROLE=SPEC',
+                        help='单独设置某个角色的延迟分布，例如 tested_model=normal:2:0.5，可重复指定')
+    parser.add_argument('--per_prompt_latency', type=float, default=0.0, help='批次中每个prompt额外增加的延迟（秒）')
+    parser.add_argument('--slots', type=int, default=0, help='同时处理的请求数上限，模拟有限的推理并发；0表示不限')
+    parser.add_argument('--error_rate', type=float, default=0.0, help='整个请求返回HTTP 503的概率')
+    parser.add_argument('--throttle_rate', type=float, default=0.0, help='整个请求返回HTTP 429的概率')
+    parser.add_argument('--partial_rate', type=float, default=0.0, help='单个completion返回错误的概率')
+    parser.add_argument('--replay', action='append', default=[],
+                        help='回放录制的结果：响应缓存目录、{"prompt","text"} JSONL 或 round_N.jsonl/json，可重复指定')
+    parser.add_argument('--replay_only', action='store_true', help='没有录制结果的prompt返回错误而不是模拟输出')
+    parser.add_argument('--judge_pass_rate', type=float, default=0.7, help='模拟裁判模型判断为“是”的比例')
+    parser.add_argument('--tested_lines', type=int, default=10, help='模拟被测模型回复的行数')
+    parser.add_argument('--seed', type=int, default=0, help='延迟和错误注入的随机种子')
+    args = parser.parse_args()
+
+    server = MockModelServer(args)
+    httpd = ThreadingHTTPServer((args.host, args.port), make_handler(server))
+    httpd.daemon_threads = True
+    print(f"🧪 Mock model server listening on http://{args.host}:{args.port} "
+          f"({len(server.recorded)} recorded completions loaded)")
+    for role in ROLES:
+        print(f"   - {role}: http://{args.host}:{args.port}/{role}")
+    try:
+        httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        httpd.server_close()
+
+
+if __name__ == "__main__":
+    main()
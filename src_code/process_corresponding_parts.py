@@ -1,4 +1,8 @@
+import hashlib
 import re
+import threading
+import time
+from collections import OrderedDict
 from prompts.General_Extractor_Multi import EXTRACTION_PROMPT_MULTI
 from prompts.General_Extractor_Single import EXTRACTION_PROMPT_SINGLE
 from prompts.Coding_Extractor import EXTRACTION_PROMPT_BY_CODING
@@ -6,34 +10,117 @@ from prompts.Coding_Extractor_Single import EXTRACTION_PROMPT_BY_CODING_SINGLE
 from LLM_APIs.qwen_coder_api import call_coder_model
 from LLM_APIs.qwen_api import call_model
 from utils import txt_to_json, get_json_info_by_key, str_to_lists
+from LLM_APIs.retry import salvaged_texts
+from extraction_sandbox import get_extraction_sandbox
+from tracing import span, item_index
 
 """
 每条数据都会有一个词条叫：corresponding_parts
 """
-def extract_by_coding(code_in_str, model_response):
+
+# 已编译的提取代码：源码sha256 → extract_info_list函数，按最近使用淘汰
+# 同一个DATA文件的item、以及不同轮次之间经常生成完全相同的提取代码，只需编译一次；编译失败的代码不缓存
+CODE_CACHE_SIZE = 1024
+_code_cache = OrderedDict()
+_code_cache_lock = threading.Lock()
+_code_cache_stats = {"hits": 0, "misses": 0, "compile_time": 0.0, "exec_time": 0.0}
+
+
+def load_extraction_function(code_in_str):
+    """编译并加载提取代码中的extract_info_list，按源码哈希缓存，返回(函数或异常, 编译耗时, 是否命中缓存)"""
+    code_hash = hashlib.sha256(code_in_str.encode("utf-8")).hexdigest()
+    with _code_cache_lock:
+        cached = _code_cache.get(code_hash)
+        if cached is not None:
+            _code_cache.move_to_end(code_hash)
+            return cached, 0.0, True
+
+    start_time = time.perf_counter()
+    try:
+        # 每段代码在独立的命名空间中执行，不会覆盖本模块的全局变量；
+        # 顶层import的模块对函数可见，re与之前一样无需导入即可使用
+        namespace = {"re": re}
+        exec(compile(code_in_str, "<extraction_code>", "exec"), namespace)
+        # 从命名空间中获取 extract_info_list 函数
+        loaded = namespace['extract_info_list']
+    except Exception as e:
+        loaded = e
+    compile_time = time.perf_counter() - start_time
+
+    with _code_cache_lock:
+        if not isinstance(loaded, Exception):
+            _code_cache[code_hash] = loaded
+            while len(_code_cache) > CODE_CACHE_SIZE:
+                _code_cache.popitem(last=False)
+        _code_cache_stats["misses"] += 1
+        _code_cache_stats["compile_time"] += compile_time
+    return loaded, compile_time, False
+
+
+def record_sandbox_timing(timing):
+    """把沙箱子进程返回的编译/执行耗时计入本进程的提取代码缓存统计（子进程中的统计主进程看不到）"""
+    if "cache_hit" not in timing:
+        # 任务超时或子进程崩溃，没有耗时信息
+        return
+    with _code_cache_lock:
+        _code_cache_stats["hits" if timing["cache_hit"] else "misses"] += 1
+        _code_cache_stats["compile_time"] += timing["compile_time"]
+        _code_cache_stats["exec_time"] += timing["exec_time"]
+
+
+def get_code_cache_stats():
+    """返回提取代码缓存的命中/编译次数及累计编译、执行耗时"""
+    with _code_cache_lock:
+        return dict(_code_cache_stats, size=len(_code_cache))
+
+
+def extract_by_coding(code_in_str, model_response, timing=None):
+    """执行模型生成的提取代码；传入timing字典时写入本次的编译/执行耗时"""
     code_in_str = re.sub(r'```python(.*?)```', r'\1', code_in_str, flags=re.DOTALL)
+    extract_info_list, compile_time, cache_hit = load_extraction_function(code_in_str)
+    exec_time = 0.0
     try:
-        # 创建一个局部命名空间字典
-        local_namespace = {}
-        # 在局部命名空间中执行代码
-        exec(code_in_str, globals(), local_namespace)
-        # 从局部命名空间中获取 extract_info_list 函数
-        extract_info_list = local_namespace['extract_info_list']
+        if isinstance(extract_info_list, Exception):
+            raise extract_info_list
         # 调用函数并返回结果
-        return extract_info_list(model_response)
+        start_time = time.perf_counter()
+        try:
+            return extract_info_list(model_response)
+        finally:
+            exec_time = time.perf_counter() - start_time
     except Exception as e:
         print("invalid code: ")
         print(code_in_str)
         print(f"提取失败: {e}")
         return "INVALID"
-def extract_content(data, batch_size=5):
-    """
-    重构的内容提取函数，修复了批处理逻辑和潜在的无限循环问题
-    """
-    # 初始化提取结果
+    finally:
+        with _code_cache_lock:
+            if cache_hit:
+                _code_cache_stats["hits"] += 1
+            _code_cache_stats["exec_time"] += exec_time
+        if timing is not None:
+            timing.update({"compile_time": compile_time, "exec_time": exec_time, "cache_hit": cache_hit})
+
+
+def extraction_keys(item):
+    """需要提取的corresponding_parts；增量模式下只提取重新评估的问题用到的部分"""
+    if not any(sub_q.get("_reuse") for sub_q in item["sub_questions"]):
+        return set(item["corresponding_parts"])
+    return {sub_q.get("corresponding_part") for sub_q in item["sub_questions"] if not sub_q.get("_reuse")}
+
+
+def build_extraction_tasks(data):
+    """初始化extraction_results，并为每个需要提取的(item, corresponding_part)生成一个提取任务"""
+    # 初始化提取结果；不需要重新提取的部分保留上一轮的结果
+    keys_by_item = {}
     for item in data:
         if "corresponding_parts" in item:
-            item["extraction_results"] = item["corresponding_parts"].copy()
+            keys = keys_by_item[id(item)] = extraction_keys(item)
+            previous = item.get("extraction_results") or {}
+            item["extraction_results"] = {
+                key: extraction_prompt if key in keys or key not in previous else previous[key]
+                for key, extraction_prompt in item["corresponding_parts"].items()
+            }
     
     # 收集所有需要处理的任务
     all_tasks = []
@@ -42,6 +129,8 @@ def extract_content(data, batch_size=5):
             continue
             
         for key, extraction_prompt in item["corresponding_parts"].items():
+            if key not in keys_by_item[id(item)]:
+                continue
             # 判断任务类型
             is_coding = "#CODE#" in extraction_prompt
             is_JSON = "#JSONSCHEMA#" in extraction_prompt
@@ -74,23 +163,29 @@ def extract_content(data, batch_size=5):
                 'is_list': is_list,
                 'item': item
             })
-    
-    print(f"Total tasks to process: {len(all_tasks)}")
-    
-    # 分离不同类型的任务
+    return all_tasks
+
+
+def split_tasks_by_type(all_tasks):
+    """按类型拆分任务：coding / normal / JSON / LIST"""
     coding_tasks = [task for task in all_tasks if task['is_coding']]
     normal_tasks = [task for task in all_tasks if not task['is_coding'] and not task['is_JSON'] and not task['is_list']]
     json_tasks = [task for task in all_tasks if task['is_JSON']]
     list_tasks = [task for task in all_tasks if task['is_list']]
-    
+    return coding_tasks, normal_tasks, json_tasks, list_tasks
+
+
+def process_local_tasks(json_tasks, list_tasks, data):
+    """处理不需要调用模型的JSON和LIST任务"""
     # 处理JSON任务（不需要调用模型）
     print(f"Processing {len(json_tasks)} JSON tasks...")
     for task in json_tasks:
         try:
-            result = str(get_json_info_by_key(
-                task['item']["model_response"], 
-                task['extraction_prompt'].replace("#JSONSCHEMA#", "")
-            ))
+            with span("extraction_task", "extraction", item=item_index(task['item']), key=task['key'], kind="json"):
+                result = str(get_json_info_by_key(
+                    task['item']["model_response"], 
+                    task['extraction_prompt'].replace("#JSONSCHEMA#", "")
+                ))
             data[task['data_index']]["extraction_results"][task['key']] = [result]
         except Exception as e:
             print(f"JSON extraction failed for task {task['key']}: {e}")
@@ -102,19 +197,101 @@ def extract_content(data, batch_size=5):
         try:
             # 这里需要根据你的具体逻辑来处理LIST类型
             # 假设需要调用 str_to_lists 函数
-            result = str_to_lists(
-                task['item']["model_response"],
-                task['extraction_prompt'].replace("#LISTSCHEMA#", "")
-            )
+            with span("extraction_task", "extraction", item=item_index(task['item']), key=task['key'], kind="list"):
+                result = str_to_lists(
+                    task['item']["model_response"],
+                    task['extraction_prompt'].replace("#LISTSCHEMA#", "")
+                )
             data[task['data_index']]["extraction_results"][task['key']] = result
         except Exception as e:
             print(f"LIST extraction failed for task {task['key']}: {e}")
             data[task['data_index']]["extraction_results"][task['key']] = "INVALID LIST"
+
+
+def store_coding_result(task, data, result, extracted_result):
+    """把提取代码的执行结果写回对应的item
+
+    编译/执行耗时只计入提取代码缓存统计和span，不写入item：结果文件和检查点不含每次运行都不同的值
+    """
+    data[task['data_index']]["extraction_results"][task['key']] = extracted_result
+    data[task['data_index']].setdefault("extraction_code", {})[task['key']] = result
+
+
+def apply_coding_result(task, data, result):
+    """执行模型生成的提取代码，并把结果写回对应的item"""
+    try:
+        timing = {}
+        with span("extraction_task", "extraction", item=item_index(task['item']), key=task['key'], kind="coding") as trace:
+            extracted_result = extract_by_coding(result, task['item']["model_response"], timing)
+            trace.update(timing)
+        store_coding_result(task, data, result, extracted_result)
+    except Exception as e:
+        print(f"    Coding extraction failed for task {task['key']}: {e}")
+        data[task['data_index']]["extraction_results"][task['key']] = "INVALID"
+
+
+def apply_coding_results(tasks, data, results):
+    """执行一批提取代码并写回；启用沙箱时在子进程池中并行执行"""
+    sandbox = get_extraction_sandbox()
+    if sandbox is None:
+        for task, result in zip(tasks, results):
+            apply_coding_result(task, data, result)
+        return
+
+    # 沙箱中的任务并行执行，整批记为一个span
+    with span("extraction_sandbox", "extraction", tasks=len(tasks),
+              items=sorted({item_index(task['item']) for task in tasks}, key=str)) as trace:
+        outputs = sandbox.run([(result, task['item']["model_response"]) for task, result in zip(tasks, results)])
+        timings = [timing for _, timing in outputs]
+        for timing in timings:
+            record_sandbox_timing(timing)
+        trace["cache_hits"] = sum(1 for timing in timings if timing.get("cache_hit"))
+        trace["compile_time"] = sum(timing.get("compile_time", 0.0) for timing in timings)
+        trace["exec_time"] = sum(timing.get("exec_time", 0.0) for timing in timings)
+    for task, result, (extracted_result, _) in zip(tasks, results, outputs):
+        store_coding_result(task, data, result, extracted_result)
+
+
+def apply_normal_result(task, data, result):
+    """解析普通提取任务的模型输出，并把结果写回对应的item"""
+    try:
+        # 转换为JSON格式
+        with span("extraction_task", "extraction", item=item_index(task['item']), key=task['key'], kind="normal"):
+            json_result = txt_to_json(result)
+        
+        if json_result == "ALL":
+            final_result = task['item']["model_response"]
+        else:
+            final_result = json_result
+            
+        data[task['data_index']]["extraction_results"][task['key']] = final_result
+        
+    except Exception as e:
+        print(f"    Normal extraction failed for task {task['key']}: {e}")
+        print(f"    Raw result: {result}")
+        data[task['data_index']]["extraction_results"][task['key']] = "INVALID"
+
+
+def extract_content(data, batch_size=5):
+    """
+    重构的内容提取函数，修复了批处理逻辑和潜在的无限循环问题
+    """
+    all_tasks = build_extraction_tasks(data)
+    print(f"Total tasks to process: {len(all_tasks)}")
+    
+    # 分离不同类型的任务
+    coding_tasks, normal_tasks, json_tasks, list_tasks = split_tasks_by_type(all_tasks)
+    
+    # 处理JSON和LIST任务
+    process_local_tasks(json_tasks, list_tasks, data)
     
     # 批处理CODING任务
     if coding_tasks:
         print(f"Processing {len(coding_tasks)} coding tasks in batches of {batch_size}...")
         process_coding_tasks_in_batches(coding_tasks, data, batch_size)
+        code_stats = get_code_cache_stats()
+        print(f"Extraction code cache: {code_stats['hits']} hits, {code_stats['misses']} compiled "
+              f"(compile {code_stats['compile_time']:.3f}s, exec {code_stats['exec_time']:.3f}s in total)")
     
     # 批处理普通任务
     if normal_tasks:
@@ -133,31 +310,18 @@ def process_coding_tasks_in_batches(coding_tasks, data, batch_size):
         print(f"  Processing coding batch {i//batch_size + 1}/{(len(coding_tasks)-1)//batch_size + 1} ({len(batch_tasks)} tasks)")
         
         try:
-            # 批量调用
+            # 批量调用（客户端已按重试策略重试，只重发失败的prompt）
             batch_results = call_coder_model(batch_prompts)
-            
-            # 处理结果
-            for j, (result, task) in enumerate(zip(batch_results, batch_tasks)):
-                try:
-                    extracted_result = extract_by_coding(result, task['item']["model_response"])
-                    data[task['data_index']]["extraction_results"][task['key']] = extracted_result
-                    data[task['data_index']].setdefault("extraction_code", {})[task['key']] = result
-                except Exception as e:
-                    print(f"    Coding extraction failed for task {task['key']}: {e}")
-                    data[task['data_index']]["extraction_results"][task['key']] = "INVALID"
-                    
         except Exception as e:
             print(f"  Batch coding call failed: {e}")
-            # 回退到逐个处理
-            print("  Falling back to individual processing...")
-            for task in batch_tasks:
-                try:
-                    result = call_coder_model([task['prompt']])[0]
-                    extracted_result = extract_by_coding(result, task['item']["model_response"])
-                    data[task['data_index']]["extraction_results"][task['key']] = extracted_result
-                except Exception as e:
-                    print(f"    Individual coding extraction failed for task {task['key']}: {e}")
-                    data[task['data_index']]["extraction_results"][task['key']] = "INVALID"
+            batch_results = salvaged_texts(e, len(batch_tasks))
+
+        # 处理结果，仍然失败的任务记为INVALID
+        finished = [(task, result) for task, result in zip(batch_tasks, batch_results) if result is not None]
+        apply_coding_results([task for task, _ in finished], data, [result for _, result in finished])
+        for task, result in zip(batch_tasks, batch_results):
+            if result is None:
+                data[task['data_index']]["extraction_results"][task['key']] = "INVALID"
 
 
 def process_normal_tasks_in_batches(normal_tasks, data, batch_size):
@@ -169,47 +333,19 @@ def process_normal_tasks_in_batches(normal_tasks, data, batch_size):
         print(f"  Processing normal batch {i//batch_size + 1}/{(len(normal_tasks)-1)//batch_size + 1} ({len(batch_tasks)} tasks)")
         
         try:
-            # 批量调用
+            # 批量调用（客户端已按重试策略重试，只重发失败的prompt）
             batch_results = call_coder_model(batch_prompts)
-            
-            # 处理结果
-            for result, task in zip(batch_results, batch_tasks):
-                try:
-                    # 转换为JSON格式
-                    json_result = txt_to_json(result)
-                    
-                    if json_result == "ALL":
-                        final_result = task['item']["model_response"]
-                    else:
-                        final_result = json_result
-                        
-                    data[task['data_index']]["extraction_results"][task['key']] = final_result
-                    
-                except Exception as e:
-                    print(f"    Normal extraction failed for task {task['key']}: {e}")
-                    print(f"    Raw result: {result}")
-                    data[task['data_index']]["extraction_results"][task['key']] = "INVALID"
-                    
         except Exception as e:
             print(f"  Batch normal call failed: {e}")
-            # 回退到逐个处理
-            print("  Falling back to individual processing...")
-            for task in batch_tasks:
-                try:
-                    result = call_coder_model([task['prompt']])[0]
-                    json_result = txt_to_json(result)
-                    
-                    if json_result == "ALL":
-                        final_result = task['item']["model_response"]
-                    else:
-                        final_result = json_result
-                        
-                    data[task['data_index']]["extraction_results"][task['key']] = final_result
-                    
-                except Exception as e:
-                    print(f"    Individual normal extraction failed for task {task['key']}: {e}")
-                    data[task['data_index']]["extraction_results"][task['key']] = "INVALID"
-                    
+            batch_results = salvaged_texts(e, len(batch_tasks))
+
+        # 处理结果，仍然失败的任务记为INVALID
+        for result, task in zip(batch_results, batch_tasks):
+            if result is None:
+                data[task['data_index']]["extraction_results"][task['key']] = "INVALID"
+            else:
+                apply_normal_result(task, data, result)
+
 # def extract_content(data, batch_size=BATCH_SIZE):
 #     for item in data:
 #         if "corresponding_parts" in item:
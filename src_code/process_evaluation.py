@@ -1,6 +1,10 @@
 import re
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 from prompts.General_Evaluator import EVALUATION_PROMPT
 from LLM_APIs.qwen_api import call_model
+from LLM_APIs.retry import salvaged_texts
+from tracing import span, item_index
 
 # 查看依赖项
 def check_dependencies(sub_question, item):
@@ -10,92 +14,208 @@ def check_dependencies(sub_question, item):
                 return False
     return True
 
-def model_evaluation(sub_questions):
-    # try:
-        # 为每个sub_question准备prompt
-    prompts = [EVALUATION_PROMPT.format(
+def build_evaluation_prompt(sub_q):
+    """为单个sub_question准备裁判模型的prompt"""
+    return EVALUATION_PROMPT.format(
         input=sub_q['_item']["question"],
         output=sub_q['_item']["model_response"],
         question=sub_q["question"]
-    ) for sub_q in sub_questions]
+    )
+
+def apply_evaluation_result(sub_question, raw_res):
+    """解析裁判模型的输出，写回sub_question"""
+    try:
+        re_result = re.findall(r'判断：是|判断：否', raw_res)
+        if "是" in re_result[0]:
+            sub_question["eval_result"] = 1
+        else:
+            sub_question["eval_result"] = 0
+        sub_question["eval_explanation"] = raw_res
+    except Exception as e:
+        sub_question["eval_result"] = 0
+        sub_question["eval_explanation"] = str(e)
+    sub_question["eval_method"] = "pure model evaluation"
+
+def model_evaluation(sub_questions):
+    # 为每个sub_question准备prompt
+    prompts = [build_evaluation_prompt(sub_q) for sub_q in sub_questions]
     
-    # 批量调用模型
-    raw_results = call_model(prompts)
+    # 批量调用模型（客户端已按重试策略重试，只重发失败的prompt）
+    try:
+        with span("judge_batch", "judge", questions=len(sub_questions),
+                  items=sorted({item_index(sub_q['_item']) for sub_q in sub_questions}, key=str)):
+            raw_results = call_model(prompts)
+    except Exception as e:
+        print(f"Batch evaluation call failed: {e}")
+        raw_results = salvaged_texts(e, len(prompts))
+        error = str(e)
     
-    # 处理每个结果
+    # 处理每个结果，仍然失败的问题记为不通过
     for sub_question, raw_res in zip(sub_questions, raw_results):
-        try:
-            re_result = re.findall(r'判断：是|判断：否', raw_res)
-            if "是" in re_result[0]:
-                sub_question["eval_result"] = 1
-            else:
-                sub_question["eval_result"] = 0
-            sub_question["eval_explanation"] = raw_res
-        except Exception as e:
+        if raw_res is None:
             sub_question["eval_result"] = 0
-            sub_question["eval_explanation"] = str(e)
-        sub_question["eval_method"] = "pure model evaluation"
+            sub_question["eval_explanation"] = error
+            sub_question["eval_method"] = "pure model evaluation"
+        else:
+            apply_evaluation_result(sub_question, raw_res)
             
     return sub_questions
 
 def get_mixed_evaluation(sub_questions, rule_based_evaluate_func):
     """使用传入的rule_based_evaluate函数进行评估"""
     for sub_q in sub_questions:
-        item = sub_q["_item"]
-        if sub_q['rule'].startswith("SCHEMA"):
-            # SCHEMA规则返回多个验证点的列表，直接赋值给eval_result
-            sub_q["eval_result"] = rule_based_evaluate_func(
+        with span("rule_eval", "rule", item=item_index(sub_q["_item"]), point_id=sub_q["point_id"],
+                  rule=sub_q["rule"]):
+            evaluate_rule(sub_q, rule_based_evaluate_func)
+    return sub_questions
+
+def evaluate_rule(sub_q, rule_based_evaluate_func):
+    """对单个带rule的sub_question执行规则评估"""
+    item = sub_q["_item"]
+    if sub_q['rule'].startswith("SCHEMA"):
+        # SCHEMA规则返回多个验证点的列表，直接赋值给eval_result
+        sub_q["eval_result"] = rule_based_evaluate_func(
+            item, 
+            sub_q["rule"], 
+            item["model_response"]
+        )
+        sub_q["eval_method"] = "rule evaluation"
+    else:
+        corresponding_part = item["extraction_results"][sub_q["corresponding_part"]]
+        if corresponding_part == "INVALID":  # 抓取的部分有问题这样
+            sub_q["eval_result"] = 0
+            sub_q['eval_explanation'] = "MODEL ERROR"
+        else:
+            # print(sub_q["question"], sub_q["rule"], corresponding_part)
+            sub_q["eval_result"], sub_q['eval_explanation'] = rule_based_evaluate_func(
                 item, 
                 sub_q["rule"], 
-                item["model_response"]
+                corresponding_part
             )
-            sub_q["eval_method"] = "rule evaluation"
-        else:
-            corresponding_part = item["extraction_results"][sub_q["corresponding_part"]]
-            if corresponding_part == "INVALID":  # 抓取的部分有问题这样
-                sub_q["eval_result"] = 0
-                sub_q['eval_explanation'] = "MODEL ERROR"
+                
+        sub_q["eval_method"] = "rule evaluation"
+
+def build_item_graph(item):
+    """建立单个item的依赖图，返回(pending_deps, dependents, roots, missing)
+
+    pending_deps: {id(sub_q): 已存在的依赖数}
+    dependents:   {id(sub_q): 依赖它的sub_question列表}
+    roots:        没有（已存在的）依赖的sub_question
+    missing:      [(point_id, dep_id)]，dep中引用了不存在的point_id
+    """
+    # point_id → sub_question 索引，避免每个依赖都扫描整个item
+    index = {}
+    for sub_q in item["sub_questions"]:
+        sub_q["_item"] = item
+        index.setdefault(sub_q["point_id"], []).append(sub_q)
+
+    pending_deps = {}
+    dependents = {}
+    roots = []
+    missing = []
+    for sub_q in item["sub_questions"]:
+        deps = []
+        for dep_id in sub_q["dep"]:
+            if dep_id in index:
+                deps.extend(index[dep_id])
             else:
-                # print(sub_q["question"], sub_q["rule"], corresponding_part)
-                sub_q["eval_result"], sub_q['eval_explanation'] = rule_based_evaluate_func(
-                    item, 
-                    sub_q["rule"], 
-                    corresponding_part
-                )
-                    
-            sub_q["eval_method"] = "rule evaluation"
-    return sub_questions
+                # 不存在的依赖id视为已满足，与原有行为一致
+                missing.append((sub_q["point_id"], dep_id))
+        pending_deps[id(sub_q)] = len(deps)
+        for dep_q in deps:
+            dependents.setdefault(id(dep_q), []).append(sub_q)
+        if not deps:
+            roots.append(sub_q)
+    return pending_deps, dependents, roots, missing
 
-def get_dependency_level(questions_dict, sub_q):
-    """获取问题的依赖层级"""
-    if not sub_q["dep"]:
-        return 0
-    
-    max_dep_level = 0
-    for dep_id in sub_q["dep"]:
-        # 找到这个依赖对应的问题
-        for q in questions_dict[id(sub_q["_item"])]:
-            if q["point_id"] == dep_id:
-                dep_level = get_dependency_level(questions_dict, q)
-                max_dep_level = max(max_dep_level, dep_level)
-    
-    return max_dep_level + 1
+def compute_dependency_levels(item):
+    """对单个item的依赖图做一次拓扑排序，O(V+E)
+
+    层级定义与原递归实现一致：没有依赖为0，否则为已存在依赖的最大层级+1。
+    返回(levels, missing, cyclic)，levels为{id(sub_q): level}，
+    cyclic为处于依赖环上（或依赖了环）而无法确定层级的point_id列表。
+    """
+    pending_deps, dependents, roots, missing = build_item_graph(item)
+    pending_deps = dict(pending_deps)
+    max_dep_level = {}
+    levels = {}
+    queue = deque(roots)
+    while queue:
+        sub_q = queue.popleft()
+        level = max_dep_level.get(id(sub_q), 0) + 1 if sub_q["dep"] else 0
+        levels[id(sub_q)] = level
+        for dependent in dependents.get(id(sub_q), []):
+            max_dep_level[id(dependent)] = max(max_dep_level.get(id(dependent), 0), level)
+            pending_deps[id(dependent)] -= 1
+            if pending_deps[id(dependent)] == 0:
+                queue.append(dependent)
+
+    cyclic = [sub_q["point_id"] for sub_q in item["sub_questions"] if id(sub_q) not in levels]
+    return levels, missing, cyclic
+
+def report_dependency_problems(index, missing, cyclic):
+    """打印单个item的依赖问题"""
+    for point_id, dep_id in missing:
+        print(f"⚠️  Item {index}: sub-question {point_id} depends on missing point_id {dep_id}, treated as satisfied")
+    if cyclic:
+        print(f"❌ Item {index}: dependency cycle among point_ids {cyclic}, marked as failed")
+
+def mark_cyclic_failed(sub_q):
+    """依赖成环的问题无法评估，标记为依赖失败"""
+    sub_q["eval_result"] = 0
+    sub_q["eval_explanation"] = "Dependencies failed (cyclic dependency)"
+    sub_q["eval_method"] = "dependency check"
+
+def _reusable(sub_q, keep):
+    """上一轮的结果能否在本轮沿用：已通过，且keep="judge"时只沿用裁判模型的判定"""
+    if sub_q.get("eval_result") != 1:
+        return False
+    return keep == "all" or sub_q.get("eval_method") == "pure model evaluation"
+
+def plan_incremental(items, keep="all"):
+    """增量模式：标记上一轮已通过、本轮沿用结果的sub_question（_reuse），返回(沿用数, 重新评估数)
+
+    keep="all"：沿用所有通过的结果；keep="judge"：只沿用裁判模型判定通过的结果，规则评估在新回复上重新执行。
+    不沿用的问题以及（传递地）依赖它们的问题都重新评估，因此沿用的问题的依赖也都是沿用的。
+    含SCHEMA规则的item整体重新评估：fix_json_data会重写它的验证点。
+    """
+    kept = reevaluated = 0
+    for item in items:
+        sub_questions = item["sub_questions"]
+        if any(str(sub_q.get("rule") or "").startswith("SCHEMA") for sub_q in sub_questions):
+            reevaluated += len(sub_questions)
+            continue
+        _, dependents, _, _ = build_item_graph(item)
+        stale = deque(sub_q for sub_q in sub_questions if not _reusable(sub_q, keep))
+        rerun = set()
+        while stale:
+            sub_q = stale.popleft()
+            if id(sub_q) in rerun:
+                continue
+            rerun.add(id(sub_q))
+            stale.extend(dependents.get(id(sub_q), []))
+        for sub_q in sub_questions:
+            if id(sub_q) in rerun:
+                reevaluated += 1
+            else:
+                sub_q["_reuse"] = True
+                kept += 1
+    return kept, reevaluated
 
 def collect_questions_by_level(items):
-    """按依赖层级收集问题"""
-    # 使用id()作为键来建立映射
-    # print(items)
-    questions_dict = {id(item): item["sub_questions"] for item in items}
-    
-    # 为每个问题添加所属的item引用并确定其层级
+    """按依赖层级收集问题，依赖环和缺失的依赖id在处理前统一报告"""
     questions_by_level = {}
     total_questions = 0
     
-    for item in items:
+    for index, item in enumerate(items):
+        levels, missing, cyclic = compute_dependency_levels(item)
+        report_dependency_problems(index, missing, cyclic)
         for sub_q in item["sub_questions"]:
             total_questions += 1
-            sub_q["_item"] = item
-            level = get_dependency_level(questions_dict, sub_q)
+            level = levels.get(id(sub_q))
+            if level is None:
+                mark_cyclic_failed(sub_q)
+                continue
             if level not in questions_by_level:
                 questions_by_level[level] = []
             questions_by_level[level].append(sub_q)
@@ -106,10 +226,22 @@ def collect_questions_by_level(items):
     
     return questions_by_level
 
-def process_all_items(items, batch_size=5, rule_based_evaluate_func=None):
+def process_all_items(items, batch_size=5, rule_based_evaluate_func=None, scheduler="dag", max_inflight=4):
+    """评估所有item的sub_questions
+
+    scheduler="dag"：每个sub_question在自身依赖完成后立即调度（默认）
+    scheduler="level"：所有item按依赖层级逐层处理，上一层全部完成后才处理下一层
+    """
+    if scheduler == "dag":
+        return process_all_items_dag(items, batch_size, rule_based_evaluate_func, max_inflight)
+    if scheduler != "level":
+        raise ValueError(f"Unknown scheduler: {scheduler}")
+    return process_all_items_by_level(items, batch_size, rule_based_evaluate_func)
+
+def process_all_items_by_level(items, batch_size=5, rule_based_evaluate_func=None):
     print(f"Starting to process {len(items)} items...")
     questions_by_level = collect_questions_by_level(items)
-    max_level = max(questions_by_level.keys())
+    max_level = max(questions_by_level.keys(), default=-1)
     
     # 保存原始的item引用关系
     original_items = {id(item): item for item in items}
@@ -125,9 +257,11 @@ def process_all_items(items, batch_size=5, rule_based_evaluate_func=None):
             batch = level_questions[i:i+batch_size]
             valid_batch = []
             
-            # 检查依赖
+            # 检查依赖（增量模式下沿用上一轮结果的问题直接跳过）
             for sub_q in batch:
-                if level == 0 or check_dependencies(sub_q, sub_q["_item"]):
+                if sub_q.get("_reuse"):
+                    processed_count += 1
+                elif level == 0 or check_dependencies(sub_q, sub_q["_item"]):
                     valid_batch.append(sub_q)
                 else:
                     sub_q["eval_result"] = 0
@@ -155,15 +289,107 @@ def process_all_items(items, batch_size=5, rule_based_evaluate_func=None):
                     item_id = id(sub_q["_item"])
                     sub_q["_item"] = original_items[item_id]
     
-    # 最后清理所有临时添加的item引用
+    finalize_items(items)
+
+    print("\nProcessing completed!")
+
+    return items
+
+def build_dependency_graph(items):
+    """合并所有item的依赖图，返回(pending_deps, dependents, ready)；依赖问题在处理前统一报告"""
+    pending_deps = {}
+    dependents = {}
+    ready = deque()
+    for index, item in enumerate(items):
+        item_pending, item_dependents, roots, missing = build_item_graph(item)
+        _, _, cyclic = compute_dependency_levels(item)
+        report_dependency_problems(index, missing, cyclic)
+        pending_deps.update(item_pending)
+        dependents.update(item_dependents)
+        ready.extend(roots)
+    return pending_deps, dependents, ready
+
+def process_all_items_dag(items, batch_size=5, rule_based_evaluate_func=None, max_inflight=4):
+    """按每个sub_question自身的依赖调度评估
+
+    规则评估和依赖检查在依赖完成后立即执行；需要裁判模型的问题进入就绪队列，
+    按batch_size打包后提交，最多max_inflight个批次同时在途。
+    任一批次返回后立即释放其下游问题，不再等待整层完成。
+    """
+    print(f"Starting to process {len(items)} items...")
+    pending_deps, dependents, ready = build_dependency_graph(items)
+    total_questions = len(pending_deps)
+    print(f"Total questions: {total_questions}")
+
+    llm_ready = deque()
+    inflight = {}
+    processed_count = 0
+    batch_count = 0
+
+    def resolve(sub_q):
+        for dependent in dependents.get(id(sub_q), []):
+            pending_deps[id(dependent)] -= 1
+            if pending_deps[id(dependent)] == 0:
+                ready.append(dependent)
+
+    with ThreadPoolExecutor(max_workers=max(1, max_inflight)) as executor:
+        while ready or llm_ready or inflight:
+            # 依赖已完成的问题：依赖检查和规则评估直接在本线程完成
+            while ready:
+                sub_q = ready.popleft()
+                if sub_q.get("_reuse"):
+                    # 增量模式下沿用上一轮的结果
+                    pass
+                elif sub_q["dep"] and not check_dependencies(sub_q, sub_q["_item"]):
+                    sub_q["eval_result"] = 0
+                    sub_q["eval_explanation"] = "Dependencies failed"
+                    sub_q["eval_method"] = "dependency check"
+                    print("Question marked as failed due to dependencies")
+                elif sub_q.get("rule") is not None:
+                    get_mixed_evaluation([sub_q], rule_based_evaluate_func)
+                else:
+                    llm_ready.append(sub_q)
+                    continue
+                processed_count += 1
+                resolve(sub_q)
+
+            # 就绪的裁判模型问题按batch_size打包提交
+            while llm_ready and len(inflight) < max(1, max_inflight):
+                batch = [llm_ready.popleft() for _ in range(min(batch_size, len(llm_ready)))]
+                batch_count += 1
+                inflight[executor.submit(model_evaluation, batch)] = batch
+
+            if not inflight:
+                continue
+
+            done, _ = wait(inflight, return_when=FIRST_COMPLETED)
+            for future in done:
+                batch = inflight.pop(future)
+                future.result()
+                processed_count += len(batch)
+                for sub_q in batch:
+                    resolve(sub_q)
+            print(f"Processed {processed_count}/{total_questions} questions ({batch_count} judge batches sent)")
+
+    # 依赖成环的问题永远不会就绪，标记为依赖失败
+    for item in items:
+        for sub_q in item["sub_questions"]:
+            if pending_deps.get(id(sub_q), 0) > 0:
+                mark_cyclic_failed(sub_q)
+
+    finalize_items(items)
+
+    print("\nProcessing completed!")
+
+    return items
+
+def finalize_items(items):
+    """清理临时添加的item引用和增量标记，并展开SCHEMA规则的结果"""
     for item in items:
         for sub_q in item["sub_questions"]:
             if "_item" in sub_q:
                 del sub_q["_item"]
+            sub_q.pop("_reuse", None)
             # 关键：SCHEMA规则的特殊处理，直接用eval_result替换sub_questions
             if sub_q.get("rule") == "SCHEMA:json_schema" and isinstance(sub_q.get("eval_result"), list):
                 item["sub_questions"] = sub_q["eval_result"] + item["sub_questions"][1:]
-
-    print("\nProcessing completed!")
-
-    return items
@@ -0,0 +1,207 @@
+"""
+按轮次增量保存评估结果
+每一轮只保存本轮评估（或重新评估）过的item：item评估完成后立即追加写入 output_dir/round_N.jsonl，
+每行为 {"index": 下标, "item": {...}}，index是item在完整数据集中的位置（按item_id查找），
+同一下标出现多次时以最后一行为准。
+一轮结束时补写本轮中尚未写入的item（例如从检查点恢复的item），再写出索引 round_N.manifest.json：
+记录数据集大小，以及本轮每个改变了的下标在round_N.jsonl中最后一条记录的字节偏移。
+
+第N轮的完整结果 = 第1轮到第N轮的增量依次覆盖，用 load_round() 按需重建，
+load_item() 只读取单个item在该轮生效的那一条记录。
+
+断点续跑时round_N.jsonl同时充当评估阶段的检查点：已写入的item直接恢复，不再重新评估。
+"""
+
+import json
+import os
+import re
+import threading
+import time
+
+from dataset import item_key
+
+RESULTS_FILE = "round_{round_num}.jsonl"
+MANIFEST_FILE = "round_{round_num}.manifest.json"
+
+
+class ResultWriter:
+    """一轮评估结果的增量写入器，可以在多个线程中调用write()"""
+
+    def __init__(self, output_dir, round_num, positions, round_items, resume=False):
+        """positions为 item_key → 数据集下标，round_items为本轮评估的item，只有它们会写入本轮的结果文件
+
+        resume为True时保留结果文件中已写入的记录，之后的记录继续追加，用restore()恢复这些item
+        """
+        self.output_dir = output_dir
+        self.round_num = round_num
+        self.path = os.path.join(output_dir, RESULTS_FILE.format(round_num=round_num))
+        self._positions = positions
+        self._round_items = round_items
+        self._written = {}
+        self._offsets = {}
+        self._offset = 0
+        self.records = 0
+        self.streamed = 0
+        self._resumed = self._load_written() if resume else {}
+        self._file = open(self.path, "a" if resume else "w", encoding="utf-8")
+        self._lock = threading.Lock()
+
+    def _load_written(self):
+        """读取上次运行已写入的记录（下标 → item），截掉中断时没写完整的最后一行"""
+        records = {}
+        if not os.path.exists(self.path):
+            return records
+        with open(self.path, "rb") as f:
+            for line in f:
+                if not line.endswith(b"\n"):
+                    break
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    break
+                records[record["index"]] = record["item"]
+                self._offsets[record["index"]] = self._offset
+                self._offset += len(line)
+                self.records += 1
+        with open(self.path, "r+b") as f:
+            f.truncate(self._offset)
+        return records
+
+    def restore(self):
+        """把上次运行已写入本轮结果文件的item写回round_items，返回仍需评估的item列表"""
+        pending = []
+        for item in self._round_items:
+            index = self._positions[item_key(item)]
+            record = self._resumed.get(index)
+            if record is None or item_key(record) != item_key(item):
+                pending.append(item)
+                continue
+            item.update(record)
+            self._written[index] = id(item)
+        restored = len(self._round_items) - len(pending)
+        if restored:
+            print(f"♻️  Restored {restored}/{len(self._round_items)} evaluated items from {self.path}")
+        return pending
+
+    def _write_record(self, index, item):
+        line = json.dumps({"index": index, "item": item}, ensure_ascii=False, default=str) + "\n"
+        self._file.write(line)
+        self._written[index] = id(item)
+        self._offsets[index] = self._offset
+        self._offset += len(line.encode("utf-8"))
+        self.records += 1
+
+    def write(self, items):
+        """写入一批已完成评估的item"""
+        with self._lock:
+            for item in items:
+                index = self._positions.get(item_key(item))
+                if index is not None:
+                    self._write_record(index, item)
+                    self.streamed += 1
+            self._file.flush()
+
+    def finish(self):
+        """补写本轮中尚未写入的item，关闭结果文件并写出索引，返回索引（只遍历本轮的item）"""
+        with self._lock:
+            for item in self._round_items:
+                index = self._positions[item_key(item)]
+                if self._written.get(index) != id(item):
+                    self._write_record(index, item)
+            self._file.close()
+
+        manifest = {
+            "round": self.round_num,
+            "results": os.path.basename(self.path),
+            "items": len(self._positions),
+            "records": self.records,
+            "streamed": self.streamed,
+            "changed": len(self._offsets),
+            "offsets": {str(index): offset for index, offset in sorted(self._offsets.items())},
+            "finished_at": time.time()
+        }
+        with open(manifest_path(self.output_dir, self.round_num), "w", encoding="utf-8") as f:
+            json.dump(manifest, f, ensure_ascii=False)
+        return manifest
+
+
+def manifest_path(output_dir, round_num):
+    return os.path.join(output_dir, MANIFEST_FILE.format(round_num=round_num))
+
+
+def load_manifest(output_dir, round_num):
+    """读取一轮的索引；该轮没有正常结束时抛出ValueError"""
+    path = manifest_path(output_dir, round_num)
+    if not os.path.exists(path):
+        raise ValueError(f"Round {round_num} has no manifest in {output_dir} (the round did not finish)")
+    with open(path, "r", encoding="utf-8") as f:
+        manifest = json.load(f)
+    manifest["offsets"] = {int(index): offset for index, offset in manifest["offsets"].items()}
+    return manifest
+
+
+def _read_record(f, offset):
+    f.seek(offset)
+    return json.loads(f.readline())["item"]
+
+
+def _locate(output_dir, round_num, indices=None):
+    """从第round_num轮往前查找每个下标生效的记录，返回(数据集大小, {round: {index: offset}})"""
+    size = load_manifest(output_dir, round_num)["items"]
+    pending = set(range(size)) if indices is None else set(indices)
+    located = {}
+    for past_round in range(round_num, 0, -1):
+        if not pending:
+            break
+        offsets = load_manifest(output_dir, past_round)["offsets"]
+        found = {index: offsets[index] for index in pending if index in offsets}
+        if found:
+            located[past_round] = found
+            pending -= found.keys()
+    if pending:
+        raise ValueError(f"Items {sorted(pending)[:10]} have no record up to round {round_num} in {output_dir}")
+    return size, located
+
+
+def load_round(output_dir, round_num):
+    """重建第round_num轮结束时的完整结果（按数据集顺序的item列表）"""
+    size, located = _locate(output_dir, round_num)
+    items = [None] * size
+    for past_round, offsets in located.items():
+        with open(os.path.join(output_dir, RESULTS_FILE.format(round_num=past_round)), "rb") as f:
+            # 按偏移顺序读取，顺序扫过结果文件
+            for index, offset in sorted(offsets.items(), key=lambda entry: entry[1]):
+                items[index] = _read_record(f, offset)
+    return items
+
+
+def load_item(output_dir, round_num, index):
+    """只读取第index个item在第round_num轮结束时的结果"""
+    _, located = _locate(output_dir, round_num, [index])
+    (past_round, offsets), = located.items()
+    with open(os.path.join(output_dir, RESULTS_FILE.format(round_num=past_round)), "rb") as f:
+        return _read_record(f, offsets[index])
+
+
+def load_results(path):
+    """读取一轮的完整结果：round_N.jsonl（按索引与之前各轮的增量合并）或round_N.json（完整列表）"""
+    match = re.search(r'round_(\d+)\.jsonl$', path)
+    if match is None:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    return load_round(os.path.dirname(path) or ".", int(match.group(1)))
+
+
+if __name__ == "__main__":
+    # 把增量结果合并成完整的round_N.json
+    import sys
+    if len(sys.argv) not in (3, 4):
+        print("Usage: python result_writer.py <output_dir> <round_num> [output_file]")
+        sys.exit(1)
+
+    output_dir = sys.argv[1]
+    round_num = int(sys.argv[2])
+    output_file = sys.argv[3] if len(sys.argv) == 4 else os.path.join(output_dir, f"round_{round_num}.json")
+    with open(output_file, "w", encoding="utf-8") as f:
+        json.dump(load_round(output_dir, round_num), f, ensure_ascii=False, indent=4)
+    print(f"💾 Complete results of round {round_num} saved to: {output_file}")
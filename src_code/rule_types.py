@@ -0,0 +1,11 @@
+"""
+规则名的公共工具，供数据集索引、运行指标和基准测试共用
+"""
+
+import re
+
+
+def rule_type(rule):
+    """规则类型：规则名开头的字母和下划线部分，例如 word_freq3:[...] → word_freq"""
+    match = re.match(r'[A-Za-z_]+', rule or "")
+    return match.group(0) if match else "unknown"
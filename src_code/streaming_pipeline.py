@@ -0,0 +1,172 @@
+"""
+跨阶段流水线评估
+被测模型响应 → 对应部分提取 → 规则/模型评估 三个阶段各占一个线程，
+阶段之间用有界队列连接：每个批次的响应一返回就进入提取，提取完成就进入评估，
+三个模型服务不再轮流空闲。每个阶段复用原有的extract_content / process_all_items，
+因此轮次输出与分阶段模式一致。
+"""
+
+import queue
+import threading
+import time
+
+from LLM_APIs.tested_model_api import call_tested_model
+from LLM_APIs.retry import salvaged_texts
+from process_corresponding_parts import extract_content
+from process_evaluation import process_all_items
+
+# 队列结束标记
+_END = object()
+
+
+def _take_batch(in_queue, batch_size):
+    """阻塞等待第一个item，再把队列中已就绪的item凑成最多batch_size个；读到结束标记时返回(batch, True)"""
+    first = in_queue.get()
+    if first is _END:
+        return [], True
+    batch = [first]
+    while len(batch) < batch_size:
+        try:
+            item = in_queue.get_nowait()
+        except queue.Empty:
+            break
+        if item is _END:
+            return batch, True
+        batch.append(item)
+    return batch, False
+
+
+class _Stage(threading.Thread):
+    """流水线中的一个阶段：从in_queue取批次，处理后把item逐个放入out_queue"""
+
+    def __init__(self, name, process_func, in_queue, out_queue, batch_size):
+        super().__init__(name=name, daemon=True)
+        self.process_func = process_func
+        self.in_queue = in_queue
+        self.out_queue = out_queue
+        self.batch_size = batch_size
+        self.error = None
+        self.processed = 0
+
+    def run(self):
+        finished = False
+        while not finished:
+            batch, finished = _take_batch(self.in_queue, self.batch_size)
+            if not batch or self.error is not None:
+                # 出错后继续消费上游数据，避免上游阻塞在put上
+                continue
+            try:
+                batch = self.process_func(batch)
+                self.processed += len(batch)
+            except Exception as e:
+                print(f"❌ Pipeline stage '{self.name}' failed: {e}")
+                self.error = e
+                continue
+            if self.out_queue is not None:
+                for item in batch:
+                    self.out_queue.put(item)
+        if self.out_queue is not None:
+            self.out_queue.put(_END)
+
+
+def _produce_responses(data, batch_size, out_queue, errors, restored=(), on_batch_done=None):
+    """第一阶段：按批次调用被测模型，每个批次返回后立即把item送入下游
+
+    restored中的item已从检查点恢复了响应，直接送入下游；on_batch_done不为空时用每批成功获取响应的item回调
+    """
+    restored = {id(item) for item in restored}
+    pending = [item for item in data if id(item) not in restored]
+    total_items = len(pending)
+    try:
+        for item in data:
+            if id(item) in restored:
+                out_queue.put(item)
+        for batch_start in range(0, total_items, batch_size):
+            batch_end = min(batch_start + batch_size, total_items)
+            current_batch = pending[batch_start:batch_end]
+            print(f"📊 Processing items {batch_start}-{batch_end-1} out of {total_items} total items...")
+            try:
+                batch_questions = [item["question"] for item in current_batch]
+                batch_responses = call_tested_model(batch_questions)
+            except Exception as e:
+                print(f"❌ Error occurred while processing batch {batch_start}-{batch_end-1}: {str(e)}")
+                batch_responses = salvaged_texts(e, len(current_batch))
+            # 失败的item写入空响应，保证下游阶段都有model_response
+            for item, response in zip(current_batch, batch_responses):
+                item["model_response"] = response if response is not None else ""
+            if on_batch_done is not None:
+                on_batch_done([item for item, response in zip(current_batch, batch_responses) if response is not None])
+            for item in current_batch:
+                out_queue.put(item)
+    except Exception as e:
+        errors.append(e)
+    finally:
+        out_queue.put(_END)
+
+
+def run_round_pipelined(current_data, batch_size, rule_based_evaluate_func, round_num, queue_size=None,
+                        scheduler="dag", judge_inflight=4, on_items_done=None, checkpoint=None):
+    """流水线方式执行一轮评估，返回(结果, 耗时)；on_items_done不为空时每批item评估完成后立即回调
+
+    传入checkpoint时每批item的响应和提取结果完成后立即持久化，已持久化的item跳过对应阶段
+    """
+    queue_size = queue_size or batch_size * 2
+    extraction_queue = queue.Queue(maxsize=queue_size)
+    evaluation_queue = queue.Queue(maxsize=queue_size)
+
+    start_time = time.time()
+    print(f"🔄 Round {round_num} Processing Started (pipelined, queue size {queue_size})")
+
+    response_restored = []
+    extraction_pending = None
+    if checkpoint is not None:
+        # 重新获取响应的item也要重新提取
+        response_pending = checkpoint.restore(current_data, round_num, "response")
+        pending_ids = {id(item) for item in response_pending}
+        response_restored = [item for item in current_data if id(item) not in pending_ids]
+        extraction_pending = {id(item) for item in checkpoint.restore(
+            current_data, round_num, "extraction", skip=response_pending
+        )}
+
+    def extract(batch):
+        pending = batch if extraction_pending is None else [item for item in batch if id(item) in extraction_pending]
+        if pending:
+            extract_content(pending, batch_size)
+            if checkpoint is not None:
+                checkpoint.record(pending, round_num, "extraction")
+        return batch
+
+    extraction_stage = _Stage("extraction", extract, extraction_queue, evaluation_queue, batch_size)
+    def evaluate(batch):
+        batch = process_all_items(
+            batch, batch_size, rule_based_evaluate_func,
+            scheduler=scheduler, max_inflight=judge_inflight
+        )
+        if on_items_done is not None:
+            on_items_done(batch)
+        return batch
+
+    evaluation_stage = _Stage("evaluation", evaluate, evaluation_queue, None, batch_size)
+    extraction_stage.start()
+    evaluation_stage.start()
+
+    producer_errors = []
+    _produce_responses(
+        current_data, batch_size, extraction_queue, producer_errors, response_restored,
+        (lambda batch: checkpoint.record(batch, round_num, "response")) if checkpoint is not None else None
+    )
+
+    extraction_stage.join()
+    evaluation_stage.join()
+    end_time = time.time()
+
+    for error in producer_errors + [extraction_stage.error, evaluation_stage.error]:
+        if error is not None:
+            raise error
+
+    print(f"✅ Pipelined round finished: {evaluation_stage.processed}/{len(current_data)} items evaluated")
+    print(f"⏱️  Time taken: {end_time - start_time:.2f} seconds")
+    print()
+
+    # 所有阶段都是原地修改item，原列表即为最终结果（顺序不变）
+    return current_data, end_time - start_time
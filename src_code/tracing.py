@@ -0,0 +1,177 @@
+"""
+分阶段计时追踪
+模型请求、提取任务、规则评估、统计计算等都包在span中，每个span结束时写入一行JSONL：
+{"name", "cat", "start", "duration", "thread", "args": {item, rule, batch_id, ...}}
+可选同时导出Chrome trace格式（chrome://tracing 或 Perfetto 打开），查看一轮评估的时间都花在哪里。
+其他模块（如metrics）可以注册span监听器，在每个span结束时收到 (name, category, duration, args)。
+未启用追踪且没有监听器时span只是空操作。
+"""
+
+import itertools
+import json
+import threading
+import time
+from contextlib import contextmanager
+
+# 当前启用的追踪器（None表示不追踪），通过 enable_tracing() 设置
+_tracer = None
+
+# span结束时调用的监听器，通过 add_span_listener() 注册
+_listeners = []
+
+# 模型请求批次编号，重试的请求沿用同一个编号
+_batch_ids = itertools.count(1)
+
+
+class Tracer:
+    """把span写入JSONL文件，需要时在结束时导出Chrome trace"""
+
+    def __init__(self, path, chrome_path=None):
+        self.path = path
+        self.chrome_path = chrome_path
+        self.spans = 0
+        self.totals = {}
+        self._file = open(path, "w", encoding="utf-8")
+        self._events = [] if chrome_path else None
+        self._item_indices = {}
+        self._origin = time.perf_counter()
+        self._wall_origin = time.time()
+        self._lock = threading.Lock()
+
+    def emit(self, name, category, start, duration, args):
+        """写入一个span；start为time.perf_counter()的读数"""
+        event = {
+            "name": name,
+            "cat": category,
+            "start": self._wall_origin + (start - self._origin),
+            "duration": duration,
+            "thread": threading.current_thread().name,
+            "args": args
+        }
+        line = json.dumps(event, ensure_ascii=False, default=str)
+        with self._lock:
+            self._file.write(line + "\n")
+            self.spans += 1
+            count, total = self.totals.get(name, (0, 0.0))
+            self.totals[name] = (count + 1, total + duration)
+            if self._events is not None:
+                self._events.append((name, category, start - self._origin, duration, line))
+
+    def index_items(self, items):
+        """记录本轮item的下标，span中用item_index()查询"""
+        with self._lock:
+            self._item_indices = {id(item): index for index, item in enumerate(items)}
+
+    def item_index(self, item):
+        return self._item_indices.get(id(item))
+
+    def _write_chrome_trace(self):
+        """导出Chrome trace：同一类别中时间重叠的span（并发请求、异步任务）分到不同的行"""
+        trace_events = []
+        lanes = {}
+        tids = {}
+        for name, category, start, duration, line in sorted(self._events, key=lambda event: event[2]):
+            category_lanes = lanes.setdefault(category, [])
+            for lane, lane_end in enumerate(category_lanes):
+                if lane_end <= start:
+                    break
+            else:
+                lane = len(category_lanes)
+                category_lanes.append(0.0)
+            category_lanes[lane] = start + duration
+            if (category, lane) not in tids:
+                tids[(category, lane)] = len(tids) + 1
+                trace_events.append({
+                    "name": "thread_name", "ph": "M", "pid": 1, "tid": tids[(category, lane)],
+                    "args": {"name": f"{category} #{lane + 1}"}
+                })
+            trace_events.append({
+                "name": name,
+                "cat": category,
+                "ph": "X",
+                "ts": start * 1e6,
+                "dur": duration * 1e6,
+                "pid": 1,
+                "tid": tids[(category, lane)],
+                "args": json.loads(line)["args"]
+            })
+        with open(self.chrome_path, "w", encoding="utf-8") as f:
+            json.dump({"traceEvents": trace_events, "displayTimeUnit": "ms"}, f, ensure_ascii=False)
+
+    def close(self):
+        with self._lock:
+            self._file.close()
+        if self.chrome_path:
+            self._write_chrome_trace()
+
+
+@contextmanager
+def span(name, category, **args):
+    """计时一段代码；with语句得到的字典可以继续补充属性，抛出的异常记录在error中（HTTP错误另记status）"""
+    if _tracer is None and not _listeners:
+        yield args
+        return
+    start = time.perf_counter()
+    try:
+        yield args
+    except Exception as e:
+        args["error"] = str(e)
+        if getattr(e, "status", None) is not None:
+            args["status"] = e.status
+        raise
+    finally:
+        duration = time.perf_counter() - start
+        if _tracer is not None:
+            _tracer.emit(name, category, start, duration, args)
+        for listener in _listeners:
+            listener(name, category, duration, args)
+
+
+def add_span_listener(listener):
+    """注册span监听器：listener(name, category, duration, args)"""
+    if listener not in _listeners:
+        _listeners.append(listener)
+
+
+def remove_span_listener(listener):
+    if listener in _listeners:
+        _listeners.remove(listener)
+
+
+def next_batch_id():
+    """分配一个模型请求批次编号"""
+    return next(_batch_ids)
+
+
+def index_items(items):
+    """记录本轮item的下标（未启用追踪时不做任何事）"""
+    if _tracer is not None:
+        _tracer.index_items(items)
+
+
+def item_index(item):
+    """返回item在本轮中的下标，未启用追踪或未记录时返回None"""
+    if _tracer is None:
+        return None
+    return _tracer.item_index(item)
+
+
+def enable_tracing(path, chrome_path=None):
+    """启用追踪，span写入path（JSONL），chrome_path不为空时结束时再导出Chrome trace"""
+    global _tracer
+    _tracer = Tracer(path, chrome_path)
+    return _tracer
+
+
+def get_tracer():
+    """返回当前启用的追踪器，未启用时返回None"""
+    return _tracer
+
+
+def shutdown_tracing():
+    """关闭追踪文件，返回关闭的追踪器（未启用时返回None）"""
+    global _tracer
+    tracer, _tracer = _tracer, None
+    if tracer is not None:
+        tracer.close()
+    return tracer
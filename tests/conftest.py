@@ -0,0 +1,5 @@
+import os
+import sys
+
+# 与run.py一致，src_code中的模块按顶层模块导入
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'src_code'))
@@ -0,0 +1,114 @@
+"""自适应批大小：AdaptiveBatcher的拆分与调整，以及ModelClient只用干净请求的HTTP往返时间调整批大小"""
+
+from LLM_APIs.batching import AdaptiveBatcher, estimate_tokens
+from LLM_APIs.client import ModelClient, EndpointUnavailable
+from LLM_APIs.retry import RetryPolicy
+
+
+def make_client(post, url="http://127.0.0.1:1", size=2):
+    """创建一个不发网络请求、带自适应批大小的客户端：_post由测试提供，重试不等待"""
+    client = ModelClient("test", url)
+    client.retry_policy = RetryPolicy(max_attempts=3, backoff_base=0, jitter=False)
+    client.batcher = AdaptiveBatcher("test", initial_size=size)
+    client._post = post
+    return client
+
+
+def test_estimate_tokens():
+    assert estimate_tokens("abcdefgh") == 3
+    assert estimate_tokens("中文") == 3
+
+
+def test_split_by_size():
+    batcher = AdaptiveBatcher("test", initial_size=2)
+    assert batcher.split(["a", "b", "c", "d", "e"]) == [["a", "b"], ["c", "d"], ["e"]]
+
+
+def test_split_by_tokens():
+    batcher = AdaptiveBatcher("test", initial_size=8, max_batch_tokens=10)
+    long_prompt = "x" * 36
+    assert estimate_tokens(long_prompt) == 10
+    assert batcher.split(["a", long_prompt, "b", "c"]) == [["a"], [long_prompt], ["b", "c"]]
+
+
+def test_split_keeps_oversized_prompt_alone():
+    batcher = AdaptiveBatcher("test", initial_size=8, max_batch_tokens=4)
+    huge_prompt = "x" * 100
+    assert batcher.split([huge_prompt, "a"]) == [[huge_prompt], ["a"]]
+
+
+def test_initial_size_is_clamped():
+    assert AdaptiveBatcher("test", initial_size=500, max_size=256).size == 256
+    assert AdaptiveBatcher("test", initial_size=0, min_size=1).size == 1
+
+
+def test_record_grows_while_throughput_holds():
+    batcher = AdaptiveBatcher("test", initial_size=4)
+    batcher.record(4, 1.0)
+    assert batcher.size == 5
+    batcher.record(5, 1.0)
+    assert batcher.size == 6
+
+
+def test_record_shrinks_when_throughput_drops():
+    batcher = AdaptiveBatcher("test", initial_size=4)
+    batcher.record(4, 1.0)
+    batcher.record(5, 5.0)
+    assert batcher.size == 4
+
+
+def test_record_ignores_partial_batches():
+    batcher = AdaptiveBatcher("test", initial_size=4)
+    batcher.record(2, 1.0)
+    assert batcher.size == 4
+
+
+def test_slow_request_halves_size():
+    batcher = AdaptiveBatcher("test", initial_size=8, target_latency=10)
+    batcher.record(8, 11)
+    assert batcher.size == 4
+
+
+def test_record_failure_halves_down_to_min_size():
+    batcher = AdaptiveBatcher("test", initial_size=4, min_size=1)
+    batcher.record_failure()
+    assert batcher.size == 2
+    batcher.record_failure()
+    batcher.record_failure()
+    assert batcher.size == 1
+
+
+def test_client_records_clean_round_trip():
+    client = make_client(lambda url, payload, count: [prompt.upper() for prompt in payload["prompt"]])
+    assert client.generate(["a", "b"]) == ["A", "B"]
+    assert client.batcher.size == 3
+
+
+def test_client_does_not_record_retried_batch():
+    calls = []
+
+    def post(url, payload, count):
+        calls.append(payload["prompt"])
+        if len(calls) == 1:
+            return ["A", None]
+        return [prompt.upper() for prompt in payload["prompt"]]
+
+    client = make_client(post)
+    assert client.generate(["a", "b"]) == ["A", "B"]
+    # 只有失败时的减半，重试成功的请求不参与调整
+    assert client.batcher.size == 1
+
+
+def test_client_does_not_record_failed_over_request():
+    calls = []
+
+    def post(url, payload, count):
+        calls.append(url)
+        if len(calls) == 1:
+            raise EndpointUnavailable("down")
+        return [prompt.upper() for prompt in payload["prompt"]]
+
+    client = make_client(post, url="http://127.0.0.1:1,http://127.0.0.1:2")
+    assert client.generate(["a", "b"]) == ["A", "B"]
+    assert len(set(calls)) == 2
+    assert client.batcher.size == 2
@@ -0,0 +1,106 @@
+"""磁盘响应缓存：读写、命中统计、按大小淘汰和缓存键"""
+
+import json
+
+import pytest
+
+from LLM_APIs import response_cache
+from LLM_APIs.client import DEFAULT_DECODING_PARAMS
+from LLM_APIs.response_cache import ResponseCache, cached_generate, enable_response_cache
+from LLM_APIs.retry import PartialBatchError, RetryableError
+
+
+def entry_size(prompt, text):
+    return len(json.dumps({"prompt": prompt, "text": text}, ensure_ascii=False).encode("utf-8"))
+
+
+def test_get_put_round_trip(tmp_path):
+    cache = ResponseCache(str(tmp_path), 1024 * 1024)
+    assert cache.get("qwen", "hello") is None
+    cache.put("qwen", "hello", "world")
+    assert cache.get("qwen", "hello") == "world"
+    # 重新打开后仍能读到
+    assert ResponseCache(str(tmp_path), 1024 * 1024).get("qwen", "hello") == "world"
+
+
+def test_hit_and_miss_counters(tmp_path):
+    cache = ResponseCache(str(tmp_path), 1024 * 1024)
+    cache.get("qwen", "a")
+    cache.put("qwen", "a", "A")
+    cache.get("qwen", "a")
+    cache.get("qwen", "a")
+    stats = cache.stats()
+    assert (stats["hits"], stats["misses"]) == (2, 1)
+    assert stats["hit_rate"] == pytest.approx(2 / 3)
+    assert stats["size_bytes"] == entry_size("a", "A")
+
+
+def test_overwrite_does_not_double_count_size(tmp_path):
+    cache = ResponseCache(str(tmp_path), 1024 * 1024)
+    cache.put("qwen", "a", "A")
+    cache.put("qwen", "a", "A")
+    assert cache.stats()["size_bytes"] == entry_size("a", "A")
+
+
+def test_eviction_removes_least_recently_used(tmp_path):
+    size = entry_size("p0", "x" * 100)
+    cache = ResponseCache(str(tmp_path), size * 3)
+    for index in range(3):
+        cache.put("qwen", f"p{index}", "x" * 100)
+    # 访问p0后，最久未访问的是p1
+    assert cache.get("qwen", "p0") is not None
+    cache.put("qwen", "p3", "x" * 100)
+
+    stats = cache.stats()
+    assert stats["evictions"] == 2
+    assert stats["size_bytes"] <= size * 3 * 0.9
+    assert cache.get("qwen", "p1") is None
+    assert cache.get("qwen", "p2") is None
+    assert cache.get("qwen", "p0") is not None
+    assert cache.get("qwen", "p3") is not None
+
+
+def test_size_is_restored_on_startup(tmp_path):
+    cache = ResponseCache(str(tmp_path), 1024 * 1024)
+    cache.put("qwen", "a", "A")
+    cache.put("qwen", "b", "B")
+    reopened = ResponseCache(str(tmp_path), 1024 * 1024)
+    assert reopened.stats()["size_bytes"] == cache.stats()["size_bytes"]
+
+
+def test_key_depends_on_model_prompt_and_decoding_params(monkeypatch):
+    key = ResponseCache.make_key("qwen", "hello")
+    assert ResponseCache.make_key("qwen", "hello") == key
+    assert ResponseCache.make_key("qwen", "hello!") != key
+    assert ResponseCache.make_key("qwen_coder", "hello") != key
+    monkeypatch.setitem(DEFAULT_DECODING_PARAMS, "temperature", 0.7)
+    assert ResponseCache.make_key("qwen", "hello") != key
+
+
+@pytest.fixture
+def enabled_cache(tmp_path, monkeypatch):
+    monkeypatch.setattr(response_cache, "_cache", None)
+    return enable_response_cache(str(tmp_path))
+
+
+def test_cached_generate_sends_only_misses(enabled_cache):
+    calls = []
+
+    def generate(prompts):
+        calls.append(list(prompts))
+        return [prompt.upper() for prompt in prompts]
+
+    assert cached_generate("qwen", ["a", "b"], generate) == ["A", "B"]
+    assert cached_generate("qwen", ["a", "c"], generate) == ["A", "C"]
+    assert calls == [["a", "b"], ["c"]]
+
+
+def test_cached_generate_caches_salvaged_results(enabled_cache):
+    def generate(prompts):
+        raise PartialBatchError(["A", None], RetryableError("boom"))
+
+    with pytest.raises(PartialBatchError) as info:
+        cached_generate("qwen", ["a", "b"], generate)
+    assert info.value.texts == ["A", None]
+    assert enabled_cache.get("qwen", "a") == "A"
+    assert enabled_cache.get("qwen", "b") is None
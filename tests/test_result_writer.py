@@ -0,0 +1,138 @@
+"""增量结果文件：ResultWriter写入与续跑，load_round / load_item 按各轮增量重建结果"""
+
+import json
+import os
+
+import pytest
+
+from dataset import item_key
+from result_writer import ResultWriter, load_round, load_item, load_results, manifest_path
+
+
+def make_items(count, round_num=1):
+    return [{"item_id": f"data.json#{index}@{index:016x}", "question": f"q{index}", "round": round_num}
+            for index in range(count)]
+
+
+def positions_of(items):
+    return {item_key(item): index for index, item in enumerate(items)}
+
+
+def write_round(output_dir, round_num, positions, round_items, streamed=()):
+    writer = ResultWriter(str(output_dir), round_num, positions, round_items)
+    writer.write(list(streamed))
+    return writer.finish()
+
+
+def test_round_is_rebuilt_from_deltas(tmp_path):
+    items = make_items(3)
+    positions = positions_of(items)
+    write_round(tmp_path, 1, positions, items)
+    # 第2轮只重新评估了第1个item
+    retried = dict(items[1], round=2)
+    manifest = write_round(tmp_path, 2, positions, [retried])
+
+    assert manifest["items"] == 3
+    assert manifest["changed"] == 1
+    assert [item["round"] for item in load_round(str(tmp_path), 2)] == [1, 2, 1]
+    assert [item["round"] for item in load_round(str(tmp_path), 1)] == [1, 1, 1]
+    assert load_item(str(tmp_path), 2, 1)["round"] == 2
+    assert load_item(str(tmp_path), 2, 0)["round"] == 1
+    assert load_item(str(tmp_path), 1, 1)["round"] == 1
+    assert load_results(os.path.join(str(tmp_path), "round_2.jsonl")) == load_round(str(tmp_path), 2)
+
+
+def test_item_reevaluated_in_a_later_round_keeps_latest_record(tmp_path):
+    items = make_items(2)
+    positions = positions_of(items)
+    write_round(tmp_path, 1, positions, items)
+    write_round(tmp_path, 2, positions, [dict(items[0], round=2)])
+    write_round(tmp_path, 3, positions, [])
+    write_round(tmp_path, 4, positions, [dict(items[0], round=4)])
+
+    assert [item["round"] for item in load_round(str(tmp_path), 3)] == [2, 1]
+    assert [item["round"] for item in load_round(str(tmp_path), 4)] == [4, 1]
+
+
+def test_streamed_items_are_not_written_twice(tmp_path):
+    items = make_items(3)
+    manifest = write_round(tmp_path, 1, positions_of(items), items, streamed=items[:2])
+    assert manifest["streamed"] == 2
+    assert manifest["records"] == 3
+    with open(os.path.join(str(tmp_path), "round_1.jsonl"), encoding="utf-8") as f:
+        assert [json.loads(line)["index"] for line in f] == [0, 1, 2]
+
+
+def test_restreamed_item_uses_last_record(tmp_path):
+    items = make_items(2)
+    writer = ResultWriter(str(tmp_path), 1, positions_of(items), items)
+    writer.write([items[0]])
+    items[0]["round"] = 5
+    writer.write([items[0]])
+    manifest = writer.finish()
+    assert manifest["records"] == 3
+    assert load_item(str(tmp_path), 1, 0)["round"] == 5
+
+
+def test_missing_manifest_raises(tmp_path):
+    items = make_items(2)
+    positions = positions_of(items)
+    write_round(tmp_path, 1, positions, items)
+    writer = ResultWriter(str(tmp_path), 2, positions, items)
+    writer.write(items[:1])
+
+    with pytest.raises(ValueError, match="no manifest"):
+        load_round(str(tmp_path), 2)
+    with pytest.raises(ValueError, match="no manifest"):
+        load_item(str(tmp_path), 2, 0)
+
+
+def test_missing_earlier_manifest_raises(tmp_path):
+    items = make_items(2)
+    positions = positions_of(items)
+    write_round(tmp_path, 1, positions, items)
+    write_round(tmp_path, 2, positions, [items[0]])
+    os.remove(manifest_path(str(tmp_path), 1))
+
+    assert load_item(str(tmp_path), 2, 0) == items[0]
+    with pytest.raises(ValueError):
+        load_round(str(tmp_path), 2)
+
+
+def test_resume_restores_written_items_and_drops_partial_line(tmp_path):
+    items = make_items(3)
+    positions = positions_of(items)
+    writer = ResultWriter(str(tmp_path), 1, positions, items)
+    writer.write([dict(items[0], evaluated=True)])
+    writer._file.close()
+    path = os.path.join(str(tmp_path), "round_1.jsonl")
+    with open(path, "a", encoding="utf-8") as f:
+        f.write('{"index": 1, "item": {"item_id"')
+    complete_size = os.path.getsize(path) - len('{"index": 1, "item": {"item_id"')
+
+    fresh = make_items(3)
+    writer = ResultWriter(str(tmp_path), 1, positions, fresh, resume=True)
+    assert os.path.getsize(path) == complete_size
+    pending = writer.restore()
+    assert pending == fresh[1:]
+    assert fresh[0]["evaluated"] is True
+
+    for item in pending:
+        item["evaluated"] = True
+    writer.write(pending)
+    manifest = writer.finish()
+    assert manifest["records"] == 3
+    assert all(item["evaluated"] for item in load_round(str(tmp_path), 1))
+
+
+def test_resume_ignores_record_of_a_different_item(tmp_path):
+    items = make_items(2)
+    writer = ResultWriter(str(tmp_path), 1, positions_of(items), items)
+    writer.write(items[:1])
+    writer._file.close()
+
+    # 数据集变化后同一下标对应另一个item，旧记录不能恢复到新item上
+    changed = [dict(items[0], item_id="data.json#0@ffffffffffffffff"), items[1]]
+    writer = ResultWriter(str(tmp_path), 1, positions_of(changed), changed, resume=True)
+    assert writer.restore() == changed
+    writer.finish()
@@ -0,0 +1,122 @@
+"""重试与部分批次结果保留：PartialBatchError / salvaged_texts 以及ModelClient只重发失败的prompt"""
+
+import pytest
+import requests
+
+from LLM_APIs.batching import AdaptiveBatcher
+from LLM_APIs.client import ModelClient
+from LLM_APIs.retry import RetryableError, PartialBatchError, RetryPolicy, salvaged_texts
+
+
+def make_client(post, max_attempts=3):
+    """创建一个不发网络请求的客户端：_post由测试提供，重试不等待"""
+    client = ModelClient("test", "http://127.0.0.1:1")
+    client.retry_policy = RetryPolicy(max_attempts=max_attempts, backoff_base=0, jitter=False)
+    client._post = post
+    return client
+
+
+class FakeServer:
+    """按prompt返回结果的假服务：failing中的prompt返回None，calls记录每次请求的prompt"""
+
+    def __init__(self, failing=(), fail_times=None):
+        self.failing = set(failing)
+        self.fail_times = fail_times
+        self.calls = []
+
+    def __call__(self, url, payload, count):
+        prompts = payload["prompt"]
+        prompts = [prompts] if isinstance(prompts, str) else prompts
+        self.calls.append(list(prompts))
+        failing = self.failing if self.fail_times is None or len(self.calls) <= self.fail_times else set()
+        return [None if prompt in failing else prompt.upper() for prompt in prompts]
+
+
+def test_partial_batch_error_message_counts_failures():
+    error = PartialBatchError(["a", None, None], RetryableError("boom"))
+    assert str(error) == "2 of 3 prompts failed: boom"
+
+
+def test_salvaged_texts():
+    error = PartialBatchError(["a", None], RetryableError("boom"))
+    assert salvaged_texts(error, 2) == ["a", None]
+    assert salvaged_texts(ValueError("boom"), 3) == [None, None, None]
+
+
+def test_retry_resends_only_failed_prompts():
+    server = FakeServer(failing={"b"}, fail_times=1)
+    client = make_client(server)
+    assert client.generate(["a", "b", "c"]) == ["A", "B", "C"]
+    assert server.calls == [["a", "b", "c"], ["b"]]
+
+
+def test_partial_results_survive_exhausted_retries():
+    server = FakeServer(failing={"b"})
+    client = make_client(server, max_attempts=3)
+    with pytest.raises(PartialBatchError) as info:
+        client.generate(["a", "b", "c"])
+    assert info.value.texts == ["A", None, "C"]
+    assert salvaged_texts(info.value, 3) == ["A", None, "C"]
+    assert server.calls == [["a", "b", "c"], ["b"], ["b"]]
+
+
+def test_all_prompts_failing_raises_last_error():
+    server = FakeServer(failing={"a", "b"})
+    client = make_client(server, max_attempts=2)
+    with pytest.raises(RetryableError) as info:
+        client.generate(["a", "b"])
+    assert not isinstance(info.value, PartialBatchError)
+    assert salvaged_texts(info.value, 2) == [None, None]
+    assert len(server.calls) == 2
+
+
+def test_non_retryable_error_is_not_retried():
+    calls = []
+
+    def post(url, payload, count):
+        calls.append(payload["prompt"])
+        raise RetryableError("bad request", 400)
+
+    client = make_client(post)
+    with pytest.raises(RetryableError):
+        client.generate(["a"])
+    assert len(calls) == 1
+
+
+def test_duplicate_prompts_share_salvaged_results():
+    server = FakeServer(failing={"b"})
+    client = make_client(server, max_attempts=1)
+    with pytest.raises(PartialBatchError) as info:
+        client.generate(["a", "b", "a"])
+    assert info.value.texts == ["A", None, "A"]
+    assert server.calls == [["a", "b"]]
+    assert client.deduplicated == 1
+
+
+def test_split_batches_keep_results_of_successful_batches():
+    server = FakeServer(failing={"c", "d"})
+    client = make_client(server, max_attempts=1)
+    client.batcher = AdaptiveBatcher("test", initial_size=2)
+    with pytest.raises(PartialBatchError) as info:
+        client.generate(["a", "b", "c", "d"])
+    assert info.value.texts == ["A", "B", None, None]
+    assert server.calls == [["a", "b"], ["c", "d"]]
+
+
+class MalformedResponse:
+    """HTTP 200但响应体不是合法JSON的响应"""
+    status_code = 200
+    text = "<html>not json</html>"
+
+    def json(self):
+        raise requests.exceptions.JSONDecodeError("Expecting value", self.text, 0)
+
+
+def test_malformed_json_is_retried_without_failing_over():
+    client = ModelClient("test", "http://127.0.0.1:1,http://127.0.0.1:2")
+    client.retry_policy = RetryPolicy(max_attempts=2, backoff_base=0, jitter=False)
+    client.session.post = lambda url, json, timeout: MalformedResponse()
+    with pytest.raises(RetryableError, match="JSON parsing error"):
+        client.generate(["a"])
+    assert all(endpoint.failures == 0 for endpoint in client.endpoints.endpoints)
+    assert sum(endpoint.requests for endpoint in client.endpoints.endpoints) == 2